@@ -10,12 +10,15 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_socketio import SocketIO
 from app.config.settings import config
+from app.bus import MessageBus
+from app.replicas import RoutingSession
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 bcrypt = Bcrypt()
 jwt = JWTManager()
 socketio = SocketIO()
+bus = MessageBus()
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=["100 per 15 minutes"]
@@ -36,6 +39,10 @@ def create_app(config_name='default'):
     static_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'static'))
     app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
     
+    # Faster JSON encoding for API responses
+    from app.utils.json_provider import FastJSONProvider
+    app.json = FastJSONProvider(app)
+    
     # Load configuration
     app.config.from_object(config[config_name])
     
@@ -52,18 +59,45 @@ def create_app(config_name='default'):
     jwt.init_app(app)
     CORS(app, origins=app.config['CORS_ORIGINS'])
     limiter.init_app(app)
-    socketio.init_app(app, cors_allowed_origins=app.config['CORS_ORIGINS'])
+    bus.init_app(app)
+    socketio.init_app(
+        app,
+        cors_allowed_origins=app.config['CORS_ORIGINS'],
+        client_manager=bus.socketio_manager(),
+        async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+        ping_interval=app.config['SOCKETIO_PING_INTERVAL'],
+        ping_timeout=app.config['SOCKETIO_PING_TIMEOUT'],
+        transports=app.config['SOCKETIO_TRANSPORTS'],
+        max_http_buffer_size=app.config['SOCKETIO_MAX_HTTP_BUFFER_SIZE']
+    )
+    
+    # Send read-only endpoints to the read replicas, if any
+    from app.replicas import replicas
+    replicas.init_app(app)
+    
+    # Bound every socket's outbound queue
+    from app.websocket.backpressure import outbound
+    outbound.init_app(app, socketio.server)
     
     # Register blueprints
     from app.routes.auth_routes import auth_bp
     from app.routes.message_routes import message_bp
     from app.routes.room_routes import room_bp
+    from app.routes.stats_routes import stats_bp
+    from app.routes.conversation_routes import conversation_bp
+    from app.routes.sync_routes import sync_bp
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(message_bp, url_prefix='/api/messages')
     app.register_blueprint(room_bp, url_prefix='/api/rooms')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
+    app.register_blueprint(conversation_bp, url_prefix='/api/conversations')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
     
     # Register WebSocket handlers
     from app.websocket import handlers
+    handlers.socket_limiter.init_app(app)
+    from app.websocket.pipeline import pipeline
+    pipeline.init_app(app)
     
     # Root route - redirect to login page
     @app.route('/')
@@ -87,6 +121,8 @@ def create_app(config_name='default'):
                 'me': 'GET /api/auth/me (Protected)',
                 'updateProfile': 'PUT /api/auth/profile (Protected)',
                 'chatHistory': 'GET /api/messages/history/:userId (Protected)',
+                'searchMessages': 'GET /api/messages/search?q= (Protected)',
+                'exportChatHistory': 'GET /api/messages/export/:userId (Protected, NDJSON stream)',
                 'editMessage': 'PUT /api/messages/:messageId (Protected)',
                 'deleteMessage': 'DELETE /api/messages/:messageId (Protected)',
                 'createRoom': 'POST /api/rooms (Protected)',
@@ -94,7 +130,16 @@ def create_app(config_name='default'):
                 'getRoom': 'GET /api/rooms/:roomId (Protected)',
                 'addRoomMember': 'POST /api/rooms/:roomId/members (Protected)',
                 'removeRoomMember': 'DELETE /api/rooms/:roomId/members/:userId (Protected)',
-                'getRoomMessages': 'GET /api/rooms/:roomId/messages (Protected)'
+                'setRoomRetention': 'PUT /api/rooms/:roomId/retention (Protected)',
+                'getRoomMessages': 'GET /api/rooms/:roomId/messages (Protected)',
+                'searchRoomMessages': 'GET /api/rooms/:roomId/messages/search?q= (Protected)',
+                'exportRoomMessages': 'GET /api/rooms/:roomId/export (Protected, NDJSON stream)',
+                'getConversations': 'GET /api/conversations (Protected)',
+                'markConversationRead': 'POST /api/conversations/:userId/read (Protected)',
+                'sync': 'GET /api/sync?since= (Protected)',
+                'socketStats': 'GET /api/stats/sockets (Protected)',
+                'historyCacheStats': 'GET /api/stats/history-cache (Protected)',
+                'retentionStats': 'GET /api/stats/retention (Protected)'
             },
             'websocket': {
                 'connect': 'WebSocket connection with JWT auth',
@@ -102,12 +147,17 @@ def create_app(config_name='default'):
                     'send_message': 'Send a message to another user',
                     'receive_message': 'Receive messages from other users',
                     'send_room_message': 'Send a message to a room',
+                    'send_messages_batch': 'Send a batch of direct and room messages',
+                    'messages_batch_sent': 'Per-item results for a message batch',
                     'receive_room_message': 'Receive room messages',
                     'edit_message': 'Edit a message',
                     'message_edited': 'Message edit notification',
                     'delete_message': 'Delete a message',
                     'message_deleted': 'Message delete notification',
                     'connected': 'Connection acknowledgment',
+                    'catch_up': 'Messages, edits and deletes missed since the last seen message id',
+                    'resync_required': 'Delivery paused because the client fell too far behind',
+                    'resync': 'Resume delivery and receive a catch_up from the last seen message id',
                     'message_sent': 'Message delivery confirmation'
                 }
             }
@@ -126,5 +176,29 @@ def create_app(config_name='default'):
     # Create tables
     with app.app_context():
         db.create_all()
+        
+        # Bring databases created by older versions up to the current schema
+        from app import migrations
+        migrations.run()
+        
+        # Seed the reconnect catch-up buffer from the newest stored message
+        from app.websocket.catch_up import recent_events
+        recent_events.init_app(app)
+        
+        # Keep recent history pages in memory, following the same events
+        from app.utils.history_cache import history_cache
+        history_cache.init_app(app, recent_events)
+        
+        # Build the user search index from the users table
+        from app.utils.username_index import username_index
+        username_index.init_app(app)
+        
+        # Public profiles for include=users expansions
+        from app.utils.profiles import profile_cache
+        profile_cache.init_app(app)
+        
+        # Scrub deleted content and remove expired messages in the background
+        from app.retention import retention
+        retention.init_app(app)
     
     return app
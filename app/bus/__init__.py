@@ -0,0 +1,102 @@
+"""
+Pluggable pub/sub message bus shared by Socket.IO and the presence registry
+
+Backends are selected with the MESSAGE_BUS_URL setting:
+- memory://                    in-process (single server process)
+- redis://[:password@]host:port/db   any Redis-protocol server
+"""
+import pickle
+from socketio import PubSubManager
+from app.bus.memory import InProcessBackend
+from app.bus.resp import RespBackend
+
+
+def create_backend(url, key_prefix='ychat'):
+    """Instantiate a bus backend from its URL"""
+    scheme = url.split('://', 1)[0] if '://' in url else url
+    if scheme == 'memory':
+        return InProcessBackend()
+    if scheme in ('redis', 'resp'):
+        return RespBackend(url, key_prefix=key_prefix)
+    raise ValueError(f'Unsupported message bus URL: {url}')
+
+
+class BusClientManager(PubSubManager):
+    """Socket.IO client manager that relays events through the message bus"""
+
+    name = 'ychat-bus'
+
+    def __init__(self, backend, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.backend = backend
+
+    def _publish(self, data):
+        return self.backend.publish(self.channel, pickle.dumps(data))
+
+    def _listen(self):
+        for message in self.backend.subscribe(self.channel):
+            yield message
+
+    def _handle_emit(self, message):
+        # Message events are encoded once per process, in JSON or compact form
+        from app.websocket.broadcast import relay_encoded
+        if not relay_encoded(self, message):
+            super()._handle_emit(message)
+
+
+class MessageBus:
+    """Flask extension exposing the configured message bus backend"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.channel_prefix = 'ychat'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Create the backend configured for the application"""
+        if self.backend is not None:
+            self.backend.close()
+        self.channel_prefix = app.config.get('MESSAGE_BUS_CHANNEL', 'ychat')
+        self.backend = create_backend(
+            app.config.get('MESSAGE_BUS_URL', 'memory://'),
+            key_prefix=self.channel_prefix
+        )
+        app.extensions['message_bus'] = self
+
+    @property
+    def shared(self):
+        """Whether the backend is shared with other server processes"""
+        return self.backend is not None and self.backend.shared
+
+    def channel(self, name):
+        """Return the namespaced name of a bus channel"""
+        return f'{self.channel_prefix}:{name}'
+
+    def socketio_manager(self):
+        """
+        Return a Socket.IO client manager for cross-process delivery
+        None when the backend is process-local, so Socket.IO keeps its
+        default in-memory manager.
+        """
+        if not self.shared:
+            return None
+        return BusClientManager(self.backend, channel=self.channel('socketio'))
+
+    def publish(self, channel, data):
+        return self.backend.publish(self.channel(channel), data)
+
+    def subscribe(self, channel):
+        return self.backend.subscribe(self.channel(channel))
+
+    def presence_incr(self, user_id):
+        return self.backend.presence_incr(user_id)
+
+    def presence_decr(self, user_id):
+        return self.backend.presence_decr(user_id)
+
+    def presence_count(self, user_id):
+        return self.backend.presence_count(user_id)
+
+
+__all__ = ["MessageBus", "BusClientManager", "InProcessBackend", "RespBackend", "create_backend"]
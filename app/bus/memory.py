@@ -0,0 +1,65 @@
+"""
+In-process message bus backend
+"""
+import queue
+import threading
+
+
+class InProcessBackend:
+    """
+    Pub/sub and presence backend living in the current process
+    Suitable for a single server process; every subscriber gets its own queue.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._presence = {}
+
+    def publish(self, channel, data):
+        """Deliver data to every subscriber of a channel"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.put(data)
+        return len(subscribers)
+
+    def subscribe(self, channel):
+        """Yield messages published on a channel, blocking between messages"""
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(subscriber)
+        try:
+            while True:
+                yield subscriber.get()
+        finally:
+            with self._lock:
+                self._subscribers[channel].remove(subscriber)
+
+    def presence_incr(self, user_id):
+        """Count one more open socket for a user"""
+        with self._lock:
+            count = self._presence.get(user_id, 0) + 1
+            self._presence[user_id] = count
+        return count
+
+    def presence_decr(self, user_id):
+        """Count one less open socket for a user"""
+        with self._lock:
+            count = self._presence.get(user_id, 0) - 1
+            if count > 0:
+                self._presence[user_id] = count
+            else:
+                self._presence.pop(user_id, None)
+        return max(count, 0)
+
+    def presence_count(self, user_id):
+        """Return the number of open sockets for a user"""
+        return self._presence.get(user_id, 0)
+
+    def close(self):
+        """Release backend resources"""
+        with self._lock:
+            self._subscribers.clear()
@@ -0,0 +1,168 @@
+"""
+Redis-protocol (RESP) message bus backend
+
+Speaks RESP2 directly over a TCP socket, so it works against Redis, Valkey,
+KeyDB or any local stand-in server implementing PUBLISH, SUBSCRIBE, HINCRBY,
+HGET and HDEL, without requiring a client library.
+"""
+import logging
+import socket
+import threading
+import time
+from urllib.parse import urlparse, unquote
+
+logger = logging.getLogger(__name__)
+
+
+class RespError(Exception):
+    """Error reply returned by the server"""
+
+
+class RespConnection:
+    """A single blocking RESP2 connection"""
+
+    def __init__(self, host, port, db=0, password=None, timeout=None):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile('rb')
+        if password:
+            self.execute('AUTH', password)
+        if db:
+            self.execute('SELECT', db)
+
+    @staticmethod
+    def encode(args):
+        """Encode a command as a RESP array of bulk strings"""
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                value = arg
+            else:
+                value = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(value), value))
+        return b''.join(parts)
+
+    def send(self, *args):
+        """Write a command without reading its reply"""
+        self._sock.sendall(self.encode(args))
+
+    def read_reply(self):
+        """Read and decode one reply from the server"""
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode('utf-8')
+        if prefix == b'-':
+            raise RespError(payload.decode('utf-8'))
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if prefix == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise RespError(f'Unknown reply type: {prefix!r}')
+
+    def execute(self, *args):
+        """Send a command and return its reply"""
+        self.send(*args)
+        return self.read_reply()
+
+    def close(self):
+        try:
+            self._reader.close()
+        finally:
+            self._sock.close()
+
+
+class RespBackend:
+    """
+    Pub/sub and presence backend shared between processes through a
+    Redis-protocol server
+    """
+
+    shared = True
+
+    def __init__(self, url, key_prefix='ychat'):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.presence_key = f'{key_prefix}:presence'
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        return RespConnection(self.host, self.port, db=self.db, password=self.password)
+
+    def _execute(self, *args):
+        """Run a command on the shared connection, reconnecting once on failure"""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._conn is None:
+                        self._conn = self._connect()
+                    return self._conn.execute(*args)
+                except (ConnectionError, OSError):
+                    if self._conn is not None:
+                        self._conn.close()
+                        self._conn = None
+                    if attempt == 2:
+                        raise
+
+    def publish(self, channel, data):
+        """Publish data on a channel and return the number of receivers"""
+        return self._execute('PUBLISH', channel, data)
+
+    def subscribe(self, channel):
+        """Yield messages published on a channel, reconnecting with backoff"""
+        retry_sleep = 1
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                conn.send('SUBSCRIBE', channel)
+                retry_sleep = 1
+                while True:
+                    reply = conn.read_reply()
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b'message':
+                        yield reply[2]
+            except (ConnectionError, OSError, RespError) as e:
+                logger.error(f"Message bus subscription lost: {type(e).__name__}, retrying in {retry_sleep}s")
+                time.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def presence_incr(self, user_id):
+        """Count one more open socket for a user"""
+        return self._execute('HINCRBY', self.presence_key, user_id, 1)
+
+    def presence_decr(self, user_id):
+        """Count one less open socket for a user"""
+        count = self._execute('HINCRBY', self.presence_key, user_id, -1)
+        if count <= 0:
+            self._execute('HDEL', self.presence_key, user_id)
+        return max(count, 0)
+
+    def presence_count(self, user_id):
+        """Return the number of open sockets for a user across all processes"""
+        value = self._execute('HGET', self.presence_key, user_id)
+        return int(value) if value else 0
+
+    def close(self):
+        """Release backend resources"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
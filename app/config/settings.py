@@ -15,6 +15,12 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///ychat20.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Read replicas (comma-separated database URLs): read-only endpoints query
+    # one of them, except for users who wrote in the last REPLICA_STICKY_SECONDS
+    DATABASE_READ_URLS = [url.strip() for url in os.getenv('DATABASE_READ_URLS', '').split(',') if url.strip()]
+    SQLALCHEMY_BINDS = {f'replica_{index}': url for index, url in enumerate(DATABASE_READ_URLS)}
+    REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', 5))
+    
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-this-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 604800)))  # 7 days
@@ -22,6 +28,78 @@ class Config:
     # CORS
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*')
     
+    # Message bus (memory:// for a single process, redis://host:port/db to share
+    # Socket.IO delivery and presence between server processes)
+    MESSAGE_BUS_URL = os.getenv('MESSAGE_BUS_URL', 'memory://')
+    MESSAGE_BUS_CHANNEL = os.getenv('MESSAGE_BUS_CHANNEL', 'ychat')
+    
+    # Group-commit pipeline for socket messages (opt-in)
+    MESSAGE_PIPELINE_ENABLED = os.getenv('MESSAGE_PIPELINE_ENABLED', 'false').lower() == 'true'
+    MESSAGE_PIPELINE_MAX_BATCH = int(os.getenv('MESSAGE_PIPELINE_MAX_BATCH', 500))
+    MESSAGE_PIPELINE_MAX_DELAY_MS = int(os.getenv('MESSAGE_PIPELINE_MAX_DELAY_MS', 20))
+    
+    # Reconnect catch-up: recent events kept in memory and the most events
+    # pushed in one catch_up event
+    CATCH_UP_BUFFER_SIZE = int(os.getenv('CATCH_UP_BUFFER_SIZE', 5000))
+    CATCH_UP_MAX_MESSAGES = int(os.getenv('CATCH_UP_MAX_MESSAGES', 500))
+    
+    # In-memory cache of the newest serialized messages per conversation and
+    # room, evicted least-recently-used first above the memory cap
+    HISTORY_CACHE_ENABLED = os.getenv('HISTORY_CACHE_ENABLED', 'true').lower() == 'true'
+    HISTORY_CACHE_MESSAGES_PER_SCOPE = int(os.getenv('HISTORY_CACHE_MESSAGES_PER_SCOPE', 200))
+    HISTORY_CACHE_MAX_BYTES = int(os.getenv('HISTORY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    
+    # In-memory prefix and trigram index for user search, built at startup
+    USERNAME_INDEX_ENABLED = os.getenv('USERNAME_INDEX_ENABLED', 'true').lower() == 'true'
+    
+    # Public profiles (id, username) cached for include=users expansions; 0 disables
+    PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+    
+    # Retention job (enable on one server process): content of messages
+    # deleted longer ago than RETENTION_SCRUB_AFTER_HOURS is blanked, and
+    # messages older than their scope's retention are removed (0 days keeps
+    # them forever; rooms may override RETENTION_ROOM_DAYS). Rows are changed
+    # RETENTION_BATCH_SIZE per transaction with a pause after each batch.
+    RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', 'false').lower() == 'true'
+    RETENTION_DIRECT_DAYS = int(os.getenv('RETENTION_DIRECT_DAYS', 0))
+    RETENTION_ROOM_DAYS = int(os.getenv('RETENTION_ROOM_DAYS', 0))
+    RETENTION_SCRUB_AFTER_HOURS = int(os.getenv('RETENTION_SCRUB_AFTER_HOURS', 24))
+    RETENTION_INTERVAL_SECONDS = int(os.getenv('RETENTION_INTERVAL_SECONDS', 3600))
+    RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 500))
+    RETENTION_BATCH_PAUSE_MS = int(os.getenv('RETENTION_BATCH_PAUSE_MS', 50))
+    
+    # Maximum number of messages accepted by one send_messages_batch event
+    MESSAGE_BATCH_MAX_SIZE = int(os.getenv('MESSAGE_BATCH_MAX_SIZE', 500))
+    
+    # Outbound budget per socket; a client with more undelivered frames or
+    # bytes than this is a slow consumer and is either asked to resync
+    # ('resync') or dropped ('disconnect')
+    SOCKET_OUTBOUND_MAX_MESSAGES = int(os.getenv('SOCKET_OUTBOUND_MAX_MESSAGES', 256))
+    SOCKET_OUTBOUND_MAX_BYTES = int(os.getenv('SOCKET_OUTBOUND_MAX_BYTES', 1024 * 1024))
+    SOCKET_SLOW_CONSUMER_POLICY = os.getenv('SOCKET_SLOW_CONSUMER_POLICY', 'resync')
+    
+    # Token-bucket limits per user for socket events, in Flask-Limiter
+    # notation; the amount is also the burst size. A batch costs one token
+    # per message.
+    SOCKET_RATE_LIMIT_ENABLED = os.getenv('SOCKET_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    SOCKET_RATE_LIMITS = {
+        'send_message': os.getenv('SOCKET_RATE_LIMIT_SEND_MESSAGE', '30 per 10 seconds'),
+        'send_room_message': os.getenv('SOCKET_RATE_LIMIT_SEND_ROOM_MESSAGE', '30 per 10 seconds'),
+        'send_messages_batch': os.getenv('SOCKET_RATE_LIMIT_SEND_MESSAGES_BATCH', '1000 per minute'),
+        'edit_message': os.getenv('SOCKET_RATE_LIMIT_EDIT_MESSAGE', '30 per minute'),
+        'delete_message': os.getenv('SOCKET_RATE_LIMIT_DELETE_MESSAGE', '30 per minute')
+    }
+    
+    # Socket.IO server mode ('threading', 'eventlet' or 'gevent'; the latter
+    # two need a monkey-patched process, see start_server.py) and Engine.IO
+    # tuning. The buffer size caps one incoming packet and must fit a full
+    # send_messages_batch.
+    SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+    SOCKETIO_PING_INTERVAL = int(os.getenv('SOCKETIO_PING_INTERVAL', 25))
+    SOCKETIO_PING_TIMEOUT = int(os.getenv('SOCKETIO_PING_TIMEOUT', 20))
+    SOCKETIO_TRANSPORTS = os.getenv('SOCKETIO_TRANSPORTS', 'polling,websocket').split(',')
+    SOCKETIO_MAX_HTTP_BUFFER_SIZE = int(os.getenv('SOCKETIO_MAX_HTTP_BUFFER_SIZE', 4 * 1024 * 1024))
+    
     # Validate production settings
     @staticmethod
     def validate_production():
@@ -39,6 +117,10 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
+    
+    # WebSocket only: no long-polling fallback, so no sticky sessions are
+    # needed behind a load balancer
+    SOCKETIO_TRANSPORTS = os.getenv('SOCKETIO_TRANSPORTS', 'websocket').split(',')
 
 
 # Configuration dictionary
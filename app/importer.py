@@ -0,0 +1,504 @@
+"""
+Bulk import of chat history from NDJSON or CSV
+
+Replaying history through the socket handlers commits once per message.
+The importer instead reads records in batches, resolves every username and
+room of a batch with a few IN queries, and stores the batch's rooms,
+memberships and messages with executemany inserts in one transaction.
+
+Records (NDJSON objects, or CSV rows with these columns):
+- message (default type): sender, receiver or room, content, timestamp,
+  optional edited_at and deleted_at
+- room: room, optional creator and description
+- member: room, user, optional joined_at
+
+Users are referenced by username and must already exist. Rooms are
+referenced by name: an existing room with that name is used, otherwise one
+is created; records naming a room longer than 100 characters are skipped.
+Senders of room messages are added to the room. Timestamps are ISO 8601 in
+UTC.
+
+Unless keep_indexes is set, the message history indexes and the full-text
+index are dropped before the load and rebuilt once at the end. Conversation
+summaries are updated for every imported conversation; imported messages
+are not counted as unread. Imported messages and memberships take change
+sequence numbers like live ones, so clients pick them up on their next
+delta sync.
+"""
+import csv
+import json
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from app import db, migrations
+from app.models.change import ChangeSequence, MembershipChange
+from app.models.message import Message
+from app.models.room import Room, RoomMember
+from app.models.user import User
+from app.models.conversation import Conversation, ConversationMember
+from app.utils import search
+from app.utils.validation import validate_message_content
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('ndjson', 'csv')
+
+# Records stored per transaction
+DEFAULT_BATCH_SIZE = 50000
+
+# Values per IN (...) lookup
+LOOKUP_CHUNK_SIZE = 500
+
+# Longer room names are rejected, as by the create room endpoint
+ROOM_NAME_MAX_LENGTH = Room.__table__.c.name.type.length
+
+MESSAGE_COLUMNS = ['sender_id', 'receiver_id', 'room_id', 'conversation_key',
+                   'content', 'timestamp', 'edited_at', 'deleted_at', 'change_seq']
+
+
+def read_records(stream, format):
+    """Yield (line number, record dict or None if unreadable) from a text stream"""
+    if format == 'csv':
+        for line_number, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_number, {key: value for key, value in row.items() if value not in ('', None)}
+        return
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp; returns None for a missing or invalid value"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        # Stored timestamps are naive UTC
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class ImportStats:
+    """Counters reported while and after importing"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = 0
+        self.messages = 0
+        self.rooms = 0
+        self.members = 0
+        self.conversations = 0
+        self.skipped = Counter()
+        self.examples = []
+
+    def skip(self, line_number, reason):
+        self.skipped[reason] += 1
+        if len(self.examples) < 10:
+            self.examples.append(f'line {line_number}: {reason}')
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        """Imported messages per second"""
+        return self.messages / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'records': self.records,
+            'messages': self.messages,
+            'rooms': self.rooms,
+            'members': self.members,
+            'conversations': self.conversations,
+            'skipped': dict(self.skipped),
+            'seconds': round(self.elapsed, 2),
+            'messagesPerSecond': round(self.rate)
+        }
+
+
+class HistoryImporter:
+    """Stores batches of history records through one database connection"""
+
+    def __init__(self, connection, batch_size=DEFAULT_BATCH_SIZE, keep_indexes=False, progress=None):
+        self.connection = connection
+        self.batch_size = max(1, batch_size)
+        self.keep_indexes = keep_indexes
+        self.progress = progress
+        self.stats = ImportStats()
+        self._users = {}
+        self._rooms = {}
+        self._members = set()
+        # Rooms and users whose ETag versions the import changes
+        self._member_rooms = set()
+        self._member_users = set()
+        self._history_rooms = set()
+        self._first_id = 0
+        if connection.dialect.name == 'sqlite':
+            # The exact text SQLAlchemy's SQLite DateTime type stores
+            self._datetime = lambda value: value.isoformat(' ', 'microseconds') if value is not None else None
+        else:
+            self._datetime = lambda value: value
+
+    def run(self, records):
+        """Import an iterable of (line number, record) and return the stats"""
+        with self.connection.begin():
+            # Messages above this id are the imported ones
+            self._first_id = self.connection.execute(db.select(db.func.max(Message.__table__.c.id))).scalar() or 0
+            if not self.keep_indexes:
+                self._drop_indexes()
+        try:
+            batch = []
+            for item in records:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch)
+                    batch = []
+            if batch:
+                self._import_batch(batch)
+        finally:
+            # Restore the indexes even if the load failed half way
+            with self.connection.begin():
+                if not self.keep_indexes:
+                    self._rebuild_indexes()
+                self._update_conversations()
+                self._touch_rooms()
+        return self.stats
+
+    def _drop_indexes(self):
+        search.drop_index(self.connection)
+        for index in Message.__table__.indexes:
+            index.drop(self.connection, checkfirst=True)
+
+    def _rebuild_indexes(self):
+        started = time.perf_counter()
+        inspector = db.inspect(self.connection)
+        migrations.create_missing_indexes(self.connection, inspector)
+        search.create_index(self.connection, inspector)
+        logger.info(f"Rebuilt message indexes in {time.perf_counter() - started:.1f} s")
+
+    def _import_batch(self, batch):
+        self.stats.records += len(batch)
+        with self.connection.begin():
+            rooms, members, messages = [], [], []
+            for line_number, record in batch:
+                if record is None:
+                    self.stats.skip(line_number, 'unreadable record')
+                    continue
+                kind = record.get('type', 'message')
+                if kind == 'message':
+                    messages.append((line_number, record))
+                elif kind == 'room':
+                    rooms.append((line_number, record))
+                elif kind == 'member':
+                    members.append((line_number, record))
+                else:
+                    self.stats.skip(line_number, f'unknown record type {kind!r}')
+
+            self._resolve_users(
+                [record.get('creator') for _, record in rooms]
+                + [record.get('user') for _, record in members]
+                + [record.get(field) for _, record in messages for field in ('sender', 'receiver')]
+            )
+            self._import_rooms(rooms, messages)
+            self._import_members(rooms, members, messages)
+            self._import_messages(messages)
+
+        if self.progress is not None:
+            self.progress(self.stats)
+
+    def _resolve_users(self, usernames):
+        users = User.__table__
+        missing = {username for username in usernames
+                   if isinstance(username, str) and username not in self._users}
+        for chunk in _chunks(missing, LOOKUP_CHUNK_SIZE):
+            found = dict(self.connection.execute(
+                db.select(users.c.username, users.c.id).where(users.c.username.in_(chunk))
+            ).all())
+            for username in chunk:
+                self._users[username] = found.get(username)
+
+    def _import_rooms(self, rooms, messages):
+        """Create the rooms named by room records and room messages that do not exist yet"""
+        declared = {}
+        for line_number, record in rooms:
+            name = record.get('room')
+            if not isinstance(name, str) or not name.strip():
+                self.stats.skip(line_number, 'room without a name')
+                continue
+            if len(name) > ROOM_NAME_MAX_LENGTH:
+                self.stats.skip(line_number, 'room name too long')
+                continue
+            declared.setdefault(name, record)
+        for _, record in messages:
+            name = record.get('room')
+            if isinstance(name, str) and len(name) <= ROOM_NAME_MAX_LENGTH and name not in declared:
+                declared[name] = {'room': name, 'creator': record.get('sender')}
+
+        table = Room.__table__
+        names = [name for name in declared if name not in self._rooms]
+        for chunk in _chunks(names, LOOKUP_CHUNK_SIZE):
+            # The oldest room with a name wins when names repeat
+            for room_id, name in self.connection.execute(
+                db.select(table.c.id, table.c.name).where(table.c.name.in_(chunk)).order_by(table.c.id.desc())
+            ).all():
+                self._rooms[name] = room_id
+
+        new_rooms = []
+        for name in names:
+            if name in self._rooms:
+                continue
+            creator_id = self._users.get(declared[name].get('creator'))
+            if creator_id is None:
+                # Left unresolved; records naming this room are skipped
+                continue
+            new_rooms.append({
+                'name': name,
+                'description': declared[name].get('description'),
+                'creator_id': creator_id,
+                'created_at': self._datetime(datetime.utcnow()),
+                'version': 0,
+                'history_version': 0
+            })
+        if not new_rooms:
+            return
+        self._insert_many(table, new_rooms)
+        created = {room['name'] for room in new_rooms}
+        for room_id, name in self.connection.execute(
+            db.select(table.c.id, table.c.name).where(table.c.name.in_(list(created))).order_by(table.c.id.desc())
+        ).all():
+            self._rooms[name] = room_id
+        self.stats.rooms += len(new_rooms)
+
+    def _import_members(self, rooms, members, messages):
+        """Add member records, room creators and senders of room messages to their rooms"""
+        wanted = {}
+        for _, record in rooms:
+            room_id = self._rooms.get(record.get('room'))
+            user_id = self._users.get(record.get('creator'))
+            if room_id is not None and user_id is not None:
+                wanted.setdefault((room_id, user_id), None)
+        for line_number, record in members:
+            room_id = self._rooms.get(record.get('room'))
+            user_id = self._users.get(record.get('user'))
+            if room_id is None or user_id is None:
+                self.stats.skip(line_number, 'unknown room or user')
+                continue
+            wanted.setdefault((room_id, user_id), parse_timestamp(record.get('joined_at')))
+        for _, record in messages:
+            room_id = self._rooms.get(record.get('room'))
+            user_id = self._users.get(record.get('sender'))
+            if room_id is not None and user_id is not None:
+                wanted.setdefault((room_id, user_id), parse_timestamp(record.get('timestamp')))
+
+        table = RoomMember.__table__
+        pairs = [pair for pair in wanted if pair not in self._members]
+        room_ids = {room_id for room_id, _ in pairs}
+        for chunk in _chunks(room_ids, LOOKUP_CHUNK_SIZE):
+            self._members.update(self.connection.execute(
+                db.select(table.c.room_id, table.c.user_id).where(table.c.room_id.in_(chunk))
+            ).all())
+
+        now = datetime.utcnow()
+        new_members = [{'room_id': room_id, 'user_id': user_id,
+                        'joined_at': self._datetime(wanted[(room_id, user_id)] or now)}
+                       for room_id, user_id in pairs if (room_id, user_id) not in self._members]
+        if new_members:
+            self._insert_many(table, new_members)
+            first = ChangeSequence.allocate(self.connection, len(new_members))
+            self._insert_many(MembershipChange.__table__, [
+                {'change_seq': first + offset, 'room_id': member['room_id'], 'user_id': member['user_id'],
+                 'kind': 'joined', 'created_at': member['joined_at']}
+                for offset, member in enumerate(new_members)
+            ])
+            self._members.update((member['room_id'], member['user_id']) for member in new_members)
+            self._member_rooms.update(member['room_id'] for member in new_members)
+            self._member_users.update(member['user_id'] for member in new_members)
+            self.stats.members += len(new_members)
+
+    def _import_messages(self, messages):
+        rows = []
+        users = self._users
+        to_datetime = self._datetime
+        for line_number, record in messages:
+            sender_id = users.get(record.get('sender'))
+            if sender_id is None:
+                self.stats.skip(line_number, 'unknown sender')
+                continue
+
+            receiver_id = room_id = conversation_key = None
+            if record.get('room') is not None:
+                room_id = self._rooms.get(record['room'])
+                if room_id is None:
+                    too_long = isinstance(record['room'], str) and len(record['room']) > ROOM_NAME_MAX_LENGTH
+                    self.stats.skip(line_number, 'room name too long' if too_long else 'unknown room')
+                    continue
+                self._history_rooms.add(room_id)
+            else:
+                receiver_id = users.get(record.get('receiver'))
+                if receiver_id is None:
+                    self.stats.skip(line_number, 'unknown receiver')
+                    continue
+                conversation_key = Message.conversation_key_for(sender_id, receiver_id)
+
+            content = record.get('content')
+            if validate_message_content(content):
+                self.stats.skip(line_number, 'invalid content')
+                continue
+            timestamp = parse_timestamp(record.get('timestamp'))
+            if timestamp is None:
+                self.stats.skip(line_number, 'invalid timestamp')
+                continue
+            edited_at = record.get('edited_at')
+            deleted_at = record.get('deleted_at')
+
+            rows.append((
+                sender_id,
+                receiver_id,
+                room_id,
+                conversation_key,
+                content.strip(),
+                to_datetime(timestamp),
+                to_datetime(parse_timestamp(edited_at)) if edited_at else None,
+                to_datetime(parse_timestamp(deleted_at)) if deleted_at else None
+            ))
+
+        if rows:
+            first = ChangeSequence.allocate(self.connection, len(rows))
+            rows = [row + (first + offset,) for offset, row in enumerate(rows)]
+            self._insert_many(Message.__table__, rows, MESSAGE_COLUMNS)
+            self.stats.messages += len(rows)
+
+    def _touch_rooms(self):
+        """Advance the versions of app/utils/conditional.py for changed rooms and room lists"""
+        rooms = Room.__table__
+        users = User.__table__
+        for chunk in _chunks(sorted(self._member_rooms), LOOKUP_CHUNK_SIZE):
+            self.connection.execute(rooms.update().where(rooms.c.id.in_(chunk)).values(version=rooms.c.version + 1))
+        for chunk in _chunks(sorted(self._history_rooms), LOOKUP_CHUNK_SIZE):
+            self.connection.execute(
+                rooms.update().where(rooms.c.id.in_(chunk)).values(history_version=rooms.c.history_version + 1)
+            )
+        for chunk in _chunks(sorted(self._member_users), LOOKUP_CHUNK_SIZE):
+            self.connection.execute(
+                users.update().where(users.c.id.in_(chunk)).values(rooms_version=users.c.rooms_version + 1)
+            )
+
+    def _insert_many(self, table, rows, columns=None):
+        """
+        executemany an INSERT straight through the driver
+        rows are dicts, or tuples in the order of columns. SQLAlchemy's
+        per-row parameter processing would cost more than the insert
+        itself, so values must already be in the driver's form (see
+        _datetime).
+        """
+        columns = columns or list(rows[0])
+        compiled = table.insert().compile(dialect=self.connection.dialect, column_keys=columns)
+        if isinstance(rows[0], dict):
+            if compiled.positional:
+                rows = [tuple(row[key] for key in compiled.positiontup) for row in rows]
+        elif not compiled.positional:
+            rows = [dict(zip(columns, row)) for row in rows]
+        elif list(compiled.positiontup) != list(columns):
+            order = [columns.index(key) for key in compiled.positiontup]
+            rows = [tuple(row[index] for index in order) for row in rows]
+        self.connection.exec_driver_sql(str(compiled), rows)
+
+    def _update_conversations(self):
+        """
+        Create or advance the inbox summary of every imported conversation
+        The last message of a conversation is its newest by timestamp, which
+        for imported history is not necessarily the highest id. New
+        summaries are written with INSERT ... SELECT, so no conversation
+        passes through Python.
+        """
+        messages = Message.__table__
+        conversations = Conversation.__table__
+        members = ConversationMember.__table__
+
+        newest = (
+            db.select(messages.c.conversation_key.label('key'), db.func.max(messages.c.timestamp).label('timestamp'))
+            .where(messages.c.id > self._first_id, messages.c.conversation_key.isnot(None))
+            .group_by(messages.c.conversation_key)
+            .subquery()
+        )
+        low = db.case((messages.c.sender_id < messages.c.receiver_id, messages.c.sender_id),
+                      else_=messages.c.receiver_id)
+        high = db.case((messages.c.sender_id < messages.c.receiver_id, messages.c.receiver_id),
+                       else_=messages.c.sender_id)
+        summaries = (
+            db.select(messages.c.conversation_key.label('key'),
+                      db.func.min(low).label('user_a_id'),
+                      db.func.max(high).label('user_b_id'),
+                      db.func.max(messages.c.id).label('last_message_id'),
+                      messages.c.timestamp.label('last_activity_at'))
+            .join(newest, db.and_(messages.c.conversation_key == newest.c.key,
+                                  messages.c.timestamp == newest.c.timestamp))
+            .where(messages.c.id > self._first_id)
+            .group_by(messages.c.conversation_key, messages.c.timestamp)
+            .subquery()
+        )
+
+        # Older history of a known conversation leaves its summary on the newer message
+        for conversation_id, last_id, last_at in self.connection.execute(
+            db.select(conversations.c.id, summaries.c.last_message_id, summaries.c.last_activity_at)
+            .join(summaries, conversations.c.key == summaries.c.key)
+            .where(db.or_(conversations.c.last_activity_at.is_(None),
+                          conversations.c.last_activity_at < summaries.c.last_activity_at))
+        ).all():
+            self.connection.execute(
+                conversations.update().where(conversations.c.id == conversation_id)
+                .values(last_message_id=last_id, last_activity_at=last_at)
+            )
+            self.connection.execute(
+                members.update().where(members.c.conversation_id == conversation_id)
+                .values(last_activity_at=last_at)
+            )
+
+        # Invalidate the ETags of known conversations; new ones start past the empty history's 0
+        self.connection.execute(
+            conversations.update()
+            .where(conversations.c.key.in_(db.select(summaries.c.key)))
+            .values(history_version=conversations.c.history_version + 1)
+        )
+        last_conversation_id = self.connection.execute(db.select(db.func.max(conversations.c.id))).scalar() or 0
+        created = self.connection.execute(conversations.insert().from_select(
+            ['key', 'user_a_id', 'user_b_id', 'last_message_id', 'last_activity_at', 'created_at', 'history_version'],
+            db.select(summaries.c.key, summaries.c.user_a_id, summaries.c.user_b_id,
+                      summaries.c.last_message_id, summaries.c.last_activity_at, summaries.c.last_activity_at,
+                      db.literal(1))
+            .where(~db.exists().where(conversations.c.key == summaries.c.key))
+        )).rowcount
+        if not created:
+            return
+
+        # One member row per participant; a conversation with oneself has one
+        new = conversations.c.id > last_conversation_id
+        columns = ['conversation_id', 'user_id', 'peer_id', 'unread_count', 'last_read_message_id', 'last_activity_at']
+        for user, peer, condition in (
+            (conversations.c.user_a_id, conversations.c.user_b_id, new),
+            (conversations.c.user_b_id, conversations.c.user_a_id,
+             db.and_(new, conversations.c.user_a_id != conversations.c.user_b_id))
+        ):
+            self.connection.execute(members.insert().from_select(columns, db.select(
+                conversations.c.id, user, peer, db.literal(0), conversations.c.last_message_id,
+                conversations.c.last_activity_at
+            ).where(condition)))
+        self.stats.conversations += created
@@ -0,0 +1,194 @@
+"""
+In-place schema upgrades for existing databases
+
+db.create_all() only creates missing tables, so columns and indexes added to
+models later never reach a database created by an older version. run() is
+called at startup after create_all() and applies each upgrade step that is
+still missing; every step is idempotent.
+"""
+import logging
+from datetime import datetime
+from app import db
+from app.models.change import ChangeSequence, MembershipChange
+from app.models.message import Message
+from app.models.conversation import Conversation, ConversationMember
+from app.utils import search
+
+logger = logging.getLogger(__name__)
+
+def _columns(inspector, table):
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def add_message_conversation_key(connection, inspector):
+    """Add messages.conversation_key and fill it for existing direct messages"""
+    if 'conversation_key' in _columns(inspector, 'messages'):
+        return False
+
+    connection.execute(db.text('ALTER TABLE messages ADD COLUMN conversation_key VARCHAR(41)'))
+
+    messages = Message.__table__
+    low = db.case((messages.c.sender_id < messages.c.receiver_id, messages.c.sender_id),
+                  else_=messages.c.receiver_id)
+    high = db.case((messages.c.sender_id < messages.c.receiver_id, messages.c.receiver_id),
+                   else_=messages.c.sender_id)
+    key = db.cast(low, db.String) + ':' + db.cast(high, db.String)
+
+    # One statement: run() holds every step in one transaction, so the upgrade
+    # is all or nothing and smaller statements would not release any locks
+    filled = connection.execute(
+        messages.update()
+        .where(messages.c.receiver_id.isnot(None))
+        .values(conversation_key=key)
+    ).rowcount
+    logger.info(f"Backfilled messages.conversation_key for {filled} direct messages")
+    return True
+
+
+def backfill_conversations(connection, inspector):
+    """Build the inbox summary from existing direct messages, all marked as read"""
+    conversations = Conversation.__table__
+    members = ConversationMember.__table__
+    if connection.execute(db.select(conversations.c.id).limit(1)).first() is not None:
+        return False
+
+    messages = Message.__table__
+    summaries = connection.execute(
+        db.select(
+            messages.c.conversation_key,
+            db.func.max(messages.c.id),
+            db.func.max(messages.c.timestamp)
+        )
+        .where(messages.c.conversation_key.isnot(None))
+        .group_by(messages.c.conversation_key)
+    ).all()
+    if not summaries:
+        return False
+
+    now = datetime.utcnow()
+    connection.execute(conversations.insert(), [{
+        'key': key,
+        'user_a_id': int(key.split(':')[0]),
+        'user_b_id': int(key.split(':')[1]),
+        'last_message_id': last_id,
+        'last_activity_at': last_at,
+        'created_at': now
+    } for key, last_id, last_at in summaries])
+
+    rows = connection.execute(db.select(
+        conversations.c.id, conversations.c.user_a_id, conversations.c.user_b_id,
+        conversations.c.last_message_id, conversations.c.last_activity_at
+    )).all()
+    connection.execute(members.insert(), [{
+        'conversation_id': conversation_id,
+        'user_id': user_id,
+        'peer_id': peer_id,
+        'unread_count': 0,
+        'last_read_message_id': last_id,
+        'last_activity_at': last_at
+    } for conversation_id, user_a_id, user_b_id, last_id, last_at in rows
+        for user_id, peer_id in {(user_a_id, user_b_id), (user_b_id, user_a_id)}])
+    logger.info(f"Backfilled {len(rows)} conversations")
+    return True
+
+
+# Version counters behind the ETags of app/utils/conditional.py
+VERSION_COLUMNS = [
+    ('conversations', 'history_version'),
+    ('rooms', 'version'),
+    ('rooms', 'history_version'),
+    ('users', 'rooms_version')
+]
+
+
+def add_version_columns(connection, inspector):
+    """Add the ETag version counters, starting at 0"""
+    added = False
+    for table, column in VERSION_COLUMNS:
+        if column in _columns(inspector, table):
+            continue
+        connection.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'))
+        logger.info(f"Added {table}.{column}")
+        added = True
+    return added
+
+
+def add_room_retention_days(connection, inspector):
+    """Add rooms.retention_days; existing rooms follow the default policy"""
+    if 'retention_days' in _columns(inspector, 'rooms'):
+        return False
+    connection.execute(db.text('ALTER TABLE rooms ADD COLUMN retention_days INTEGER'))
+    logger.info("Added rooms.retention_days")
+    return True
+
+
+def add_message_change_seq(connection, inspector):
+    """Add messages.change_seq, numbering existing messages by id"""
+    if 'change_seq' in _columns(inspector, 'messages'):
+        return False
+
+    connection.execute(db.text('ALTER TABLE messages ADD COLUMN change_seq INTEGER'))
+
+    messages = Message.__table__
+    filled = connection.execute(messages.update().values(change_seq=messages.c.id)).rowcount
+    logger.info(f"Backfilled messages.change_seq for {filled} messages")
+    return True
+
+
+def init_change_sequence(connection, inspector):
+    """Create the change sequence row, continuing after the highest number in use"""
+    sequence = ChangeSequence.__table__
+    if connection.execute(db.select(sequence.c.id).where(sequence.c.id == 1)).first() is not None:
+        return False
+
+    value = max(
+        connection.execute(db.select(db.func.max(Message.__table__.c.change_seq))).scalar() or 0,
+        connection.execute(db.select(db.func.max(MembershipChange.__table__.c.change_seq))).scalar() or 0
+    )
+    connection.execute(sequence.insert().values(id=1, value=value))
+    logger.info(f"Started the change sequence at {value}")
+    return True
+
+
+def create_missing_indexes(connection, inspector):
+    """Create model indexes that are missing on tables created earlier"""
+    created = False
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(connection)
+                logger.info(f"Created index {index.name}")
+                created = True
+    return created
+
+
+def create_search_index(connection, inspector):
+    """Create and fill the full-text message index of the database engine"""
+    if not search.create_index(connection, inspector):
+        return False
+    logger.info(f"Created the {connection.dialect.name} full-text message index")
+    return True
+
+
+# Applied in order; later steps may rely on earlier ones
+STEPS = [
+    add_message_conversation_key,
+    backfill_conversations,
+    add_version_columns,
+    add_room_retention_days,
+    add_message_change_seq,
+    init_change_sequence,
+    create_missing_indexes,
+    create_search_index
+]
+
+
+def run():
+    """Apply every pending upgrade step in one transaction"""
+    with db.engine.begin() as connection:
+        for step in STEPS:
+            # Each step sees the schema left by the previous one
+            step(connection, db.inspect(connection))
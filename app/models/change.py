@@ -0,0 +1,92 @@
+"""
+Change sequence, membership change log and history purge log for delta sync
+"""
+from datetime import datetime
+from app import db
+
+
+class ChangeSequence(db.Model):
+    """
+    The global change sequence, a single row
+    Writers advance it as the last statement of their transaction. The row
+    lock is held until commit, so sequence numbers become visible in order
+    and a client that synced up to N never misses a change numbered below N.
+    """
+    
+    __tablename__ = 'change_sequence'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+    
+    @staticmethod
+    def allocate(executor, count=1):
+        """
+        Reserve count consecutive sequence numbers and return the first
+        executor is db.session or a Connection in the caller's transaction.
+        """
+        table = ChangeSequence.__table__
+        executor.execute(table.update().where(table.c.id == 1).values(value=table.c.value + count))
+        return executor.execute(db.select(table.c.value).where(table.c.id == 1)).scalar() - count + 1
+
+
+class MembershipChange(db.Model):
+    """A user joining or leaving a room, kept so removals can be synced"""
+    
+    __tablename__ = 'room_membership_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    change_seq = db.Column(db.Integer, nullable=False)
+    room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # 'joined' or 'left'
+    kind = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_membership_changes_room_seq', 'room_id', 'change_seq'),
+        db.Index('ix_membership_changes_user_seq', 'user_id', 'change_seq'),
+    )
+    
+    def __repr__(self):
+        return f'<MembershipChange user={self.user_id} {self.kind} room={self.room_id}>'
+    
+    def to_dict(self):
+        """Convert membership change to dictionary"""
+        return {
+            'changeSeq': self.change_seq,
+            'roomId': self.room_id,
+            'userId': self.user_id,
+            'change': self.kind,
+            'at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class HistoryPurge(db.Model):
+    """Messages of a conversation or room older than a cutoff removed by retention"""
+    
+    __tablename__ = 'history_purges'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    change_seq = db.Column(db.Integer, nullable=False)
+    # Set for a direct conversation, room_id for a room
+    conversation_key = db.Column(db.String(41), nullable=True)
+    room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'), nullable=True)
+    purged_before = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_history_purges_conversation_seq', 'conversation_key', 'change_seq'),
+        db.Index('ix_history_purges_room_seq', 'room_id', 'change_seq'),
+    )
+    
+    def __repr__(self):
+        return f'<HistoryPurge {self.conversation_key or self.room_id} before {self.purged_before}>'
+    
+    def to_dict(self):
+        """Convert history purge to dictionary"""
+        return {
+            'changeSeq': self.change_seq,
+            'userIds': [int(user_id) for user_id in self.conversation_key.split(':')] if self.conversation_key else None,
+            'roomId': self.room_id,
+            'before': self.purged_before.isoformat()
+        }
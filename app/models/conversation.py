@@ -0,0 +1,204 @@
+"""
+Conversation model with a denormalized inbox summary for direct messages
+"""
+from collections import Counter
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+
+class Conversation(db.Model):
+    """A direct conversation between two users and its latest activity"""
+    
+    __tablename__ = 'conversations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Same value as Message.conversation_key
+    key = db.Column(db.String(41), unique=True, nullable=False)
+    user_a_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_b_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('messages.id'), nullable=True)
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Advanced whenever a message of the conversation is created, edited or deleted
+    history_version = db.Column(db.Integer, default=0, nullable=False)
+    
+    # Relationships
+    last_message = db.relationship('Message', foreign_keys=[last_message_id])
+    members = db.relationship('ConversationMember', back_populates='conversation', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<Conversation {self.key}>'
+    
+    def to_dict(self):
+        """Convert conversation to dictionary"""
+        return {
+            'id': self.id,
+            'userIds': [self.user_a_id, self.user_b_id],
+            'lastMessageId': self.last_message_id,
+            'lastActivityAt': self.last_activity_at.isoformat() if self.last_activity_at else None,
+            'createdAt': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    @staticmethod
+    def get_or_create(key):
+        """Return the conversation for a conversation key, creating it with both members if needed"""
+        conversation = Conversation.query.filter_by(key=key).first()
+        if conversation is not None:
+            return conversation
+        
+        user_a_id, user_b_id = (int(user_id) for user_id in key.split(':'))
+        try:
+            # A concurrent sender may create the same conversation first
+            with db.session.begin_nested():
+                conversation = Conversation(key=key, user_a_id=user_a_id, user_b_id=user_b_id)
+                conversation.members = [ConversationMember(user_id=user_a_id, peer_id=user_b_id)]
+                if user_b_id != user_a_id:
+                    conversation.members.append(ConversationMember(user_id=user_b_id, peer_id=user_a_id))
+                db.session.add(conversation)
+        except IntegrityError:
+            conversation = Conversation.query.filter_by(key=key).one()
+        return conversation
+    
+    @staticmethod
+    def record_messages(messages):
+        """
+        Update the inbox summary for newly stored messages
+        Runs in the caller's transaction; room messages are ignored. Counters
+        are incremented in SQL so concurrent senders do not lose updates.
+        """
+        direct = [message for message in messages if message.conversation_key is not None]
+        if not direct:
+            return
+        db.session.flush()
+        
+        by_key = {}
+        for message in direct:
+            by_key.setdefault(message.conversation_key, []).append(message)
+        
+        conversations = Conversation.__table__
+        members = ConversationMember.__table__
+        for key, key_messages in by_key.items():
+            conversation = Conversation.get_or_create(key)
+            last_id = max(message.id for message in key_messages)
+            last_at = max(message.timestamp for message in key_messages)
+            # Notes to self are never unread
+            unread = Counter(message.receiver_id for message in key_messages
+                             if message.receiver_id != message.sender_id)
+            
+            db.session.execute(
+                conversations.update()
+                .where(conversations.c.id == conversation.id)
+                .values(
+                    last_message_id=db.case(
+                        (db.or_(conversations.c.last_message_id.is_(None),
+                                conversations.c.last_message_id < last_id), last_id),
+                        else_=conversations.c.last_message_id
+                    ),
+                    last_activity_at=db.case(
+                        (db.or_(conversations.c.last_activity_at.is_(None),
+                                conversations.c.last_activity_at < last_at), last_at),
+                        else_=conversations.c.last_activity_at
+                    )
+                )
+            )
+            member_values = {
+                'last_activity_at': db.case(
+                    (db.or_(members.c.last_activity_at.is_(None),
+                            members.c.last_activity_at < last_at), last_at),
+                    else_=members.c.last_activity_at
+                )
+            }
+            if unread:
+                member_values['unread_count'] = members.c.unread_count + db.case(
+                    *[(members.c.user_id == user_id, count) for user_id, count in unread.items()],
+                    else_=0
+                )
+            db.session.execute(
+                members.update()
+                .where(members.c.conversation_id == conversation.id)
+                .values(**member_values)
+            )
+            # The SQL updates bypassed the ORM copies
+            db.session.expire(conversation)
+    
+    @staticmethod
+    def record_delete(message):
+        """Drop a deleted direct message from the receiver's unread count if it was unread"""
+        if message.conversation_key is None:
+            return
+        members = ConversationMember.__table__
+        conversations = Conversation.__table__
+        db.session.execute(
+            members.update()
+            .where(
+                members.c.conversation_id == db.select(conversations.c.id)
+                .where(conversations.c.key == message.conversation_key)
+                .scalar_subquery(),
+                members.c.user_id == message.receiver_id,
+                members.c.unread_count > 0,
+                db.or_(members.c.last_read_message_id.is_(None),
+                       members.c.last_read_message_id < message.id)
+            )
+            .values(unread_count=members.c.unread_count - 1)
+        )
+    
+    @staticmethod
+    def mark_read(user_id, peer_id):
+        """
+        Mark a user's conversation with a peer as read up to its last message
+        Returns False when the two users have no conversation.
+        """
+        from app.models.message import Message
+        
+        conversation = Conversation.query.filter_by(
+            key=Message.conversation_key_for(user_id, peer_id)
+        ).first()
+        if conversation is None:
+            return False
+        members = ConversationMember.__table__
+        db.session.execute(
+            members.update()
+            .where(members.c.conversation_id == conversation.id, members.c.user_id == user_id)
+            .values(unread_count=0, last_read_message_id=conversation.last_message_id)
+        )
+        return True
+
+
+class ConversationMember(db.Model):
+    """A participant's view of a conversation: unread count and inbox ordering"""
+    
+    __tablename__ = 'conversation_members'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversations.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    peer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+    last_read_message_id = db.Column(db.Integer, nullable=True)
+    # Copy of Conversation.last_activity_at so the inbox is one index range
+    last_activity_at = db.Column(db.DateTime, nullable=True)
+    
+    # Relationships
+    conversation = db.relationship('Conversation', back_populates='members')
+    user = db.relationship('User', foreign_keys=[user_id])
+    peer = db.relationship('User', foreign_keys=[peer_id])
+    
+    __table_args__ = (
+        db.UniqueConstraint('conversation_id', 'user_id', name='unique_conversation_member'),
+        db.Index('ix_conversation_members_inbox', 'user_id', 'last_activity_at', 'conversation_id'),
+    )
+    
+    def __repr__(self):
+        return f'<ConversationMember user={self.user_id} conversation={self.conversation_id}>'
+    
+    def to_dict(self):
+        """Convert conversation member to dictionary"""
+        return {
+            'conversationId': self.conversation_id,
+            'userId': self.user_id,
+            'peerId': self.peer_id,
+            'unreadCount': self.unread_count,
+            'lastReadMessageId': self.last_read_message_id,
+            'lastActivityAt': self.last_activity_at.isoformat() if self.last_activity_at else None
+        }
@@ -14,16 +14,40 @@ class Message(db.Model):
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'), nullable=True)
+    # Same value for both directions of a direct conversation, None for rooms
+    conversation_key = db.Column(db.String(41), nullable=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    edited_at = db.Column(db.DateTime, nullable=True)
-    deleted_at = db.Column(db.DateTime, nullable=True)
+    edited_at = db.Column(db.DateTime, nullable=True, index=True)
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)
+    # Global change sequence of the latest create, edit or delete (see app/utils/changes.py)
+    change_seq = db.Column(db.Integer, nullable=True)
     
     # Relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
     room = db.relationship('Room', backref='messages')
     
+    # History queries seek on the conversation or room and read in order
+    __table_args__ = (
+        db.Index('ix_messages_conversation_timestamp', 'conversation_key', 'timestamp', 'id'),
+        db.Index('ix_messages_room_timestamp', 'room_id', 'timestamp', 'id'),
+        # Delta sync reads each conversation and room from a change sequence on
+        db.Index('ix_messages_conversation_change', 'conversation_key', 'change_seq'),
+        db.Index('ix_messages_room_change', 'room_id', 'change_seq'),
+    )
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.conversation_key is None and self.receiver_id is not None:
+            self.conversation_key = Message.conversation_key_for(self.sender_id, self.receiver_id)
+    
+    @staticmethod
+    def conversation_key_for(user_a, user_b):
+        """Return the normalized key of the direct conversation between two users"""
+        user_a, user_b = int(user_a), int(user_b)
+        return f'{min(user_a, user_b)}:{max(user_a, user_b)}'
+    
     def __repr__(self):
         if self.room_id:
             return f'<Message from {self.sender_id} to room {self.room_id}>'
@@ -31,15 +55,34 @@ class Message(db.Model):
     
     def to_dict(self):
         """Convert message to dictionary"""
-        return {
-            'id': self.id,
-            'senderId': self.sender_id,
-            'receiverId': self.receiver_id,
-            'roomId': self.room_id,
-            'content': self.content if not self.deleted_at else '[Message deleted]',
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
-            'editedAt': self.edited_at.isoformat() if self.edited_at else None,
-            'deletedAt': self.deleted_at.isoformat() if self.deleted_at else None,
-            'isDeleted': self.deleted_at is not None,
-            'isEdited': self.edited_at is not None
-        }
+        return message_row_to_dict((
+            self.id, self.sender_id, self.receiver_id, self.room_id, self.content,
+            self.timestamp, self.edited_at, self.deleted_at
+        ))
+
+
+# Columns read by history queries that skip the ORM, in the order message_row_to_dict() unpacks them
+MESSAGE_COLUMNS = tuple(Message.__table__.c[name] for name in (
+    'id', 'sender_id', 'receiver_id', 'room_id', 'content', 'timestamp', 'edited_at', 'deleted_at'
+))
+
+
+def message_row_to_dict(row):
+    """
+    Serialize one MESSAGE_COLUMNS row like Message.to_dict()
+    Rows are plain tuples, so history pages are read without building
+    Message objects, tracking them in the session or expiring them later.
+    """
+    message_id, sender_id, receiver_id, room_id, content, timestamp, edited_at, deleted_at = row
+    return {
+        'id': message_id,
+        'senderId': sender_id,
+        'receiverId': receiver_id,
+        'roomId': room_id,
+        'content': content if not deleted_at else '[Message deleted]',
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'editedAt': edited_at.isoformat() if edited_at else None,
+        'deletedAt': deleted_at.isoformat() if deleted_at else None,
+        'isDeleted': deleted_at is not None,
+        'isEdited': edited_at is not None
+    }
@@ -15,6 +15,12 @@ class Room(db.Model):
     description = db.Column(db.Text, nullable=True)
     creator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Advanced whenever the member list changes
+    version = db.Column(db.Integer, default=0, nullable=False)
+    # Advanced whenever a message of the room is created, edited or deleted
+    history_version = db.Column(db.Integer, default=0, nullable=False)
+    # Days messages are kept (0 keeps them forever); None follows RETENTION_ROOM_DAYS
+    retention_days = db.Column(db.Integer, nullable=True)
     
     # Relationships
     creator = db.relationship('User', foreign_keys=[creator_id], backref='created_rooms')
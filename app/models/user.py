@@ -15,6 +15,8 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Advanced whenever the user joins or leaves a room
+    rooms_version = db.Column(db.Integer, default=0, nullable=False)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -0,0 +1,181 @@
+"""
+Read replica routing
+
+With DATABASE_READ_URLS set, every replica becomes a bind (replica_0,
+replica_1, ...) and db.session routes statements per request:
+- handlers decorated with @replicas.read_only run their queries on one
+  replica picked at random for the request
+- everything else, and any write or flush, goes to the primary
+  (DATABASE_URL)
+
+Replicas lag behind the primary, so a user who committed a write within the
+last REPLICA_STICKY_SECONDS reads from the primary until then
+(read-your-writes). Writes are noticed on commit and attributed to the user
+of the HTTP request (JWT identity) or socket event; with a shared message bus
+the stickiness reaches every server process. Caches shared by all users are
+filled from the primary (see use_primary()), so no lagging row outlives a
+request.
+
+Locally, point DATABASE_READ_URLS at a second SQLite file holding a copy of
+the primary database.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_app_context, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql.expression import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+# Sticky users kept before expired entries are first swept
+STICKY_SWEEP_SIZE = 10000
+
+
+class RoutingSession(Session):
+    """db.session that sends the reads of read-only requests to a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info['wrote'] = True
+            else:
+                replica = replicas.bind_for_request()
+                if replica is not None:
+                    return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if session.info.pop('wrote', False):
+        replicas.record_write()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('wrote', None)
+
+
+class ReplicaRouter:
+    """Replica choice per request and read-your-writes stickiness per user"""
+
+    def __init__(self):
+        self.binds = []
+        self.sticky_seconds = 5.0
+        self._socket_user = None
+        self._lock = threading.Lock()
+        self._sticky_until = {}
+        self._sweep_at = STICKY_SWEEP_SIZE
+        self._bus = None
+        self._listener = None
+
+    def init_app(self, app):
+        """Read the replica binds and follow the writes of other processes"""
+        self.binds = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {} if key.startswith('replica_'))
+        self.sticky_seconds = max(0, app.config.get('REPLICA_STICKY_SECONDS', 5))
+        with self._lock:
+            self._sticky_until = {}
+        bus = app.extensions['message_bus']
+        self._bus = bus
+        if self.binds and self.sticky_seconds and bus.shared and self._listener is None:
+            self._listener = app.extensions['socketio'].start_background_task(self._listen)
+        if self.binds:
+            logger.info(f"Read-only endpoints use {len(self.binds)} replica(s)")
+
+    def socket_user_loader(self, callback):
+        """Register callback(sid) -> user id, to attribute writes made by socket events"""
+        self._socket_user = callback
+        return callback
+
+    def read_only(self, f):
+        """
+        Route the queries of a handler to a replica
+        Goes below @token_required: the handler's first argument is the
+        current user, whose recent writes keep them on the primary.
+        """
+        @wraps(f)
+        def decorated_function(current_user, *args, **kwargs):
+            if self.binds and not self.is_sticky(current_user.id):
+                g.replica_bind = random.choice(self.binds)
+            return f(current_user, *args, **kwargs)
+
+        return decorated_function
+
+    def bind_for_request(self):
+        """Replica bind chosen for the current request, or None for the primary"""
+        if not self.binds or not has_app_context():
+            return None
+        return g.get('replica_bind')
+
+    @contextmanager
+    def use_primary(self):
+        """Read from the primary inside a read-only request, e.g. to fill a shared cache"""
+        replica = g.pop('replica_bind', None) if has_app_context() else None
+        try:
+            yield
+        finally:
+            if replica is not None:
+                g.replica_bind = replica
+
+    def is_sticky(self, user_id):
+        """Whether the user wrote recently enough that replicas may not have it yet"""
+        until = self._sticky_until.get(user_id)
+        return until is not None and until > time.time()
+
+    def record_write(self, user_ids=None):
+        """Keep users (default: the user of the current request) on the primary for a while"""
+        if not self.binds or not self.sticky_seconds:
+            return
+        if user_ids is None:
+            user_id = self._current_user_id()
+            if user_id is None:
+                return
+            user_ids = [user_id]
+        if not user_ids:
+            return
+        until = time.time() + self.sticky_seconds
+        # Locally first: the writer's next request may reach this process before the bus echo
+        self._stick(user_ids, until)
+        if self._bus is not None and self._bus.shared:
+            self._bus.publish('replica_sticky', json.dumps([sorted(set(user_ids)), until]))
+
+    def _listen(self):
+        for data in self._bus.subscribe('replica_sticky'):
+            try:
+                self._stick(*json.loads(data))
+            except Exception as e:
+                logger.error(f"Invalid replica stickiness on bus: {type(e).__name__}")
+
+    def _stick(self, user_ids, until):
+        with self._lock:
+            if len(self._sticky_until) >= self._sweep_at:
+                now = time.time()
+                self._sticky_until = {user_id: deadline for user_id, deadline in self._sticky_until.items()
+                                      if deadline > now}
+                # Many users still sticky: sweep again only once that many more have written
+                self._sweep_at = max(STICKY_SWEEP_SIZE, 2 * len(self._sticky_until))
+            for user_id in user_ids:
+                self._sticky_until[user_id] = max(until, self._sticky_until.get(user_id, 0))
+
+    def _current_user_id(self):
+        if not has_request_context():
+            return None
+        sid = getattr(request, 'sid', None)
+        if sid is not None:
+            return self._socket_user(sid) if self._socket_user is not None else None
+        try:
+            identity = get_jwt_identity()
+        except RuntimeError:
+            # No verified token in this request (registration, login)
+            return None
+        return int(identity) if identity is not None else None
+
+
+replicas = ReplicaRouter()
@@ -0,0 +1,311 @@
+"""
+Retention of message history
+
+Deleting a message only sets deleted_at, and nothing ever removes old
+messages, so the messages table and its indexes grow forever. When
+RETENTION_ENABLED is set, a background task on that server process runs
+every RETENTION_INTERVAL_SECONDS and:
+- scrubs the content of messages deleted more than
+  RETENTION_SCRUB_AFTER_HOURS ago; Message.to_dict() already hides it, but
+  the text stays in the table and in MySQL's full-text index
+- removes messages older than the retention of their conversation or room:
+  RETENTION_DIRECT_DAYS for direct conversations, rooms.retention_days or else
+  RETENTION_ROOM_DAYS for rooms; 0 keeps messages forever
+
+Rows are changed at most RETENTION_BATCH_SIZE at a time, each batch in its
+own short transaction, with a pause of RETENTION_BATCH_PAUSE_MS after every
+RETENTION_BATCH_SIZE rows, so writers never wait long on the job. Each removal
+batch keeps the inbox summary and the ETag versions of its scope current in
+the same transaction. Once a scope is done its purge is logged in the change
+feed and the scope is dropped from the history cache of every process.
+"""
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from app import db, socketio
+from app.models.conversation import Conversation, ConversationMember
+from app.models.message import Message
+from app.models.room import Room
+from app.utils import changes
+from app.utils.conditional import touch_scopes
+from app.utils.history_cache import history_cache
+
+logger = logging.getLogger(__name__)
+
+# Reports of past runs returned by stats()
+REPORTS_KEPT = 10
+
+# Conversations or rooms read per query while walking all of them
+SCOPE_CHUNK_SIZE = 500
+
+
+class RetentionJob:
+    """Periodic scrub and purge runs, with a report of each"""
+
+    def __init__(self):
+        self.enabled = False
+        self.direct_days = 0
+        self.room_days = 0
+        self.scrub_after = timedelta(hours=24)
+        self.interval = 3600
+        self.batch_size = 500
+        self.pause = 0.05
+        self.reports = deque(maxlen=REPORTS_KEPT)
+        self.totals = {'runs': 0, 'scrubbed': 0, 'removed': 0}
+        self._worker = None
+        self._written = 0
+        self._newest = None
+        # deleted_at of the last scrubbed message; earlier ones are done
+        self._scrubbed_through = None
+
+    def init_app(self, app):
+        """Read the policies from the config and start the background task if enabled"""
+        self.enabled = app.config.get('RETENTION_ENABLED', False)
+        self.direct_days = max(0, app.config.get('RETENTION_DIRECT_DAYS', 0))
+        self.room_days = max(0, app.config.get('RETENTION_ROOM_DAYS', 0))
+        self.scrub_after = timedelta(hours=max(0, app.config.get('RETENTION_SCRUB_AFTER_HOURS', 24)))
+        self.interval = max(1, app.config.get('RETENTION_INTERVAL_SECONDS', 3600))
+        self.batch_size = max(1, app.config.get('RETENTION_BATCH_SIZE', 500))
+        self.pause = max(0, app.config.get('RETENTION_BATCH_PAUSE_MS', 50)) / 1000.0
+        if self.enabled and self._worker is None:
+            self._worker = socketio.start_background_task(self._run, app)
+
+    def _run(self, app):
+        while True:
+            socketio.sleep(self.interval)
+            with app.app_context():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Retention run failed: {type(e).__name__}")
+                finally:
+                    db.session.remove()
+
+    def room_retention(self, room_retention_days):
+        """Days a room keeps its messages, from its own setting or the default"""
+        return self.room_days if room_retention_days is None else room_retention_days
+
+    def run_once(self, now=None):
+        """Scrub and purge everything due at now (default: the current time) and return the run's report"""
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        self._written = 0
+        # SQLite hands the id of a deleted highest row out again, and message
+        # ids must never repeat (catch-up cursors, read markers, client
+        # copies), so the newest message is always kept
+        messages = Message.__table__
+        self._newest = db.session.execute(
+            db.select(messages.c.id, messages.c.timestamp, messages.c.conversation_key, messages.c.room_id)
+            .order_by(messages.c.id.desc())
+            .limit(1)
+        ).first()
+        report = {
+            'startedAt': now.isoformat(),
+            'scrubbed': self._scrub(now - self.scrub_after),
+            'removedDirect': 0,
+            'removedRoom': 0,
+            'conversations': 0,
+            'rooms': 0
+        }
+
+        if self.direct_days:
+            cutoff = now - timedelta(days=self.direct_days)
+            for key in self._conversation_keys():
+                removed = self._purge_scope(cutoff, conversation_key=key)
+                if removed:
+                    report['removedDirect'] += removed
+                    report['conversations'] += 1
+
+        for room_id, days in self._room_policies():
+            removed = self._purge_scope(now - timedelta(days=days), room_id=room_id)
+            if removed:
+                report['removedRoom'] += removed
+                report['rooms'] += 1
+
+        report['durationMs'] = round((time.perf_counter() - started) * 1000)
+        self.reports.append(report)
+        self.totals['runs'] += 1
+        self.totals['scrubbed'] += report['scrubbed']
+        self.totals['removed'] += report['removedDirect'] + report['removedRoom']
+        logger.info(
+            f"Retention run: scrubbed {report['scrubbed']} deleted messages, removed "
+            f"{report['removedDirect']} direct messages from {report['conversations']} conversations and "
+            f"{report['removedRoom']} room messages from {report['rooms']} rooms in {report['durationMs']} ms"
+        )
+        return report
+
+    def _throttle(self, rows):
+        self._written += rows
+        if self._written >= self.batch_size:
+            self._written = 0
+            socketio.sleep(self.pause)
+
+    def _scrub(self, cutoff):
+        """Blank the content of messages deleted before cutoff"""
+        messages = Message.__table__
+        scrubbed = 0
+        while True:
+            query = db.select(messages.c.id, messages.c.deleted_at).where(
+                messages.c.deleted_at.isnot(None),
+                messages.c.deleted_at < cutoff,
+                messages.c.content != ''
+            )
+            if self._scrubbed_through is not None:
+                query = query.where(messages.c.deleted_at >= self._scrubbed_through)
+            rows = db.session.execute(
+                query.order_by(messages.c.deleted_at, messages.c.id).limit(self.batch_size)
+            ).all()
+            if not rows:
+                return scrubbed
+            db.session.execute(
+                messages.update().where(messages.c.id.in_([row.id for row in rows])).values(content='')
+            )
+            db.session.commit()
+            self._scrubbed_through = rows[-1].deleted_at
+            scrubbed += len(rows)
+            self._throttle(len(rows))
+
+    def _conversation_keys(self):
+        conversations = Conversation.__table__
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(conversations.c.id, conversations.c.key)
+                .where(conversations.c.id > last_id)
+                .order_by(conversations.c.id)
+                .limit(SCOPE_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                return
+            for _, key in rows:
+                yield key
+            last_id = rows[-1].id
+
+    def _room_policies(self):
+        """Yield (room id, retention days) of rooms that do not keep messages forever"""
+        rooms = Room.__table__
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(rooms.c.id, rooms.c.retention_days)
+                .where(rooms.c.id > last_id)
+                .order_by(rooms.c.id)
+                .limit(SCOPE_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                return
+            for room_id, retention_days in rows:
+                days = self.room_retention(retention_days)
+                if days:
+                    yield room_id, days
+            last_id = rows[-1].id
+
+    def _purge_scope(self, cutoff, conversation_key=None, room_id=None):
+        """
+        Remove the messages of one conversation or room older than cutoff
+        Walks the (scope, timestamp, id) history index oldest first, one
+        batch per transaction. Returns the number of messages removed.
+        """
+        messages = Message.__table__
+        if conversation_key is not None:
+            in_scope = messages.c.conversation_key == conversation_key
+            cache_scope = f'conversation_{conversation_key}'
+        else:
+            in_scope = messages.c.room_id == room_id
+            cache_scope = f'room_{room_id}'
+
+        newest = self._newest
+        if newest is None:
+            return 0
+        if (newest.conversation_key, newest.room_id) == (conversation_key, room_id) and newest.timestamp < cutoff:
+            # Everything before the kept message is still removed
+            cutoff = newest.timestamp
+
+        removed = 0
+        while True:
+            rows = db.session.execute(
+                db.select(messages.c.id, messages.c.sender_id, messages.c.receiver_id, messages.c.deleted_at)
+                .where(in_scope, messages.c.timestamp < cutoff, messages.c.id < newest.id)
+                .order_by(messages.c.timestamp, messages.c.id)
+                .limit(self.batch_size)
+            ).all()
+            if not rows:
+                break
+            db.session.execute(messages.delete().where(messages.c.id.in_([row.id for row in rows])))
+            if conversation_key is not None:
+                self._update_conversation(conversation_key, rows)
+                touch_scopes({conversation_key}, set())
+            else:
+                touch_scopes(set(), {room_id})
+            db.session.commit()
+            history_cache.purge(cache_scope)
+            removed += len(rows)
+            self._throttle(len(rows))
+            if len(rows) < self.batch_size:
+                break
+
+        if removed:
+            changes.record_purge(cutoff, conversation_key=conversation_key, room_id=room_id)
+            db.session.commit()
+        return removed
+
+    def _update_conversation(self, conversation_key, rows):
+        """Move the inbox summary off removed messages and uncount removed unread ones"""
+        conversations = Conversation.__table__
+        members = ConversationMember.__table__
+        messages = Message.__table__
+        conversation = db.session.execute(
+            db.select(conversations.c.id, conversations.c.last_message_id)
+            .where(conversations.c.key == conversation_key)
+        ).first()
+        if conversation is None:
+            return
+
+        removed_ids = {row.id for row in rows}
+        if conversation.last_message_id in removed_ids:
+            db.session.execute(
+                conversations.update()
+                .where(conversations.c.id == conversation.id)
+                .values(last_message_id=db.select(db.func.max(messages.c.id))
+                        .where(messages.c.conversation_key == conversation_key)
+                        .scalar_subquery())
+            )
+
+        # Same rule as Conversation.record_delete(); deleted messages were uncounted already
+        for user_id, last_read_id in db.session.execute(
+            db.select(members.c.user_id, members.c.last_read_message_id)
+            .where(members.c.conversation_id == conversation.id)
+        ).all():
+            unread = sum(1 for row in rows
+                         if row.receiver_id == user_id and row.sender_id != user_id and row.deleted_at is None
+                         and (last_read_id is None or row.id > last_read_id))
+            if unread:
+                db.session.execute(
+                    members.update()
+                    .where(members.c.conversation_id == conversation.id, members.c.user_id == user_id)
+                    .values(unread_count=db.case(
+                        (members.c.unread_count > unread, members.c.unread_count - unread),
+                        else_=0
+                    ))
+                )
+
+    def stats(self):
+        """Policies, totals and the reports of the latest runs of this process"""
+        return {
+            'enabled': self.enabled,
+            'policies': {
+                'directDays': self.direct_days,
+                'roomDays': self.room_days,
+                'scrubAfterHours': self.scrub_after.total_seconds() / 3600,
+                'intervalSeconds': self.interval,
+                'batchSize': self.batch_size,
+                'batchPauseMs': round(self.pause * 1000)
+            },
+            'totals': dict(self.totals),
+            'lastRuns': list(self.reports)
+        }
+
+
+retention = RetentionJob()
@@ -7,7 +7,11 @@ from flask_jwt_extended import create_access_token
 from app import db, limiter
 from app.models.user import User
 from app.middleware.auth import token_required
+from app.replicas import replicas
 from app.utils.validation import validate_registration_data, validate_login_data, validate_profile_update_data
+from app.utils.username_index import username_index
+from app.utils.profiles import profile_cache
+from app.utils.conditional import touch_profile
 
 auth_bp = Blueprint('auth', __name__)
 logger = logging.getLogger(__name__)
@@ -62,6 +66,7 @@ def register():
         
         db.session.add(user)
         db.session.commit()
+        username_index.record(user.id, user.username)
         
         # Generate JWT token
         access_token = create_access_token(identity=str(user.id))
@@ -207,7 +212,12 @@ def update_profile(user):
                 }), 400
             user.email = email
         
+        # Member lists of the user's rooms show the profile
+        if db.session.is_modified(user):
+            touch_profile(user.id)
         db.session.commit()
+        username_index.record(user.id, user.username)
+        profile_cache.forget(user.id)
         
         return jsonify({
             'success': True,
@@ -228,6 +238,7 @@ def update_profile(user):
 @auth_bp.route('/users/search', methods=['GET'])
 @limiter.limit("100 per 15 minutes")
 @token_required
+@replicas.read_only
 def search_users(user):
     """
     Search for users by username
@@ -248,15 +259,19 @@ def search_users(user):
                 'message': 'Search query must be at least 2 characters'
             }), 400
         
-        # Search users by username (case-insensitive)
-        users = User.query.filter(
-            User.username.ilike(f'%{query}%'),
-            User.id != user.id  # Exclude current user
-        ).limit(10).all()
-        
-        logger.info(f"Search query '{query}' by user {user.id} ({user.username}) found {len(users)} users")
-        for found_user in users:
-            logger.info(f"  - Found user: {found_user.id} ({found_user.username})")
+        if username_index.enabled:
+            # Ranked prefix-first matches from the in-memory index, excluding the current user
+            user_ids = username_index.search(query, limit=10, exclude_id=user.id)
+            found = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+            users = [found[user_id] for user_id in user_ids if user_id in found]
+        else:
+            # Search users by username (case-insensitive)
+            users = User.query.filter(
+                User.username.ilike(f'%{query}%'),
+                User.id != user.id  # Exclude current user
+            ).limit(10).all()
+        
+        logger.debug(f"User search by user {user.id} found {len(users)} users")
         
         return jsonify({
             'success': True,
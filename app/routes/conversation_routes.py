@@ -0,0 +1,121 @@
+"""
+Conversation routes for the direct message inbox
+"""
+import logging
+from flask import Blueprint, request, jsonify
+from app import db, limiter
+from app.models.conversation import Conversation, ConversationMember
+from app.models.message import Message
+from app.models.user import User
+from app.middleware.auth import token_required
+
+conversation_bp = Blueprint('conversations', __name__)
+logger = logging.getLogger(__name__)
+
+
+@conversation_bp.route('', methods=['GET'])
+@limiter.limit("100 per 15 minutes")
+@token_required
+def get_conversations(current_user):
+    """
+    Get the current user's direct conversations, most recent activity first
+    GET /api/conversations
+    Query params:
+    - page: Page number (default: 1)
+    - per_page: Results per page (default: 20, max: 100)
+    """
+    try:
+        # Get pagination parameters
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+        
+        if page < 1 or per_page < 1:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid pagination parameters'
+            }), 400
+        
+        # One index range over the user's memberships; the peer and the last
+        # message are primary-key joins
+        inbox_query = db.session.query(ConversationMember, User, Message).join(
+            User, User.id == ConversationMember.peer_id
+        ).join(
+            Conversation, Conversation.id == ConversationMember.conversation_id
+        ).outerjoin(
+            Message, Message.id == Conversation.last_message_id
+        ).filter(
+            ConversationMember.user_id == current_user.id
+        ).order_by(
+            ConversationMember.last_activity_at.desc(),
+            ConversationMember.conversation_id.desc()
+        )
+        
+        pagination = inbox_query.paginate(
+            page=page,
+            per_page=per_page,
+            error_out=False
+        )
+        
+        conversations = [{
+            'id': member.conversation_id,
+            'peer': {
+                'id': peer.id,
+                'username': peer.username
+            },
+            'lastMessage': last_message.to_dict() if last_message else None,
+            'lastActivityAt': member.last_activity_at.isoformat() if member.last_activity_at else None,
+            'unreadCount': member.unread_count
+        } for member, peer, last_message in pagination.items]
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'conversations': conversations,
+                'pagination': {
+                    'page': pagination.page,
+                    'perPage': pagination.per_page,
+                    'totalPages': pagination.pages,
+                    'totalConversations': pagination.total,
+                    'hasNext': pagination.has_next,
+                    'hasPrev': pagination.has_prev
+                }
+            }
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error fetching conversations: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Server error while fetching conversations'
+        }), 500
+
+
+@conversation_bp.route('/<int:user_id>/read', methods=['POST'])
+@limiter.limit("100 per 15 minutes")
+@token_required
+def mark_conversation_read(current_user, user_id):
+    """
+    Mark the conversation with another user as read
+    POST /api/conversations/:userId/read
+    """
+    try:
+        if not Conversation.mark_read(current_user.id, user_id):
+            return jsonify({
+                'success': False,
+                'message': 'Conversation not found'
+            }), 404
+        
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Conversation marked as read'
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error marking conversation read: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Server error while marking conversation read'
+        }), 500
@@ -3,12 +3,23 @@ Message routes for chat history
 """
 import logging
 from datetime import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app import db, limiter
-from app.models.message import Message
+from app.models.message import MESSAGE_COLUMNS, Message, message_row_to_dict
 from app.models.user import User
 from app.models.room import RoomMember
+from app.models.conversation import Conversation
 from app.middleware.auth import token_required
+from app.replicas import replicas
+from app.utils.pagination import parse_cursor
+from app.utils.history_cache import cached_keyset_page, cached_page
+from app.utils.search import search_messages, visible_to
+from app.utils.export import ndjson_export
+from app.utils.conditional import (
+    content_etag, conversation_version, history_response, not_modified, touch_history, version_etag
+)
+from app.utils.profiles import wants_users
+from app.websocket.catch_up import recent_events
 
 message_bp = Blueprint('messages', __name__)
 logger = logging.getLogger(__name__)
@@ -17,6 +28,7 @@ logger = logging.getLogger(__name__)
 @message_bp.route('/history/<int:user_id>', methods=['GET'])
 @limiter.limit("100 per 15 minutes")
 @token_required
+@replicas.read_only
 def get_chat_history(current_user, user_id):
     """
     Get chat history between current user and another user
@@ -24,6 +36,11 @@ def get_chat_history(current_user, user_id):
     Query params:
     - page: Page number (default: 1)
     - per_page: Results per page (default: 50, max: 100)
+    - before_id / after_id: Cursor mode; page before or after this message id
+      (before_id=0: newest page, after_id=0: oldest page)
+    - include: users to add a users table with the profiles of the message senders and receivers
+    Responses carry an ETag; send it back in If-None-Match to get
+    304 Not Modified while the conversation is unchanged.
     """
     try:
         # Check if the other user exists
@@ -44,13 +61,66 @@ def get_chat_history(current_user, user_id):
                 'message': 'Invalid pagination parameters'
             }), 400
         
-        # Query messages between the two users
-        messages_query = Message.query.filter(
-            db.or_(
-                db.and_(Message.sender_id == current_user.id, Message.receiver_id == user_id),
-                db.and_(Message.sender_id == user_id, Message.receiver_id == current_user.id)
-            )
-        ).order_by(Message.timestamp.asc())
+        # Query messages between the two users (both directions share one conversation key)
+        conversation_key = Message.conversation_key_for(current_user.id, user_id)
+        messages_query = Message.query.filter_by(conversation_key=conversation_key)
+        scope = f"conversation_{conversation_key}"
+        
+        try:
+            cursor = parse_cursor(request.args)
+            include_users = wants_users(request.args.get('include'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        # Unchanged since the client's copy: answer before loading any message
+        etag = version_etag(scope, conversation_version(conversation_key))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        
+        if cursor is not None:
+            # Cursor mode: history cache or an index seek, no total count
+            try:
+                messages, cursor_pagination, from_cache = cached_keyset_page(
+                    messages_query, scope, *cursor, per_page
+                )
+            except LookupError:
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid cursor'
+                }), 400
+            
+            if from_cache:
+                etag = content_etag(scope, messages, cursor_pagination)
+                response = not_modified(etag)
+                if response is not None:
+                    return response
+            
+            return history_response(etag, {
+                'messages': messages,
+                'pagination': cursor_pagination
+            }, include_users)
+        
+        # Small histories are served whole from the cache
+        cached = cached_page(scope, page, per_page)
+        if cached is not None:
+            messages, cached_pagination = cached
+            etag = content_etag(scope, messages, cached_pagination)
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            return history_response(etag, {
+                'messages': messages,
+                'pagination': cached_pagination
+            }, include_users)
+        
+        # Plain column rows: no Message objects to build and track for one response
+        messages_query = messages_query.with_entities(*MESSAGE_COLUMNS).order_by(
+            Message.timestamp.asc(), Message.id.asc()
+        )
         
         # Paginate results
         pagination = messages_query.paginate(
@@ -59,28 +129,136 @@ def get_chat_history(current_user, user_id):
             error_out=False
         )
         
-        messages = [message.to_dict() for message in pagination.items]
+        messages = [message_row_to_dict(row) for row in pagination.items]
+        
+        return history_response(etag, {
+            'messages': messages,
+            'pagination': {
+                'page': pagination.page,
+                'perPage': pagination.per_page,
+                'totalPages': pagination.pages,
+                'totalMessages': pagination.total,
+                'hasNext': pagination.has_next,
+                'hasPrev': pagination.has_prev
+            }
+        }, include_users)
+        
+    except Exception as e:
+        logger.error(f"Error fetching chat history: {type(e).__name__} - {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Server error while fetching messages'
+        }), 500
+
+
+@message_bp.route('/export/<int:user_id>', methods=['GET'])
+@limiter.limit("10 per 15 minutes")
+@token_required
+def export_chat_history(current_user, user_id):
+    """
+    Stream the whole chat history with another user as NDJSON
+    GET /api/messages/export/:userId
+    Query params:
+    - after_id: Resume after this message id (default: 0, from the start)
+    - gzip: true to gzip-compress the stream
+    """
+    try:
+        # Check if the other user exists
+        other_user = User.query.get(user_id)
+        if not other_user:
+            return jsonify({
+                'success': False,
+                'message': 'User not found'
+            }), 404
+        
+        try:
+            cursor = parse_cursor(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        if cursor is not None and cursor[0] != 'after':
+            return jsonify({
+                'success': False,
+                'message': 'Exports only support after_id'
+            }), 400
+        
+        compress = request.args.get('gzip', 'false').lower() == 'true'
+        conversation_key = Message.conversation_key_for(current_user.id, user_id)
+        try:
+            chunks = ndjson_export(
+                Message.query.filter_by(conversation_key=conversation_key),
+                after_id=cursor[1] if cursor else 0,
+                compress=compress
+            )
+        except LookupError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid cursor'
+            }), 400
+        
+        filename = f"conversation_{conversation_key.replace(':', '_')}.ndjson" + ('.gz' if compress else '')
+        return Response(
+            stream_with_context(chunks),
+            mimetype='application/gzip' if compress else 'application/x-ndjson',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+        
+    except Exception as e:
+        logger.error(f"Error exporting chat history: {type(e).__name__} - {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': 'Server error while exporting messages'
+        }), 500
+
+
+@message_bp.route('/search', methods=['GET'])
+@limiter.limit("100 per 15 minutes")
+@token_required
+def search(current_user):
+    """
+    Full-text search over the current user's conversations and rooms
+    GET /api/messages/search
+    Query params:
+    - q: Search words; messages must contain all of them
+    - per_page: Results per page (default: 20, max: 100)
+    - cursor: nextCursor of the previous page
+    """
+    try:
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+        if per_page < 1:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid pagination parameters'
+            }), 400
+        
+        try:
+            messages, pagination = search_messages(
+                request.args.get('q'),
+                visible_to(current_user.id),
+                request.args.get('cursor'),
+                per_page
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
         
         return jsonify({
             'success': True,
             'data': {
-                'messages': messages,
-                'pagination': {
-                    'page': pagination.page,
-                    'perPage': pagination.per_page,
-                    'totalPages': pagination.pages,
-                    'totalMessages': pagination.total,
-                    'hasNext': pagination.has_next,
-                    'hasPrev': pagination.has_prev
-                }
+                'messages': [message.to_dict() for message in messages],
+                'pagination': pagination
             }
         }), 200
         
     except Exception as e:
-        logger.error(f"Error fetching chat history: {type(e).__name__} - {str(e)}")
+        logger.error(f"Error searching messages: {type(e).__name__} - {str(e)}")
         return jsonify({
             'success': False,
-            'message': 'Server error while fetching messages'
+            'message': 'Server error while searching messages'
         }), 500
 
 
@@ -140,13 +318,17 @@ def edit_message(current_user, message_id):
         # Update message
         message.content = content
         message.edited_at = datetime.utcnow()
+        touch_history([message])
         db.session.commit()
         
+        message_dict = message.to_dict()
+        recent_events.record('edited', message_dict)
+        
         return jsonify({
             'success': True,
             'message': 'Message edited successfully',
             'data': {
-                'message': message.to_dict()
+                'message': message_dict
             }
         }), 200
         
@@ -192,13 +374,18 @@ def delete_message(current_user, message_id):
         
         # Soft delete - mark as deleted
         message.deleted_at = datetime.utcnow()
+        Conversation.record_delete(message)
+        touch_history([message])
         db.session.commit()
         
+        message_dict = message.to_dict()
+        recent_events.record('deleted', message_dict)
+        
         return jsonify({
             'success': True,
             'message': 'Message deleted successfully',
             'data': {
-                'message': message.to_dict()
+                'message': message_dict
             }
         }), 200
         
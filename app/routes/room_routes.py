@@ -2,12 +2,25 @@
 Room routes for group chat functionality
 """
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app import db, limiter
 from app.models.room import Room, RoomMember
 from app.models.user import User
-from app.models.message import Message
+from app.models.message import MESSAGE_COLUMNS, Message, message_row_to_dict
 from app.middleware.auth import token_required
+from app.replicas import replicas
+from app.utils.pagination import parse_cursor
+from app.utils.history_cache import cached_keyset_page, cached_page
+from app.utils.search import search_messages
+from app.utils.export import ndjson_export
+from app.utils.conditional import (
+    content_etag, history_response, not_modified, tagged, touch_members, version_etag
+)
+from app.utils.profiles import wants_users
+from app.retention import retention
+
+# Longest retention a room can set, about a hundred years
+MAX_RETENTION_DAYS = 36500
 
 room_bp = Blueprint('rooms', __name__)
 logger = logging.getLogger(__name__)
@@ -61,6 +74,7 @@ def create_room(current_user):
             user_id=current_user.id
         )
         db.session.add(member)
+        touch_members(room.id, [current_user.id], 'joined')
         db.session.commit()
         
         return jsonify({
@@ -83,12 +97,20 @@ def create_room(current_user):
 @room_bp.route('', methods=['GET'])
 @limiter.limit("100 per 15 minutes")
 @token_required
+@replicas.read_only
 def get_user_rooms(current_user):
     """
     Get all rooms the current user is a member of
     GET /api/rooms
+    Responses carry an ETag for If-None-Match.
     """
     try:
+        # Room details never change, so the list only changes when the user joins or leaves
+        etag = version_etag(f"rooms_of_user_{current_user.id}", current_user.rooms_version)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        
         # Get all room memberships for the user
         memberships = RoomMember.query.filter_by(user_id=current_user.id).all()
         room_ids = [m.room_id for m in memberships]
@@ -96,12 +118,12 @@ def get_user_rooms(current_user):
         # Get room details
         rooms = Room.query.filter(Room.id.in_(room_ids)).all() if room_ids else []
         
-        return jsonify({
+        return tagged((jsonify({
             'success': True,
             'data': {
                 'rooms': [room.to_dict() for room in rooms]
             }
-        }), 200
+        }), 200), etag)
         
     except Exception as e:
         logger.error(f"Error fetching rooms: {type(e).__name__}")
@@ -114,10 +136,12 @@ def get_user_rooms(current_user):
 @room_bp.route('/<int:room_id>', methods=['GET'])
 @limiter.limit("100 per 15 minutes")
 @token_required
+@replicas.read_only
 def get_room(current_user, room_id):
     """
     Get details of a specific room
     GET /api/rooms/:roomId
+    Responses carry an ETag for If-None-Match.
     """
     try:
         # Check if room exists
@@ -140,19 +164,24 @@ def get_room(current_user, room_id):
                 'message': 'Not authorized to access this room'
             }), 403
         
+        etag = version_etag(f"room_{room.id}", room.version)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        
         # Get members
         members = RoomMember.query.filter_by(room_id=room_id).all()
         member_users = User.query.filter(
             User.id.in_([m.user_id for m in members])
         ).all()
         
-        return jsonify({
+        return tagged((jsonify({
             'success': True,
             'data': {
                 'room': room.to_dict(),
                 'members': [user.to_dict() for user in member_users]
             }
-        }), 200
+        }), 200), etag)
         
     except Exception as e:
         logger.error(f"Error fetching room: {type(e).__name__}")
@@ -233,6 +262,7 @@ def add_room_member(current_user, room_id):
             user_id=user_id
         )
         db.session.add(member)
+        touch_members(room_id, [user_to_add.id], 'joined')
         db.session.commit()
         
         return jsonify({
@@ -297,6 +327,7 @@ def remove_room_member(current_user, room_id, user_id):
             }), 400
         
         db.session.delete(membership)
+        touch_members(room_id, [user_id], 'left')
         db.session.commit()
         
         return jsonify({
@@ -313,9 +344,73 @@ def remove_room_member(current_user, room_id, user_id):
         }), 500
 
 
+@room_bp.route('/<int:room_id>/retention', methods=['PUT'])
+@limiter.limit("100 per 15 minutes")
+@token_required
+def set_room_retention(current_user, room_id):
+    """
+    Set how long a room keeps its messages
+    PUT /api/rooms/:roomId/retention
+    Body: retentionDays, days to keep messages (0: forever), or null to
+    follow the server default. Only the room creator can change it.
+    """
+    try:
+        data = request.get_json(silent=True)
+        
+        if not isinstance(data, dict) or 'retentionDays' not in data:
+            return jsonify({
+                'success': False,
+                'message': 'retentionDays is required'
+            }), 400
+        
+        retention_days = data['retentionDays']
+        if retention_days is not None and (
+            isinstance(retention_days, bool) or not isinstance(retention_days, int)
+            or not 0 <= retention_days <= MAX_RETENTION_DAYS
+        ):
+            return jsonify({
+                'success': False,
+                'message': f'retentionDays must be null or a number of days from 0 to {MAX_RETENTION_DAYS}'
+            }), 400
+        
+        room = Room.query.get(room_id)
+        if not room:
+            return jsonify({
+                'success': False,
+                'message': 'Room not found'
+            }), 404
+        
+        if room.creator_id != current_user.id:
+            return jsonify({
+                'success': False,
+                'message': 'Only the room creator can change retention'
+            }), 403
+        
+        room.retention_days = retention_days
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'roomId': room.id,
+                'retentionDays': room.retention_days,
+                'effectiveRetentionDays': retention.room_retention(room.retention_days)
+            }
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error setting room retention: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Server error while setting retention'
+        }), 500
+
+
 @room_bp.route('/<int:room_id>/messages', methods=['GET'])
 @limiter.limit("100 per 15 minutes")
 @token_required
+@replicas.read_only
 def get_room_messages(current_user, room_id):
     """
     Get messages in a room
@@ -323,6 +418,11 @@ def get_room_messages(current_user, room_id):
     Query params:
     - page: Page number (default: 1)
     - per_page: Results per page (default: 50, max: 100)
+    - before_id / after_id: Cursor mode; page before or after this message id
+      (before_id=0: newest page, after_id=0: oldest page)
+    - include: users to add a users table with the profiles of the message senders and receivers
+    Responses carry an ETag; send it back in If-None-Match to get
+    304 Not Modified while the room's messages are unchanged.
     """
     try:
         # Check if room exists
@@ -358,7 +458,64 @@ def get_room_messages(current_user, room_id):
         # Query messages for the room
         messages_query = Message.query.filter_by(
             room_id=room_id
-        ).order_by(Message.timestamp.asc())
+        )
+        scope = f"room_{room_id}"
+        
+        try:
+            cursor = parse_cursor(request.args)
+            include_users = wants_users(request.args.get('include'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        # Unchanged since the client's copy: answer before loading any message
+        etag = version_etag(scope, room.history_version)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+        
+        if cursor is not None:
+            # Cursor mode: history cache or an index seek, no total count
+            try:
+                messages, cursor_pagination, from_cache = cached_keyset_page(
+                    messages_query, scope, *cursor, per_page
+                )
+            except LookupError:
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid cursor'
+                }), 400
+            
+            if from_cache:
+                etag = content_etag(scope, messages, cursor_pagination)
+                response = not_modified(etag)
+                if response is not None:
+                    return response
+            
+            return history_response(etag, {
+                'messages': messages,
+                'pagination': cursor_pagination
+            }, include_users)
+        
+        # Small histories are served whole from the cache
+        cached = cached_page(scope, page, per_page)
+        if cached is not None:
+            messages, cached_pagination = cached
+            etag = content_etag(scope, messages, cached_pagination)
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            return history_response(etag, {
+                'messages': messages,
+                'pagination': cached_pagination
+            }, include_users)
+        
+        # Plain column rows: no Message objects to build and track for one response
+        messages_query = messages_query.with_entities(*MESSAGE_COLUMNS).order_by(
+            Message.timestamp.asc(), Message.id.asc()
+        )
         
         # Paginate results
         pagination = messages_query.paginate(
@@ -367,26 +524,165 @@ def get_room_messages(current_user, room_id):
             error_out=False
         )
         
-        messages = [message.to_dict() for message in pagination.items]
+        messages = [message_row_to_dict(row) for row in pagination.items]
+        
+        return history_response(etag, {
+            'messages': messages,
+            'pagination': {
+                'page': pagination.page,
+                'perPage': pagination.per_page,
+                'totalPages': pagination.pages,
+                'totalMessages': pagination.total,
+                'hasNext': pagination.has_next,
+                'hasPrev': pagination.has_prev
+            }
+        }, include_users)
+        
+    except Exception as e:
+        logger.error(f"Error fetching room messages: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Server error while fetching messages'
+        }), 500
+
+
+@room_bp.route('/<int:room_id>/export', methods=['GET'])
+@limiter.limit("10 per 15 minutes")
+@token_required
+def export_room_messages(current_user, room_id):
+    """
+    Stream every message of a room as NDJSON
+    GET /api/rooms/:roomId/export
+    Query params:
+    - after_id: Resume after this message id (default: 0, from the start)
+    - gzip: true to gzip-compress the stream
+    """
+    try:
+        # Check if room exists
+        room = Room.query.get(room_id)
+        if not room:
+            return jsonify({
+                'success': False,
+                'message': 'Room not found'
+            }), 404
+        
+        # Check if user is a member
+        membership = RoomMember.query.filter_by(
+            room_id=room_id,
+            user_id=current_user.id
+        ).first()
+        
+        if not membership:
+            return jsonify({
+                'success': False,
+                'message': 'Not authorized to access this room'
+            }), 403
+        
+        try:
+            cursor = parse_cursor(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        if cursor is not None and cursor[0] != 'after':
+            return jsonify({
+                'success': False,
+                'message': 'Exports only support after_id'
+            }), 400
+        
+        compress = request.args.get('gzip', 'false').lower() == 'true'
+        try:
+            chunks = ndjson_export(
+                Message.query.filter_by(room_id=room_id),
+                after_id=cursor[1] if cursor else 0,
+                compress=compress
+            )
+        except LookupError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid cursor'
+            }), 400
+        
+        filename = f"room_{room_id}.ndjson" + ('.gz' if compress else '')
+        return Response(
+            stream_with_context(chunks),
+            mimetype='application/gzip' if compress else 'application/x-ndjson',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+        
+    except Exception as e:
+        logger.error(f"Error exporting room messages: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Server error while exporting messages'
+        }), 500
+
+
+@room_bp.route('/<int:room_id>/messages/search', methods=['GET'])
+@limiter.limit("100 per 15 minutes")
+@token_required
+def search_room_messages(current_user, room_id):
+    """
+    Full-text search over the messages of a room
+    GET /api/rooms/:roomId/messages/search
+    Query params:
+    - q: Search words; messages must contain all of them
+    - per_page: Results per page (default: 20, max: 100)
+    - cursor: nextCursor of the previous page
+    """
+    try:
+        # Check if room exists
+        room = Room.query.get(room_id)
+        if not room:
+            return jsonify({
+                'success': False,
+                'message': 'Room not found'
+            }), 404
+        
+        # Check if user is a member
+        membership = RoomMember.query.filter_by(
+            room_id=room_id,
+            user_id=current_user.id
+        ).first()
+        
+        if not membership:
+            return jsonify({
+                'success': False,
+                'message': 'Not authorized to access this room'
+            }), 403
+        
+        per_page = min(request.args.get('per_page', 20, type=int), 100)
+        if per_page < 1:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid pagination parameters'
+            }), 400
+        
+        try:
+            messages, pagination = search_messages(
+                request.args.get('q'),
+                Message.room_id == room_id,
+                request.args.get('cursor'),
+                per_page
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
         
         return jsonify({
             'success': True,
             'data': {
-                'messages': messages,
-                'pagination': {
-                    'page': pagination.page,
-                    'perPage': pagination.per_page,
-                    'totalPages': pagination.pages,
-                    'totalMessages': pagination.total,
-                    'hasNext': pagination.has_next,
-                    'hasPrev': pagination.has_prev
-                }
+                'messages': [message.to_dict() for message in messages],
+                'pagination': pagination
             }
         }), 200
         
     except Exception as e:
-        logger.error(f"Error fetching room messages: {type(e).__name__}")
+        logger.error(f"Error searching room messages: {type(e).__name__}")
         return jsonify({
             'success': False,
-            'message': 'Server error while fetching messages'
+            'message': 'Server error while searching messages'
         }), 500
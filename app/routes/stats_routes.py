@@ -0,0 +1,82 @@
+"""
+Operational statistics routes
+"""
+import logging
+from flask import Blueprint, jsonify
+from app.middleware.auth import token_required
+
+stats_bp = Blueprint('stats', __name__)
+logger = logging.getLogger(__name__)
+
+
+@stats_bp.route('/sockets', methods=['GET'])
+@token_required
+def get_socket_stats(current_user):
+    """
+    Get outbound queue depths and slow-consumer counters for this process
+    GET /api/stats/sockets
+    """
+    try:
+        from app.websocket.backpressure import outbound
+        from app.websocket.handlers import connections
+        
+        stats = outbound.stats()
+        stats['authenticatedSockets'] = len(connections)
+        
+        return jsonify({
+            'success': True,
+            'stats': stats
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error getting socket stats: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to get socket stats'
+        }), 500
+
+
+@stats_bp.route('/history-cache', methods=['GET'])
+@token_required
+def get_history_cache_stats(current_user):
+    """
+    Get hit and miss counters and memory use of the history cache for this process
+    GET /api/stats/history-cache
+    """
+    try:
+        from app.utils.history_cache import history_cache
+        
+        return jsonify({
+            'success': True,
+            'stats': history_cache.stats()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error getting history cache stats: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to get history cache stats'
+        }), 500
+
+
+@stats_bp.route('/retention', methods=['GET'])
+@token_required
+def get_retention_stats(current_user):
+    """
+    Get the retention policies and rows reclaimed by the latest runs of this process
+    GET /api/stats/retention
+    """
+    try:
+        from app.retention import retention
+        
+        return jsonify({
+            'success': True,
+            'stats': retention.stats()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error getting retention stats: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Failed to get retention stats'
+        }), 500
@@ -0,0 +1,57 @@
+"""
+Delta sync routes
+"""
+import logging
+from flask import Blueprint, request, jsonify
+from app import limiter
+from app.middleware.auth import token_required
+from app.utils.changes import MAX_SYNC_LIMIT, changes_since
+
+sync_bp = Blueprint('sync', __name__)
+logger = logging.getLogger(__name__)
+
+
+@sync_bp.route('', methods=['GET'])
+@limiter.limit("100 per 15 minutes")
+@token_required
+def sync(current_user):
+    """
+    Get the messages and room memberships that changed since a change sequence number
+    GET /api/sync
+    Query params:
+    - since: nextSince of the previous sync, 0 for a full sync (default: 0)
+    - limit: Most changes to return (default: 100, max: 500)
+    Messages come back whole, including edits and deletes (deletedAt set);
+    purges name conversations and rooms whose messages older than a time
+    were removed by retention. Every change carries its changeSeq, the order
+    to apply them in. Keep syncing with nextSince while hasMore is true.
+    """
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = min(request.args.get('limit', 100, type=int), MAX_SYNC_LIMIT)
+        
+        if since < 0 or limit < 1:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid sync parameters'
+            }), 400
+        
+        messages, memberships, purges, rooms, sync_info = changes_since(current_user.id, since, limit)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'messages': [dict(message.to_dict(), changeSeq=message.change_seq) for message in messages],
+                'memberships': [change.to_dict() for change in memberships],
+                'purges': [purge.to_dict() for purge in purges],
+                'rooms': [room.to_dict() for room in rooms],
+                'sync': sync_info
+            }
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error syncing changes: {type(e).__name__}")
+        return jsonify({
+            'success': False,
+            'message': 'Server error while syncing changes'
+        }), 500
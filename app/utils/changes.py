@@ -0,0 +1,117 @@
+"""
+Change feed for delta sync
+
+Every message create, edit and soft delete stamps the message with the next
+number of the global change sequence (messages.change_seq), and every room
+join or leave is logged with one (room_membership_changes), as is every
+removal of expired history by retention (history_purges). A client that
+remembers the highest number it has seen asks only for what changed since:
+one range read per conversation and room on the (scope, change_seq)
+indexes, however old the changed messages are.
+
+Numbers come from the single change_sequence row, advanced as the last
+statement of each writing transaction, so they become visible in commit
+order. With SQLite every write is serialized anyway; on other engines
+writers queue on that row only from the allocation to their commit.
+"""
+from app import db
+from app.models.change import ChangeSequence, HistoryPurge, MembershipChange
+from app.models.conversation import Conversation, ConversationMember
+from app.models.message import Message
+from app.models.room import Room, RoomMember
+
+# Most changes returned by one sync request
+MAX_SYNC_LIMIT = 500
+
+
+def stamp_messages(messages):
+    """Give changed messages the next change sequence numbers, in the caller's transaction"""
+    if not messages:
+        return
+    first = ChangeSequence.allocate(db.session, len(messages))
+    for offset, message in enumerate(messages):
+        message.change_seq = first + offset
+
+
+def record_membership(room_id, user_ids, kind):
+    """Log users joining ('joined') or leaving ('left') a room, in the caller's transaction"""
+    user_ids = sorted(user_ids)
+    first = ChangeSequence.allocate(db.session, len(user_ids))
+    db.session.add_all([
+        MembershipChange(change_seq=first + offset, room_id=room_id, user_id=user_id, kind=kind)
+        for offset, user_id in enumerate(user_ids)
+    ])
+
+
+def record_purge(before, conversation_key=None, room_id=None):
+    """Log that a conversation or room lost its messages older than before, in the caller's transaction"""
+    db.session.add(HistoryPurge(
+        change_seq=ChangeSequence.allocate(db.session),
+        conversation_key=conversation_key,
+        room_id=room_id,
+        purged_before=before
+    ))
+
+
+def head():
+    """Latest change sequence number"""
+    return db.session.execute(
+        db.select(ChangeSequence.value).where(ChangeSequence.id == 1)
+    ).scalar() or 0
+
+
+def changes_since(user_id, since, limit):
+    """
+    Return the changes a user can see after a change sequence number
+    Returns (messages, membership changes, history purges, rooms, sync
+    metadata). Messages and purges of the user's conversations and current
+    rooms and membership changes of the user and of their rooms are merged
+    in sequence order, at most limit of them; nextSince continues after the
+    last one returned. rooms holds the details of the rooms the user joined
+    in this page.
+    """
+    current_head = head()
+    conversation_keys = db.select(Conversation.key).join(
+        ConversationMember, ConversationMember.conversation_id == Conversation.id
+    ).where(ConversationMember.user_id == user_id)
+    room_ids = db.select(RoomMember.room_id).where(RoomMember.user_id == user_id)
+
+    # Each source returns its oldest changes, so the merged head is the overall oldest
+    direct = Message.query.filter(
+        Message.conversation_key.in_(conversation_keys), Message.change_seq > since
+    ).order_by(Message.change_seq).limit(limit + 1).all()
+    in_rooms = Message.query.filter(
+        Message.room_id.in_(room_ids), Message.change_seq > since
+    ).order_by(Message.change_seq).limit(limit + 1).all()
+    memberships = MembershipChange.query.filter(
+        db.or_(MembershipChange.user_id == user_id, MembershipChange.room_id.in_(room_ids)),
+        MembershipChange.change_seq > since
+    ).order_by(MembershipChange.change_seq).limit(limit + 1).all()
+    purges = HistoryPurge.query.filter(
+        db.or_(HistoryPurge.conversation_key.in_(conversation_keys), HistoryPurge.room_id.in_(room_ids)),
+        HistoryPurge.change_seq > since
+    ).order_by(HistoryPurge.change_seq).limit(limit + 1).all()
+
+    changes = sorted(direct + in_rooms + memberships + purges, key=lambda change: change.change_seq)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    messages = [change for change in changes if isinstance(change, Message)]
+    membership_changes = [change for change in changes if isinstance(change, MembershipChange)]
+    history_purges = [change for change in changes if isinstance(change, HistoryPurge)]
+    joined = {change.room_id for change in membership_changes
+              if change.user_id == user_id and change.kind == 'joined'}
+    rooms = Room.query.filter(Room.id.in_(joined)).all() if joined else []
+
+    next_since = changes[-1].change_seq if changes else since
+    if not has_more:
+        # Every number up to the head read first was committed before the
+        # queries ran, so the rest of that range is nothing this user can see
+        next_since = max(next_since, current_head)
+
+    return messages, membership_changes, history_purges, rooms, {
+        'since': since,
+        'nextSince': next_since,
+        'hasMore': has_more,
+        'head': current_head
+    }
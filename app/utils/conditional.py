@@ -0,0 +1,154 @@
+"""
+Conditional GET (ETag / If-None-Match) for history and room endpoints
+
+Responses carry an ETag built from a version counter stored with the
+resource, so a client polling an unchanged resource gets 304 Not Modified
+after the lookups the endpoint needs for access control, before any
+message or member row is loaded:
+- conversations.history_version and rooms.history_version advance in the
+  same transaction as every message create, edit and delete
+- rooms.version advances when the member list changes, including a
+  member's profile
+- users.rooms_version advances when the user joins or leaves a room
+
+The same calls stamp the change sequence used by delta sync
+(app/utils/changes.py), so every write that moves a version is also synced.
+
+Pages answered from the history cache are tagged from the cached messages
+instead. The cache follows writes after they commit, so tagging its content
+with the current database version could pin a stale page behind a tag that
+never changes again. Pages with the include=users side table add its
+profiles to the tag, as usernames change without a new history version.
+"""
+import hashlib
+from flask import jsonify, make_response, request
+from app import db
+from app.utils import changes
+from app.utils.profiles import users_for
+from app.models.conversation import Conversation
+from app.models.room import Room, RoomMember
+from app.models.user import User
+
+
+def touch_history(messages):
+    """
+    Advance the history version of the conversations and rooms of changed messages
+    Runs in the caller's transaction, after Conversation.record_messages()
+    created any new conversation. The messages get their change sequence
+    numbers last, as the sequence row must be the last lock taken before
+    commit.
+    """
+    touch_scopes(
+        {message.conversation_key for message in messages if message.conversation_key is not None},
+        {message.room_id for message in messages if message.room_id is not None}
+    )
+    changes.stamp_messages(messages)
+
+
+def touch_scopes(conversation_keys, room_ids):
+    """
+    Advance the history version of conversations and rooms
+    Keys are updated in sorted order so concurrent writers lock rows in the
+    same order.
+    """
+    if conversation_keys:
+        conversations = Conversation.__table__
+        db.session.execute(
+            conversations.update()
+            .where(conversations.c.key.in_(sorted(conversation_keys)))
+            .values(history_version=conversations.c.history_version + 1)
+        )
+    if room_ids:
+        rooms = Room.__table__
+        db.session.execute(
+            rooms.update()
+            .where(rooms.c.id.in_(sorted(room_ids)))
+            .values(history_version=rooms.c.history_version + 1)
+        )
+
+
+def touch_members(room_id, user_ids, kind):
+    """
+    Advance the member list version of a room and the room list version of users who joined or left it
+    kind ('joined' or 'left') is recorded in the membership change log.
+    """
+    rooms = Room.__table__
+    users = User.__table__
+    db.session.execute(rooms.update().where(rooms.c.id == room_id).values(version=rooms.c.version + 1))
+    db.session.execute(
+        users.update()
+        .where(users.c.id.in_(sorted(user_ids)))
+        .values(rooms_version=users.c.rooms_version + 1)
+    )
+    changes.record_membership(room_id, user_ids, kind)
+
+
+def touch_profile(user_id):
+    """Advance the member list version of every room of a user whose profile changed"""
+    rooms = Room.__table__
+    db.session.execute(
+        rooms.update()
+        .where(rooms.c.id.in_(db.select(RoomMember.room_id).where(RoomMember.user_id == user_id)))
+        .values(version=rooms.c.version + 1)
+    )
+
+
+def conversation_version(conversation_key):
+    """History version of a direct conversation; 0 before its first message"""
+    return db.session.query(Conversation.history_version).filter_by(key=conversation_key).scalar() or 0
+
+
+def version_etag(resource, version):
+    return f'{resource}-v{version}'
+
+
+def content_etag(resource, message_dicts, pagination):
+    """ETag of a history page from its messages and pagination, for pages served from the cache"""
+    digest = hashlib.blake2b(digest_size=12)
+    for message_dict in message_dicts:
+        # Every edit sets a new editedAt, so content does not need hashing
+        digest.update(f"{message_dict['id']}|{message_dict['editedAt']}|{message_dict['deletedAt']}\n".encode())
+    digest.update(repr(sorted(pagination.items())).encode())
+    return f'{resource}-c{digest.hexdigest()}'
+
+
+def users_etag(etag, users):
+    """ETag of a page with an include=users side table: the page's tag plus the profiles"""
+    digest = hashlib.blake2b(digest_size=8)
+    for profile in users:
+        digest.update(f"{profile['id']}|{profile['username']}\n".encode())
+    return f'{etag}-u{digest.hexdigest()}'
+
+
+def history_response(etag, data, include_users=False):
+    """
+    Tagged 200 response of a history page, or 304 when the client has it
+    include_users adds the users side table to data and its profiles to
+    the ETag, so that check waits until the page is loaded.
+    """
+    if include_users:
+        data['users'] = users_for(data['messages'])
+        etag = users_etag(etag, data['users'])
+        response = not_modified(etag)
+        if response is not None:
+            return response
+    return tagged((jsonify({'success': True, 'data': data}), 200), etag)
+
+
+def not_modified(etag):
+    """Return a 304 response when If-None-Match matches etag, else None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return tagged(make_response('', 304), etag)
+
+
+def tagged(response, etag):
+    """
+    Attach an ETag to a view's return value
+    no-cache makes clients revalidate every time instead of reusing a
+    stored response without asking.
+    """
+    response = make_response(response)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
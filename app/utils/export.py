@@ -0,0 +1,46 @@
+"""
+Streaming NDJSON export of a message history
+
+The export walks the history in (timestamp, id) order with the same keyset
+pages as cursor pagination, one short query per batch, and yields one JSON
+line per message. Memory use does not depend on the size of the history,
+and no read transaction stays open while the client downloads, so writers
+are never blocked (SQLite without WAL would otherwise stall every commit).
+"""
+import json
+import zlib
+from app import db
+from app.models.message import message_row_to_dict
+from app.utils.pagination import keyset_page
+
+# Messages read per query
+EXPORT_BATCH_SIZE = 1000
+
+
+def ndjson_export(query, after_id=0, compress=False, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Return a generator of NDJSON chunks for every message of a history query
+    after_id resumes the export after that message (0: from the start).
+    With compress the chunks form one gzip stream, flushed after every
+    batch so the client receives data as it is read. Raises LookupError
+    right away when after_id is not part of the history.
+    """
+    messages, pagination = keyset_page(query, 'after', after_id, batch_size)
+
+    def generate(messages, pagination):
+        compressor = zlib.compressobj(wbits=31) if compress else None
+        while True:
+            chunk = ''.join(json.dumps(message_row_to_dict(message)) + '\n' for message in messages).encode()
+            # End the read transaction between batches
+            db.session.rollback()
+            if compressor is not None:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if chunk:
+                yield chunk
+            if not pagination['hasMore']:
+                break
+            messages, pagination = keyset_page(query, 'after', pagination['nextCursor'], batch_size)
+        if compressor is not None:
+            yield compressor.flush()
+
+    return generate(messages, pagination)
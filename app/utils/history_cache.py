@@ -0,0 +1,355 @@
+"""
+Bounded in-memory cache of the newest messages per conversation and room
+
+Each scope (a direct conversation or a room) keeps its most recent messages,
+already serialized with Message.to_dict(), in (timestamp, id) order. The
+newest-page and cursor reads of the history endpoints are answered from it
+when the requested range is cached; everything else falls through to SQL.
+Scopes are evicted least-recently-used first once the estimated size of all
+cached messages exceeds HISTORY_CACHE_MAX_BYTES.
+
+The cache follows writes through the recent-events stream of the catch-up
+buffer, which every server process receives, so creates, edits and deletes
+from socket handlers and REST routes on any process keep it current. Scopes
+that lose messages to retention are dropped on every process through the
+message bus.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+from app import bus, socketio
+from app.models.message import Message, message_row_to_dict
+from app.replicas import replicas
+from app.utils.pagination import keyset_page
+
+logger = logging.getLogger(__name__)
+
+# Estimated per-message overhead of a cached dict on top of its content
+MESSAGE_OVERHEAD_BYTES = 600
+
+# Events kept to replay onto scopes loaded while those events arrived
+REPLAY_BUFFER_SIZE = 4096
+
+
+def message_size(message_dict):
+    """Estimate the memory held by one cached message dictionary"""
+    return MESSAGE_OVERHEAD_BYTES + len(message_dict['content'] or '')
+
+
+def sort_key(message_dict):
+    # ISO 8601 strings from to_dict() sort chronologically
+    return message_dict['timestamp'] or '', message_dict['id']
+
+
+class CachedScope:
+    """Newest messages of one conversation or room"""
+
+    __slots__ = ('messages', 'has_older', 'size')
+
+    def __init__(self, messages, has_older):
+        self.messages = messages
+        self.has_older = has_older
+        self.size = sum(message_size(message_dict) for message_dict in messages)
+
+    def position(self, message_id):
+        for index, message_dict in enumerate(self.messages):
+            if message_dict['id'] == message_id:
+                return index
+        return None
+
+
+class HistoryCache:
+    """Per-scope ring buffers of serialized messages with global LRU eviction"""
+
+    def __init__(self):
+        self.enabled = False
+        self.capacity = 200
+        self.max_bytes = 64 * 1024 * 1024
+        self._scopes = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._replay = deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._listening = False
+        self._purge_listener = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app, events):
+        """Read cache limits from the config and follow the recent-events stream"""
+        self.enabled = app.config.get('HISTORY_CACHE_ENABLED', True)
+        self.capacity = max(1, app.config.get('HISTORY_CACHE_MESSAGES_PER_SCOPE', 200))
+        self.max_bytes = max(0, app.config.get('HISTORY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+        self.clear()
+        if not self._listening:
+            events.add_listener(self.record)
+            self._listening = True
+        if bus.shared and self._purge_listener is None:
+            self._purge_listener = socketio.start_background_task(self._listen_purges)
+
+    @staticmethod
+    def scope_for(message_dict):
+        """Return the cache scope of a message"""
+        if message_dict['roomId']:
+            return f"room_{message_dict['roomId']}"
+        return f"conversation_{Message.conversation_key_for(message_dict['senderId'], message_dict['receiverId'])}"
+
+    def clear(self):
+        """Drop every cached scope"""
+        with self._lock:
+            self._scopes.clear()
+            self._size = 0
+            self._replay.clear()
+
+    def invalidate(self, scope):
+        """Drop one scope, e.g. after writes that bypass the recent-events stream"""
+        with self._lock:
+            cached = self._scopes.pop(scope, None)
+            if cached is not None:
+                self._size -= cached.size
+
+    def purge(self, scope):
+        """Drop a scope on every process after messages were removed from it"""
+        # Locally first, so this process stops serving the removed messages right away
+        self._purge(scope)
+        if bus.shared:
+            bus.publish('history_purges', json.dumps(scope))
+
+    def _listen_purges(self):
+        for data in bus.subscribe('history_purges'):
+            try:
+                self._purge(json.loads(data))
+            except Exception as e:
+                logger.error(f"Invalid history purge on bus: {type(e).__name__}")
+
+    def _purge(self, scope):
+        with self._lock:
+            # Recorded so a fill() that read the scope before the purge is dropped
+            self._sequence += 1
+            self._replay.append((self._sequence, scope, 'purged', None))
+            cached = self._scopes.pop(scope, None)
+            if cached is not None:
+                self._size -= cached.size
+
+    def snapshot(self):
+        """Return a token to pass to fill() taken before reading a scope from the database"""
+        with self._lock:
+            return self._sequence
+
+    def fill(self, scope, messages, has_older, token):
+        """
+        Cache the newest messages of a scope, oldest first
+        has_older tells whether the scope holds messages older than these.
+        Events recorded since snapshot() returned token are replayed so a
+        write that raced the database read is not lost; if too many events
+        went by to replay them, nothing is cached.
+        """
+        if not self.enabled:
+            return
+        if len(messages) > self.capacity:
+            messages, has_older = messages[-self.capacity:], True
+        cached = CachedScope(list(messages), has_older)
+        with self._lock:
+            missed = self._sequence - token
+            if missed > len(self._replay):
+                return
+            for _, event_scope, kind, message_dict in list(self._replay)[len(self._replay) - missed:]:
+                if event_scope != scope:
+                    continue
+                if kind == 'purged':
+                    return
+                self._apply(cached, kind, message_dict)
+            previous = self._scopes.pop(scope, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._scopes[scope] = cached
+            self._size += cached.size
+            self._evict()
+
+    def record(self, kind, message_dict):
+        """Apply a 'created', 'edited' or 'deleted' event to its scope if cached"""
+        if not self.enabled:
+            return
+        scope = self.scope_for(message_dict)
+        with self._lock:
+            self._sequence += 1
+            self._replay.append((self._sequence, scope, kind, message_dict))
+            cached = self._scopes.get(scope)
+            if cached is None:
+                return
+            self._size += self._apply(cached, kind, message_dict)
+            self._scopes.move_to_end(scope)
+            self._evict()
+
+    def _apply(self, cached, kind, message_dict):
+        """Apply an event to a scope and return its change in size"""
+        before = cached.size
+        index = cached.position(message_dict['id'])
+        if index is not None:
+            cached.size += message_size(message_dict) - message_size(cached.messages[index])
+            cached.messages[index] = message_dict
+        elif kind == 'created':
+            self._insert(cached, message_dict)
+        return cached.size - before
+
+    def _insert(self, cached, message_dict):
+        messages = cached.messages
+        key = sort_key(message_dict)
+        index = len(messages)
+        while index > 0 and sort_key(messages[index - 1]) > key:
+            index -= 1
+        if index == 0 and cached.has_older:
+            # Older than everything cached: it belongs to the uncached part
+            return
+        messages.insert(index, message_dict)
+        cached.size += message_size(message_dict)
+        while len(messages) > self.capacity:
+            cached.size -= message_size(messages.pop(0))
+            cached.has_older = True
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._scopes:
+            _, cached = self._scopes.popitem(last=False)
+            self._size -= cached.size
+            self.evictions += 1
+
+    def keyset_page(self, scope, direction, cursor, per_page):
+        """
+        Answer a cursor read like app.utils.pagination.keyset_page(), with
+        message dictionaries, or return None when the range is not cached
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            page = self._keyset_page(scope, direction, cursor, per_page)
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._scopes.move_to_end(scope)
+            return page
+
+    def _keyset_page(self, scope, direction, cursor, per_page):
+        cached = self._scopes.get(scope)
+        if cached is None:
+            return None
+        messages = cached.messages
+
+        if direction == 'before':
+            end = len(messages) if cursor == 0 else cached.position(cursor)
+            if end is None:
+                return None
+            start = max(0, end - per_page)
+            if start == 0 and end - start < per_page and cached.has_older:
+                return None
+            has_more = start > 0 or cached.has_older
+            page = messages[start:end]
+            next_cursor = page[0]['id'] if has_more and page else None
+        else:
+            if cursor == 0:
+                if cached.has_older:
+                    return None
+                start = 0
+            else:
+                start = cached.position(cursor)
+                if start is None:
+                    return None
+                start += 1
+            page = messages[start:start + per_page]
+            has_more = start + per_page < len(messages)
+            next_cursor = page[-1]['id'] if has_more else None
+
+        return page, {
+            'perPage': per_page,
+            'direction': direction,
+            'hasMore': has_more,
+            'nextCursor': next_cursor
+        }
+
+    def complete_history(self, scope):
+        """Return every message of a scope when all of them are cached, else None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            cached = self._scopes.get(scope)
+            if cached is None or cached.has_older:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._scopes.move_to_end(scope)
+            return list(cached.messages)
+
+    def stats(self):
+        """Hit and miss counters and memory use"""
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'scopes': len(self._scopes),
+            'messages': sum(len(cached.messages) for cached in list(self._scopes.values())),
+            'estimatedBytes': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'limits': {
+                'messagesPerScope': self.capacity,
+                'maxBytes': self.max_bytes
+            }
+        }
+
+
+history_cache = HistoryCache()
+
+
+def cached_keyset_page(query, scope, direction, cursor, per_page):
+    """
+    Cursor read through the history cache
+    Returns (message dictionaries, pagination, whether the page was already
+    cached). A miss on the newest page loads the newest messages of the
+    scope into the cache; other misses read the requested page from the
+    database.
+    """
+    page = history_cache.keyset_page(scope, direction, cursor, per_page)
+    if page is not None:
+        return (*page, True)
+
+    if direction == 'before' and cursor == 0 and history_cache.enabled:
+        token = history_cache.snapshot()
+        # A lagging replica would leave the cache without messages it never replays
+        with replicas.use_primary():
+            messages, pagination = keyset_page(query, 'before', 0, max(per_page, history_cache.capacity))
+        message_dicts = [message_row_to_dict(message) for message in messages]
+        history_cache.fill(scope, message_dicts, pagination['hasMore'], token)
+        page_dicts = message_dicts[-per_page:]
+        has_more = len(message_dicts) > per_page or pagination['hasMore']
+        return page_dicts, {
+            'perPage': per_page,
+            'direction': direction,
+            'hasMore': has_more,
+            'nextCursor': page_dicts[0]['id'] if has_more and page_dicts else None
+        }, False
+
+    messages, pagination = keyset_page(query, direction, cursor, per_page)
+    return [message_row_to_dict(message) for message in messages], pagination, False
+
+
+def cached_page(scope, page, per_page):
+    """
+    Page-mode read served from the cache when the whole history is cached
+    Returns (message dictionaries, pagination) or None.
+    """
+    messages = history_cache.complete_history(scope)
+    if messages is None:
+        return None
+    total = len(messages)
+    pages = (total + per_page - 1) // per_page
+    return messages[(page - 1) * per_page:page * per_page], {
+        'page': page,
+        'perPage': per_page,
+        'totalPages': pages,
+        'totalMessages': total,
+        'hasNext': page < pages,
+        'hasPrev': page > 1
+    }
@@ -0,0 +1,67 @@
+"""
+Keyset (cursor) pagination for message history
+"""
+from app import db
+from app.models.message import MESSAGE_COLUMNS, Message
+
+
+def parse_cursor(args):
+    """
+    Read the before_id / after_id query parameters
+    Returns (direction, message id) with direction 'before' or 'after', or
+    None when neither is given. Raises ValueError for invalid values.
+    """
+    before_id = args.get('before_id')
+    after_id = args.get('after_id')
+    if before_id is None and after_id is None:
+        return None
+    if before_id is not None and after_id is not None:
+        raise ValueError('Use only one of before_id and after_id')
+    try:
+        cursor = int(before_id if before_id is not None else after_id)
+    except ValueError:
+        raise ValueError('Cursor must be an integer')
+    if cursor < 0:
+        raise ValueError('Cursor must not be negative')
+    return ('before' if before_id is not None else 'after'), cursor
+
+
+def keyset_page(query, direction, cursor, per_page):
+    """
+    Return one page of a message history query and its pagination metadata
+    Messages are MESSAGE_COLUMNS rows (see message_row_to_dict()), ordered
+    by (timestamp, id), the trailing columns of the conversation and room
+    history indexes, so every page is an index seek and no total count is
+    computed. 'before' returns the newest messages older than the cursor
+    message (cursor 0: the newest messages), 'after' the oldest messages
+    newer than it (cursor 0: from the start). Messages are always returned
+    oldest first. Raises LookupError when the cursor message is not part of
+    the queried history.
+    """
+    key = db.tuple_(Message.timestamp, Message.id)
+    if cursor:
+        anchor = query.with_entities(Message.timestamp, Message.id).filter(Message.id == cursor).first()
+        if anchor is None:
+            raise LookupError('Cursor message not found')
+        query = query.filter(key < tuple(anchor) if direction == 'before' else key > tuple(anchor))
+
+    if direction == 'before':
+        query = query.order_by(Message.timestamp.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.timestamp.asc(), Message.id.asc())
+
+    messages = query.with_entities(*MESSAGE_COLUMNS).limit(per_page + 1).all()
+    has_more = len(messages) > per_page
+    messages = messages[:per_page]
+    if direction == 'before':
+        messages.reverse()
+
+    next_cursor = None
+    if has_more:
+        next_cursor = messages[0].id if direction == 'before' else messages[-1].id
+    return messages, {
+        'perPage': per_page,
+        'direction': direction,
+        'hasMore': has_more,
+        'nextCursor': next_cursor
+    }
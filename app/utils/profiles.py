@@ -0,0 +1,134 @@
+"""
+Public user profiles for the include=users expansion
+
+History, room message and socket payloads carry only user ids. Clients that
+ask for include=users get a deduplicated `users` side table with the public
+profile ({id, username}) of everyone the messages reference, so they no
+longer look users up one by one. Profiles come from a bounded in-memory
+cache; misses are loaded with one IN query per payload. Username changes
+drop the profile from the cache of every process through the message bus.
+"""
+import json
+import logging
+import threading
+from collections import OrderedDict
+from flask import has_app_context
+from app import db, bus, socketio
+from app.models.user import User
+from app.replicas import replicas
+
+logger = logging.getLogger(__name__)
+
+# Expansions a client can ask for with include=
+EXPANSIONS = ('users',)
+
+
+def wants_users(include):
+    """
+    Read an include parameter (comma-separated expansions, may be None)
+    Returns whether the users side table was asked for. Raises ValueError
+    for unknown expansions.
+    """
+    if not include:
+        return False
+    names = {name.strip() for name in include.split(',') if name.strip()}
+    unknown = names.difference(EXPANSIONS)
+    if unknown:
+        raise ValueError(f"Unsupported include: {', '.join(sorted(unknown))}")
+    return 'users' in names
+
+
+class ProfileCache:
+    """Least-recently-used cache of public profiles by user id"""
+
+    def __init__(self, capacity=10000):
+        self.app = None
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._profiles = OrderedDict()
+        # Advanced by every drop, so loads that raced a username change are not cached
+        self._generation = 0
+        self._listener = None
+
+    def init_app(self, app):
+        """Size the cache (0 disables it) and follow username changes of other processes"""
+        self.app = app
+        self.capacity = max(0, app.config.get('PROFILE_CACHE_SIZE', 10000))
+        with self._lock:
+            self._profiles.clear()
+        if bus.shared and self._listener is None:
+            self._listener = socketio.start_background_task(self._listen)
+
+    def get_many(self, user_ids):
+        """Return {user id: profile} for the existing users among user_ids"""
+        found = {}
+        missing = []
+        with self._lock:
+            generation = self._generation
+            for user_id in user_ids:
+                profile = self._profiles.get(user_id)
+                if profile is None:
+                    missing.append(user_id)
+                else:
+                    self._profiles.move_to_end(user_id)
+                    found[user_id] = profile
+        if not missing:
+            return found
+
+        loaded = {user_id: {'id': user_id, 'username': username} for user_id, username in self._load(missing)}
+        found.update(loaded)
+        if self.capacity:
+            with self._lock:
+                if generation == self._generation:
+                    self._profiles.update(loaded)
+                    while len(self._profiles) > self.capacity:
+                        self._profiles.popitem(last=False)
+        return found
+
+    def _load(self, user_ids):
+        users = User.__table__
+        query = db.select(users.c.id, users.c.username).where(users.c.id.in_(user_ids))
+        if has_app_context():
+            # A lagging replica could put a username back after its change dropped it
+            with replicas.use_primary():
+                return db.session.execute(query).all()
+        # Socket deliveries after a pipeline commit run outside the app context
+        with self.app.app_context():
+            return db.session.execute(query).all()
+
+    def forget(self, user_id):
+        """Drop a changed profile, on every process with a shared message bus"""
+        # Locally first, so this process stops serving the old username right away
+        self._drop(user_id)
+        if bus.shared:
+            bus.publish('profiles', json.dumps(user_id))
+
+    def _listen(self):
+        for data in bus.subscribe('profiles'):
+            try:
+                self._drop(json.loads(data))
+            except Exception as e:
+                logger.error(f"Invalid profile update on bus: {type(e).__name__}")
+
+    def _drop(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._profiles.pop(user_id, None)
+
+
+profile_cache = ProfileCache()
+
+
+def users_for(message_dicts):
+    """Profiles of the senders and receivers of serialized messages, each user once"""
+    user_ids = []
+    seen = set()
+    for message_dict in message_dicts:
+        for user_id in (message_dict['senderId'], message_dict['receiverId']):
+            if user_id is not None and user_id not in seen:
+                seen.add(user_id)
+                user_ids.append(user_id)
+    if not user_ids:
+        return []
+    profiles = profile_cache.get_many(user_ids)
+    return [profiles[user_id] for user_id in user_ids if user_id in profiles]
@@ -0,0 +1,207 @@
+"""
+Full-text message search
+
+The index depends on the database engine:
+- SQLite: an FTS5 table over messages.content, kept in sync by triggers
+- PostgreSQL: a GIN index on to_tsvector('simple', content)
+- MySQL / MariaDB: a FULLTEXT index on content
+Other engines fall back to an unranked substring scan.
+
+Because the SQLite index is maintained by triggers and the other indexes by
+the database itself, every write path (socket handlers, the message
+pipeline, REST edits and deletes) keeps it current. Soft-deleted messages
+are removed from the FTS5 table and filtered out on the other engines.
+"""
+import base64
+import json
+import re
+from app import db
+from app.models.message import Message
+from app.models.room import RoomMember
+
+INDEX_NAME = 'ix_messages_content_search'
+
+# Longest accepted query and most terms used from it
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 10
+
+# Only the newest matches are ranked, so a common word costs the same as a rare one
+MAX_RANKED_MATCHES = 10000
+
+SQLITE_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages WHEN new.deleted_at IS NULL BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER messages_fts_update AFTER UPDATE OF content, deleted_at ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) "
+    "SELECT 'delete', old.id, old.content WHERE old.deleted_at IS NULL; "
+    "INSERT INTO messages_fts(rowid, content) "
+    "SELECT new.id, new.content WHERE new.deleted_at IS NULL; END",
+    "CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages WHEN old.deleted_at IS NULL BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "INSERT INTO messages_fts(rowid, content) SELECT id, content FROM messages WHERE deleted_at IS NULL"
+]
+
+POSTGRESQL_INDEX_DDL = [
+    f"CREATE INDEX {INDEX_NAME} ON messages "
+    "USING gin (to_tsvector('simple', content)) WHERE deleted_at IS NULL"
+]
+
+MYSQL_INDEX_DDL = [
+    f"CREATE FULLTEXT INDEX {INDEX_NAME} ON messages (content)"
+]
+
+messages_fts = db.table('messages_fts', db.column('rowid', db.Integer))
+
+
+def create_index(connection, inspector):
+    """Create the full-text index of the connection's engine if it is missing"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        if inspector.has_table('messages_fts'):
+            return False
+        statements = SQLITE_INDEX_DDL
+    elif dialect in ('postgresql', 'mysql', 'mariadb'):
+        if INDEX_NAME in {index['name'] for index in inspector.get_indexes('messages')}:
+            return False
+        statements = POSTGRESQL_INDEX_DDL if dialect == 'postgresql' else MYSQL_INDEX_DDL
+    else:
+        return False
+
+    for statement in statements:
+        connection.execute(db.text(statement))
+    return True
+
+
+def drop_index(connection):
+    """Drop the full-text index, e.g. before a bulk load; create_index() rebuilds it"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        for trigger in ('messages_fts_insert', 'messages_fts_update', 'messages_fts_delete'):
+            connection.execute(db.text(f'DROP TRIGGER IF EXISTS {trigger}'))
+        connection.execute(db.text('DROP TABLE IF EXISTS messages_fts'))
+    elif dialect == 'postgresql':
+        connection.execute(db.text(f'DROP INDEX IF EXISTS {INDEX_NAME}'))
+    elif dialect in ('mysql', 'mariadb'):
+        if INDEX_NAME in {index['name'] for index in db.inspect(connection).get_indexes('messages')}:
+            connection.execute(db.text(f'DROP INDEX {INDEX_NAME} ON messages'))
+
+
+def parse_terms(text):
+    """
+    Split a search query into words
+    Raises ValueError when it is empty or too long.
+    """
+    text = (text or '').strip()
+    if not text:
+        raise ValueError('Search query is required')
+    if len(text) > MAX_QUERY_LENGTH:
+        raise ValueError(f'Search query must be at most {MAX_QUERY_LENGTH} characters')
+    terms = re.findall(r'\w+', text)[:MAX_TERMS]
+    if not terms:
+        raise ValueError('Search query must contain a word')
+    return terms
+
+
+def encode_cursor(score, message_id):
+    return base64.urlsafe_b64encode(json.dumps([score, message_id]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (score, message id) of a search cursor; raises ValueError if invalid"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, message_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return float(score), int(message_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def _matching(terms, dialect):
+    """
+    Return (query, relevance, position) for the messages matching every term
+    relevance is higher for better matches; position is the message id as
+    seen by the index, which the index can scan in order.
+    """
+    query = db.session.query(Message)
+    if dialect == 'sqlite':
+        fts = db.literal_column('messages_fts')
+        query = query.join(messages_fts, messages_fts.c.rowid == Message.id)
+        # Quoted terms are matched literally, never as FTS5 query syntax
+        query = query.filter(fts.op('MATCH')(' '.join(f'"{term}"' for term in terms)))
+        return query, -db.func.bm25(fts), messages_fts.c.rowid
+    if dialect == 'postgresql':
+        document = db.func.to_tsvector(db.literal_column("'simple'"), Message.content)
+        tsquery = db.func.plainto_tsquery(db.literal_column("'simple'"), ' '.join(terms))
+        return query.filter(document.op('@@')(tsquery)), db.func.ts_rank(document, tsquery), Message.id
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import match
+        relevance = match(Message.content, against=' '.join(terms)).in_natural_language_mode()
+        return query.filter(relevance > 0), relevance, Message.id
+
+    for term in terms:
+        escaped = term.replace('\\', '\\\\').replace('_', '\\_')
+        query = query.filter(Message.content.ilike(f'%{escaped}%', escape='\\'))
+    return query, db.literal(0.0, db.Float), Message.id
+
+
+def visible_to(user_id):
+    """Condition selecting the direct messages and current-room messages a user can read"""
+    return db.or_(
+        db.and_(
+            Message.conversation_key.isnot(None),
+            db.or_(Message.sender_id == user_id, Message.receiver_id == user_id)
+        ),
+        Message.room_id.in_(db.select(RoomMember.room_id).where(RoomMember.user_id == user_id))
+    )
+
+
+def search_messages(text, condition, cursor, per_page, dialect=None):
+    """
+    Return one page of messages matching a search query and its pagination
+    condition restricts the searched messages (e.g. visible_to()). The
+    newest MAX_RANKED_MATCHES matches are ordered by relevance, then newest
+    first; cursor is the nextCursor of the previous page or None. Raises
+    ValueError for an invalid query or cursor.
+    """
+    terms = parse_terms(text)
+    dialect = dialect or db.engine.dialect.name
+    query, _, position = _matching(terms, dialect)
+    candidates = (
+        query.with_entities(Message.id)
+        .filter(condition, Message.deleted_at.is_(None))
+        .order_by(position.desc())
+        .limit(MAX_RANKED_MATCHES)
+        .subquery()
+    )
+
+    # The relevance function has to run in the query that does the matching;
+    # the lower bound lets the index skip matches older than the candidates
+    query, relevance, position = _matching(terms, dialect)
+    score = relevance.label('score')
+    query = query.add_columns(score).filter(
+        position >= db.select(db.func.min(candidates.c.id)).scalar_subquery(),
+        Message.id.in_(db.select(candidates.c.id))
+    )
+
+    if cursor:
+        last_score, last_id = decode_cursor(cursor)
+        query = query.filter(db.or_(
+            relevance < last_score,
+            db.and_(relevance == last_score, Message.id < last_id)
+        ))
+
+    rows = query.order_by(db.desc('score'), Message.id.desc()).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    next_cursor = None
+    if has_more:
+        last_message, last_score = rows[-1]
+        next_cursor = encode_cursor(float(last_score), last_message.id)
+    return [message for message, _ in rows], {
+        'perPage': per_page,
+        'hasMore': has_more,
+        'nextCursor': next_cursor
+    }
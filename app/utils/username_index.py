@@ -0,0 +1,186 @@
+"""
+In-memory prefix and trigram index over usernames
+
+A leading-wildcard ILIKE cannot use an index, so user search scanned the
+whole users table on every keystroke. This index is built from the users
+table at startup and kept current on registration and username changes:
+- prefix matches come from a sorted list of lowercase usernames (bisect)
+- substring matches come from trigram posting lists of user ids, checked
+  against the username; two-character queries use the trigrams that start
+  with them
+
+Results are ranked exact match first, then prefix matches in alphabetical
+order, then other substring matches oldest account first. With a shared
+message bus every process publishes its changes so all indexes stay equal.
+"""
+import heapq
+import json
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from app import db, bus, socketio
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Appended to usernames so a query at the end of a name still has a trigram
+END_MARKER = '$'
+
+# Users read per query when building the index
+LOAD_BATCH_SIZE = 50000
+
+
+def trigrams(name):
+    """Return the trigrams of a lowercase username, including its end marker"""
+    padded = name + END_MARKER
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class UsernameIndex:
+    """Sorted usernames for prefix search plus trigram postings for substring search"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._names = {}
+        self._sorted_names = []
+        self._sorted_ids = array('i')
+        self._postings = {}
+        self._by_bigram = {}
+        self._listener = None
+
+    def init_app(self, app):
+        """Build the index from the users table"""
+        self.enabled = app.config.get('USERNAME_INDEX_ENABLED', True)
+        with self._lock:
+            self._names = {}
+            self._sorted_names = []
+            self._sorted_ids = array('i')
+            self._postings = {}
+            self._by_bigram = {}
+            if not self.enabled:
+                return
+            self._load()
+        if bus.shared and self._listener is None:
+            self._listener = socketio.start_background_task(self._listen)
+
+    def _load(self):
+        users = User.__table__
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(users.c.id, users.c.username)
+                .where(users.c.id > last_id)
+                .order_by(users.c.id)
+                .limit(LOAD_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            for user_id, username in rows:
+                name = username.lower()
+                self._names[user_id] = name
+                # Ids arrive in ascending order, so postings stay sorted
+                for trigram in trigrams(name):
+                    self._posting(trigram).append(user_id)
+            last_id = rows[-1][0]
+
+        order = sorted(self._names, key=self._names.__getitem__)
+        self._sorted_names = [self._names[user_id] for user_id in order]
+        self._sorted_ids = array('i', order)
+        logger.info(f"Username index built for {len(self._names)} users")
+
+    def _posting(self, trigram):
+        posting = self._postings.get(trigram)
+        if posting is None:
+            posting = self._postings[trigram] = array('i')
+            self._by_bigram.setdefault(trigram[:2], set()).add(trigram)
+        return posting
+
+    def record(self, user_id, username):
+        """Add a new user or apply a username change"""
+        if not self.enabled:
+            return
+        # Locally first, so this process finds the new name right away; the echo is a no-op
+        self._apply(user_id, username)
+        if bus.shared:
+            bus.publish('usernames', json.dumps([user_id, username]))
+
+    def _listen(self):
+        for data in bus.subscribe('usernames'):
+            try:
+                self._apply(*json.loads(data))
+            except Exception as e:
+                logger.error(f"Invalid username update on bus: {type(e).__name__}")
+
+    def _apply(self, user_id, username):
+        name = username.lower()
+        with self._lock:
+            previous = self._names.get(user_id)
+            if previous == name:
+                return
+            if previous is not None:
+                index = bisect_left(self._sorted_names, previous)
+                while self._sorted_ids[index] != user_id:
+                    index += 1
+                del self._sorted_names[index]
+                del self._sorted_ids[index]
+                for trigram in trigrams(previous):
+                    self._postings[trigram].remove(user_id)
+
+            self._names[user_id] = name
+            index = bisect_left(self._sorted_names, name)
+            self._sorted_names.insert(index, name)
+            self._sorted_ids.insert(index, user_id)
+            for trigram in trigrams(name):
+                posting = self._posting(trigram)
+                if not posting or posting[-1] < user_id:
+                    posting.append(user_id)
+                else:
+                    posting.insert(bisect_left(posting, user_id), user_id)
+
+    def search(self, query, limit=10, exclude_id=None):
+        """Return the ids of up to limit users whose username contains query, best first"""
+        query = query.lower()
+        found = []
+        seen = set()
+        with self._lock:
+            index = bisect_left(self._sorted_names, query)
+            while len(found) < limit and index < len(self._sorted_names) \
+                    and self._sorted_names[index].startswith(query):
+                user_id = self._sorted_ids[index]
+                if user_id != exclude_id:
+                    found.append(user_id)
+                    seen.add(user_id)
+                index += 1
+            if len(found) >= limit:
+                return found
+
+            for user_id in self._candidates(query):
+                if user_id in seen or user_id == exclude_id:
+                    continue
+                if query in self._names[user_id]:
+                    found.append(user_id)
+                    seen.add(user_id)
+                    if len(found) >= limit:
+                        break
+        return found
+
+    def _candidates(self, query):
+        """Ids that may contain query, in ascending order"""
+        if len(query) >= 3:
+            postings = [self._postings.get(query[i:i + 3]) for i in range(len(query) - 2)]
+            if any(posting is None for posting in postings):
+                return iter(())
+            # Every match is in the shortest posting list; the rest is verified
+            return iter(min(postings, key=len))
+        if len(query) == 2:
+            postings = [self._postings[trigram] for trigram in self._by_bigram.get(query, ())]
+            return heapq.merge(*postings)
+        return iter(())
+
+    def __len__(self):
+        return len(self._names)
+
+
+username_index = UsernameIndex()
@@ -118,3 +118,17 @@ def validate_profile_update_data(data):
             errors.extend(validate_email_format(email))
     
     return errors, username, email
+
+
+def validate_message_content(content):
+    """Validate chat message content"""
+    errors = []
+    
+    if not isinstance(content, str) or len(content.strip()) == 0:
+        errors.append('Message content cannot be empty')
+        return errors
+    
+    if len(content) > 5000:
+        errors.append('Message content too long (max 5000 characters)')
+    
+    return errors
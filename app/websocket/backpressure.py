@@ -0,0 +1,185 @@
+"""
+Per-socket outbound budgets and slow-consumer eviction
+
+Every Socket.IO event frame queued for a client passes through
+OutboundBudget.admit(). A socket whose Engine.IO send queue already holds
+SOCKET_OUTBOUND_MAX_MESSAGES frames or SOCKET_OUTBOUND_MAX_BYTES bytes is a
+slow consumer and, depending on SOCKET_SLOW_CONSUMER_POLICY, is either moved
+to a "resync required" state (new events are dropped until the client asks
+for a resync) or disconnected. Either way its queue stops growing, so memory
+stays bounded however busy its rooms are. Send queues keep a running count
+of their bytes, so the check costs the same however deep the queue is.
+"""
+import logging
+import threading
+from engineio import packet as eio_packet
+from socketio import packet
+
+logger = logging.getLogger(__name__)
+
+# Socket.IO packet types, as the first character of an encoded text frame
+EVENT_FRAMES = (str(packet.EVENT), str(packet.BINARY_EVENT))
+
+
+def _frame_size(pkt):
+    data = getattr(pkt, 'data', None)
+    return len(data) if isinstance(data, (str, bytes)) else 0
+
+
+class CountingQueue:
+    """An Engine.IO send queue that keeps the total size of the frames it holds"""
+
+    def __init__(self, queue):
+        self._queue = queue
+        self._lock = threading.Lock()
+        self.queued_bytes = 0
+
+    def _count(self, pkt, sign):
+        size = _frame_size(pkt)
+        if size:
+            with self._lock:
+                self.queued_bytes += sign * size
+
+    def put(self, pkt, *args, **kwargs):
+        self._count(pkt, 1)
+        self._queue.put(pkt, *args, **kwargs)
+
+    def put_nowait(self, pkt):
+        self.put(pkt, block=False)
+
+    def get(self, *args, **kwargs):
+        pkt = self._queue.get(*args, **kwargs)
+        self._count(pkt, -1)
+        return pkt
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def __getattr__(self, name):
+        # qsize(), task_done(), join() and the rest of the queue API
+        return getattr(self._queue, name)
+
+
+class OutboundBudget:
+    """Bounded outbound queues for every connected socket"""
+
+    def __init__(self):
+        self.max_messages = 256
+        self.max_bytes = 1024 * 1024
+        self.policy = 'resync'
+        self.server = None
+        self._send_packet = None
+        self._lock = threading.Lock()
+        self._resync_required = set()
+        self.dropped = 0
+        self.resyncs = 0
+        self.disconnects = 0
+
+    def init_app(self, app, server):
+        """Read limits from the config and guard the server's outbound path"""
+        self.max_messages = max(1, app.config.get('SOCKET_OUTBOUND_MAX_MESSAGES', 256))
+        self.max_bytes = max(1, app.config.get('SOCKET_OUTBOUND_MAX_BYTES', 1024 * 1024))
+        self.policy = app.config.get('SOCKET_SLOW_CONSUMER_POLICY', 'resync')
+        if self.policy not in ('resync', 'disconnect'):
+            raise ValueError(f'Unknown slow consumer policy: {self.policy}')
+        self.server = server
+        self._send_packet = server.eio.send_packet
+        server.eio.send_packet = self.send_packet
+        # Engine.IO creates one queue per socket through create_queue()
+        create_queue = server.eio.create_queue
+        server.eio.create_queue = lambda *args, **kwargs: CountingQueue(create_queue(*args, **kwargs))
+
+    @staticmethod
+    def queued(socket):
+        """Return (frames, bytes) waiting in a socket's send queue"""
+        depth = socket.queue.qsize()
+        if depth == 0:
+            return 0, 0
+        return depth, getattr(socket.queue, 'queued_bytes', 0)
+
+    def send_packet(self, eio_sid, pkt):
+        """Queue a packet for a client unless its outbound budget is exhausted"""
+        if self.admit(eio_sid, pkt):
+            self._send_packet(eio_sid, pkt)
+
+    def admit(self, eio_sid, pkt):
+        """Decide whether a packet may be queued for a socket"""
+        if pkt.packet_type != eio_packet.MESSAGE:
+            return True
+        if isinstance(pkt.data, bytes):
+            # Binary attachments follow an event frame that was already admitted
+            return eio_sid not in self._resync_required
+        if not isinstance(pkt.data, str) or pkt.data[:1] not in EVENT_FRAMES:
+            return True
+        if eio_sid in self._resync_required:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+        socket = self.server.eio.sockets.get(eio_sid)
+        if socket is None:
+            return True
+        depth, size = self.queued(socket)
+        if depth < self.max_messages and size + len(pkt.data) <= self.max_bytes:
+            return True
+
+        with self._lock:
+            self.dropped += 1
+        self._evict(eio_sid, depth, size)
+        return False
+
+    def _evict(self, eio_sid, depth, size):
+        logger.warning(f"Slow consumer {eio_sid}: {depth} frames / {size} bytes queued, policy {self.policy}")
+        if self.policy == 'disconnect':
+            with self._lock:
+                self.disconnects += 1
+            self.server.eio.disconnect(eio_sid)
+            return
+
+        with self._lock:
+            if eio_sid in self._resync_required:
+                return
+            self._resync_required.add(eio_sid)
+            self.resyncs += 1
+        notice = self.server.packet_class(packet.EVENT, namespace='/', data=['resync_required', {
+            'success': False,
+            'message': 'Too many undelivered events; resync required'
+        }])
+        self._send_packet(eio_sid, eio_packet.Packet(eio_packet.MESSAGE, notice.encode()))
+
+    def needs_resync(self, eio_sid):
+        """Check whether a socket is waiting for a resync"""
+        return eio_sid in self._resync_required
+
+    def clear(self, eio_sid):
+        """Resume delivery to a socket after it resynced or disconnected"""
+        with self._lock:
+            self._resync_required.discard(eio_sid)
+
+    def stats(self, top=10):
+        """Queue depths and eviction counters for monitoring"""
+        depths = []
+        if self.server is not None:
+            for socket in list(self.server.eio.sockets.values()):
+                depths.append(self.queued(socket))
+        depths.sort(reverse=True)
+        return {
+            'sockets': len(depths),
+            'queuedFrames': sum(depth for depth, _ in depths),
+            'queuedBytes': sum(size for _, size in depths),
+            'deepestQueues': [{'frames': depth, 'bytes': size} for depth, size in depths[:top]],
+            'resyncRequired': len(self._resync_required),
+            'limits': {
+                'maxMessages': self.max_messages,
+                'maxBytes': self.max_bytes,
+                'policy': self.policy
+            },
+            'totals': {
+                'droppedFrames': self.dropped,
+                'resyncs': self.resyncs,
+                'disconnects': self.disconnects
+            }
+        }
+
+
+outbound = OutboundBudget()
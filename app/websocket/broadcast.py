@@ -0,0 +1,149 @@
+"""
+Encode-once broadcasting for Socket.IO events
+
+Flask-SocketIO encodes the payload again for every emit call, so sending the
+same message as an ack, a room broadcast and a user-room delivery costs one
+JSON encoding per call. EncodedPayload serializes the data once and builds
+each event frame by wrapping the cached JSON with the event name; the frame is
+then handed to every recipient socket as-is. Sockets that negotiated the
+compact protocol get the MessagePack form of the payload, also encoded once.
+Sockets that connected with `include: 'users'` get a second JSON form with
+the users side table, built once per message for all of them; the compact
+form has no room for it, so they get that JSON form whatever their protocol.
+"""
+from engineio import packet as eio_packet
+from socketio import packet, PubSubManager
+from app import socketio
+from app.utils.profiles import users_for
+from app.websocket.compact import COMPACT_ROOM, MESSAGE_EVENTS, encode_event
+
+NAMESPACE = '/'
+
+# Socket.IO room joined by every socket that asked for include=users
+INCLUDE_USERS_ROOM = 'include_users'
+
+
+class EncodedPayload:
+    """Event payload serialized once and reused for every event and recipient"""
+
+    __slots__ = ('data', '_users', '_with_users', '_json', '_frames', '_compact_frames')
+
+    def __init__(self, data, users=None):
+        self.data = data
+        self._users = users
+        self._with_users = None
+        self._json = None
+        self._frames = {}
+        self._compact_frames = {}
+
+    @property
+    def users(self):
+        """Profiles of the message's sender and receiver, loaded on first use"""
+        if self._users is None:
+            self._users = users_for([self.data['message']])
+        return self._users
+
+    def with_users(self):
+        """The same payload with its users side table, for include=users sockets"""
+        if self._with_users is None:
+            self._with_users = EncodedPayload(dict(self.data, users=self.users))
+        return self._with_users
+
+    @property
+    def json(self):
+        """The payload encoded as compact JSON"""
+        if self._json is None:
+            self._json = socketio.server.packet_class.json.dumps(self.data, separators=(',', ':'))
+        return self._json
+
+    def frame(self, event):
+        """Return the Engine.IO packet carrying this payload as `event`"""
+        frame = self._frames.get(event)
+        if frame is None:
+            # Same layout as socketio.packet.Packet.encode() for the default namespace
+            encoded = '%d[%s,%s]' % (packet.EVENT, socketio.server.packet_class.json.dumps(event), self.json)
+            frame = self._frames[event] = eio_packet.Packet(eio_packet.MESSAGE, encoded)
+        return frame
+
+    def compact_frames(self, event):
+        """
+        Return the Engine.IO packets carrying this payload as `event` for a
+        compact-protocol socket: a binary event header and its MessagePack
+        attachment, or the JSON frame for events without a compact form
+        """
+        frames = self._compact_frames.get(event)
+        if frames is None:
+            body = encode_event(event, self.data)
+            if body is None:
+                frames = (self.frame(event),)
+            else:
+                # Same layout as Packet.encode() for an event with one binary attachment
+                header = '%d1-[%s,{"_placeholder":true,"num":0}]' % (
+                    packet.BINARY_EVENT, socketio.server.packet_class.json.dumps(event))
+                frames = (eio_packet.Packet(eio_packet.MESSAGE, header),
+                          eio_packet.Packet(eio_packet.MESSAGE, body))
+            self._compact_frames[event] = frames
+        return frames
+
+
+def deliver_encoded(manager, event, payload, to, skip_sid=None):
+    """
+    Queue a pre-encoded payload for the local sockets in one or more rooms
+    Returns the number of sockets the event was queued for.
+    """
+    rooms = manager.rooms.get(NAMESPACE)
+    if rooms is None:
+        return 0
+
+    compact = rooms.get(COMPACT_ROOM)
+    include_users = rooms.get(INCLUDE_USERS_ROOM)
+    send = socketio.server._send_eio_packet
+    frame = None
+    sent = 0
+    for sid, eio_sid in manager.get_participants(NAMESPACE, to):
+        if sid == skip_sid:
+            continue
+        if include_users and sid in include_users:
+            send(eio_sid, payload.with_users().frame(event))
+        elif compact and sid in compact:
+            for compact_frame in payload.compact_frames(event):
+                send(eio_sid, compact_frame)
+        else:
+            if frame is None:
+                frame = payload.frame(event)
+            send(eio_sid, frame)
+        sent += 1
+    return sent
+
+
+def emit_encoded(event, payload, to, skip_sid=None):
+    """
+    Emit a pre-encoded payload to one or more rooms (a socket id is a room)
+    Returns the number of local sockets the frame was queued for.
+    """
+    manager = socketio.server.manager
+    if isinstance(manager, PubSubManager):
+        # Other server processes need the event itself, not a local frame;
+        # each one encodes it once in relay_encoded() and loads the users
+        # table only if it has include=users sockets. A table this process
+        # already loaded goes along so no process looks it up again.
+        data = payload.data if payload._users is None else dict(payload.data, users=payload._users)
+        socketio.emit(event, data, to=to, skip_sid=skip_sid)
+        return 0
+    return deliver_encoded(manager, event, payload, to, skip_sid)
+
+
+def relay_encoded(manager, message):
+    """
+    Deliver a message event received from the pub/sub manager through the
+    encode-once path, so compact sockets on every process get the compact form
+    Returns False for emits this path does not handle.
+    """
+    if message.get('event') not in MESSAGE_EVENTS or message.get('callback') is not None \
+            or (message.get('namespace') or NAMESPACE) != NAMESPACE or not isinstance(message.get('data'), dict):
+        return False
+    data = dict(message['data'])
+    users = data.pop('users', None)
+    deliver_encoded(manager, message['event'], EncodedPayload(data, users),
+                    message.get('room'), message.get('skip_sid'))
+    return True
@@ -0,0 +1,211 @@
+"""
+Reconnect catch-up for WebSocket clients
+
+A client reconnecting with a "last seen message id" cursor gets a single
+catch_up event with the messages it missed plus edits and deletes of older
+messages. Recent events are answered from a bounded in-memory buffer; cursors
+older than the buffer fall back to indexed queries on the messages table.
+"""
+import json
+import logging
+import threading
+import uuid
+from collections import deque
+from app import db, bus, socketio
+from app.models.message import Message
+
+logger = logging.getLogger(__name__)
+
+
+class RecentEvents:
+    """
+    Bounded buffer of recent message events
+    Each event stores the highest message id known when it happened (its
+    high-water mark). The buffer can answer a cursor only if no event with a
+    high-water mark at or above the cursor has been evicted, and the cursor
+    is newer than the last message stored before this process started.
+    """
+
+    def __init__(self, capacity=5000):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=capacity)
+        self._high_water = 0
+        self._floor = None
+        self._listener = None
+        self._callbacks = []
+        # Tags this process's events on the bus so their echo is skipped
+        self._origin = uuid.uuid4().hex
+
+    def init_app(self, app):
+        """Size the buffer and start from the newest stored message"""
+        capacity = app.config.get('CATCH_UP_BUFFER_SIZE', 5000)
+        with self._lock:
+            self._events = deque(maxlen=max(1, capacity))
+            self._high_water = db.session.query(db.func.max(Message.id)).scalar() or 0
+            self._floor = self._high_water
+        if bus.shared and self._listener is None:
+            # Every process publishes its events so each buffer sees all of them
+            self._listener = socketio.start_background_task(self._listen)
+
+    @property
+    def high_water(self):
+        """Highest message id this process has seen"""
+        return self._high_water
+
+    def add_listener(self, callback):
+        """Call callback(kind, message_dict) for every event this process sees"""
+        self._callbacks.append(callback)
+
+    def record(self, kind, message_dict):
+        """Record a 'created', 'edited' or 'deleted' event"""
+        # Locally first, so this process's buffer and history cache see the write right away
+        self._append(kind, message_dict)
+        if bus.shared:
+            bus.publish('recent_events', json.dumps([self._origin, kind, message_dict]))
+
+    def _listen(self):
+        for data in bus.subscribe('recent_events'):
+            try:
+                origin, kind, message_dict = json.loads(data)
+                if origin != self._origin:
+                    self._append(kind, message_dict)
+            except Exception as e:
+                logger.error(f"Invalid recent event on bus: {type(e).__name__}")
+
+    def _append(self, kind, message_dict):
+        with self._lock:
+            if kind == 'created':
+                self._high_water = max(self._high_water, message_dict['id'])
+            if len(self._events) == self._events.maxlen:
+                evicted_high_water = self._events[0][0]
+                self._floor = max(self._floor or 0, evicted_high_water)
+            self._events.append((self._high_water, kind, message_dict))
+        for callback in self._callbacks:
+            try:
+                callback(kind, message_dict)
+            except Exception as e:
+                logger.error(f"Recent event listener failed: {type(e).__name__}")
+
+    def since(self, cursor):
+        """
+        Return events that a client at cursor may have missed, or None when
+        the buffer no longer covers that cursor
+        """
+        with self._lock:
+            if self._floor is None or cursor <= self._floor:
+                return None
+            return [(kind, message_dict) for high_water, kind, message_dict in self._events
+                    if high_water >= cursor]
+
+
+recent_events = RecentEvents()
+
+
+def message_scope(message_dict, user_id):
+    """Return the cursor key of the conversation a message belongs to"""
+    if message_dict['roomId']:
+        return f"room_{message_dict['roomId']}"
+    peer_id = message_dict['receiverId'] if message_dict['senderId'] == user_id else message_dict['senderId']
+    return f"user_{peer_id}"
+
+
+def parse_cursors(auth):
+    """
+    Read catch-up cursors from the connect auth payload
+    Returns (global cursor or None, {scope: cursor}).
+    """
+    if not isinstance(auth, dict):
+        return None, {}
+    last_seen = auth.get('lastSeenId')
+    last_seen = last_seen if isinstance(last_seen, int) and last_seen >= 0 else None
+    scoped = {}
+    if isinstance(auth.get('cursors'), dict):
+        for scope, cursor in auth['cursors'].items():
+            if isinstance(scope, str) and scope.startswith(('user_', 'room_')) \
+                    and isinstance(cursor, int) and cursor >= 0:
+                scoped[scope] = cursor
+    return last_seen, scoped
+
+
+def _events_from_db(user_id, room_ids, cursor, limit):
+    """Collect missed events with indexed queries on the messages table"""
+    scope_filter = db.or_(
+        Message.sender_id == user_id,
+        Message.receiver_id == user_id,
+        Message.room_id.in_(room_ids) if room_ids else db.false()
+    )
+    created = Message.query.filter(
+        Message.id > cursor,
+        scope_filter
+    ).order_by(Message.id.asc()).limit(limit + 1).all()
+
+    events = [('created', message.to_dict()) for message in created]
+
+    cursor_message = Message.query.get(cursor) if cursor else None
+    if cursor_message is not None:
+        changed = Message.query.filter(
+            Message.id <= cursor,
+            db.or_(
+                Message.edited_at >= cursor_message.timestamp,
+                Message.deleted_at >= cursor_message.timestamp
+            ),
+            scope_filter
+        ).limit(limit + 1).all()
+        events.extend(
+            ('deleted' if message.deleted_at else 'edited', message.to_dict())
+            for message in changed
+        )
+    return events
+
+
+def build_catch_up(user_id, room_ids, auth, limit=500):
+    """
+    Build the catch_up payload for a reconnecting user, or None when the
+    client sent no cursor
+    """
+    last_seen, scoped = parse_cursors(auth)
+    if last_seen is None and not scoped:
+        return None
+
+    room_ids = set(room_ids)
+    cursors = list(scoped.values()) + ([last_seen] if last_seen is not None else [])
+    cursor = min(cursors)
+
+    events = recent_events.since(cursor)
+    source = 'buffer'
+    if events is None:
+        events = _events_from_db(user_id, room_ids, cursor, limit)
+        source = 'database'
+
+    # Keep the latest state of each message the user can see
+    latest = {}
+    for kind, message_dict in events:
+        if message_dict['roomId']:
+            if message_dict['roomId'] not in room_ids:
+                continue
+        elif user_id not in (message_dict['senderId'], message_dict['receiverId']):
+            continue
+        scope_cursor = scoped.get(message_scope(message_dict, user_id), last_seen)
+        if scope_cursor is None:
+            continue
+        if message_dict['id'] > scope_cursor:
+            kind = 'created'
+        elif kind == 'created':
+            continue
+        latest[message_dict['id']] = (kind, message_dict)
+
+    ordered = sorted(latest.items())
+    complete = len(ordered) <= limit
+    ordered = ordered[:limit]
+
+    payload = {
+        'success': True,
+        'messages': [message_dict for _, (kind, message_dict) in ordered if kind == 'created'],
+        'edited': [message_dict for _, (kind, message_dict) in ordered if kind == 'edited'],
+        'deleted': [message_dict['id'] for _, (kind, message_dict) in ordered if kind == 'deleted'],
+        'complete': complete
+    }
+    seen_ids = [message_id for message_id, _ in ordered] + cursors
+    payload['lastSeenId'] = max(seen_ids)
+    logger.debug(f"Catch-up for user {user_id} from {source}: {len(ordered)} events")
+    return payload
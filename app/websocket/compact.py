@@ -0,0 +1,80 @@
+"""
+Compact wire protocol for message events
+
+A client that connects with `protocol: 'compact'` in its auth payload joins
+the COMPACT_ROOM and receives message events as a single MessagePack
+attachment instead of a JSON object. The attachment drops the
+`success: True` wrapper, uses one-letter field codes, sends timestamps as
+integer milliseconds since the epoch and omits empty fields. Edit and delete
+notifications only carry what changed. Every other event (connected,
+catch_up, error, ...) stays JSON.
+"""
+from datetime import datetime, timezone
+import msgpack
+
+PROTOCOLS = ('json', 'compact')
+
+# Socket.IO room joined by every socket that negotiated the compact protocol
+COMPACT_ROOM = 'protocol_compact'
+
+# Message.to_dict() key -> compact field code
+FIELD_CODES = {
+    'id': 'i',
+    'senderId': 's',
+    'receiverId': 'u',
+    'roomId': 'r',
+    'content': 'c',
+    'timestamp': 't',
+    'editedAt': 'e',
+    'deletedAt': 'd'
+}
+
+TIMESTAMP_FIELDS = ('timestamp', 'editedAt', 'deletedAt')
+
+# Fields sent by the delta-only change events
+DELTA_FIELDS = {
+    'message_edited': ('id', 'content', 'editedAt'),
+    'message_deleted': ('id', 'deletedAt')
+}
+
+# Events whose payload is {'success': True, 'message': Message.to_dict()}
+MESSAGE_EVENTS = ('message_sent', 'receive_message', 'receive_room_message') + tuple(DELTA_FIELDS)
+
+
+def negotiate(auth):
+    """Return the protocol requested in the connect auth payload ('json' by default)"""
+    protocol = auth.get('protocol') if isinstance(auth, dict) else None
+    return protocol if protocol in PROTOCOLS else 'json'
+
+
+def epoch_millis(value):
+    """Convert an ISO 8601 UTC timestamp from Message.to_dict() to epoch milliseconds"""
+    if value is None:
+        return None
+    return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def compact_message(message_dict, fields=None):
+    """Return a message dictionary with field codes, epoch timestamps and no empty fields"""
+    compact = {}
+    for key in fields or FIELD_CODES:
+        value = message_dict.get(key)
+        if value is None:
+            continue
+        if key in TIMESTAMP_FIELDS:
+            value = epoch_millis(value)
+        elif key == 'content' and message_dict.get('isDeleted'):
+            # The deletion timestamp already says so
+            continue
+        compact[FIELD_CODES[key]] = value
+    return compact
+
+
+def encode_event(event, data):
+    """
+    Encode a message event payload as MessagePack
+    Returns None for events that have no compact form.
+    """
+    if event not in MESSAGE_EVENTS or not isinstance(data, dict) or 'message' not in data:
+        return None
+    return msgpack.packb(compact_message(data['message'], DELTA_FIELDS.get(event)))
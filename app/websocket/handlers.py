@@ -3,20 +3,39 @@ WebSocket event handlers for real-time messaging
 """
 import logging
 from datetime import datetime
-from flask import request
-from flask_socketio import emit, disconnect, join_room, leave_room
+from functools import partial
+from flask import current_app, request
+from flask_socketio import emit, disconnect, join_room, leave_room, rooms
 from flask_jwt_extended import decode_token
-from app import db, socketio
+from app import db, socketio, bus
 from app.models.message import Message
 from app.models.user import User
 from app.models.room import Room, RoomMember
+from app.models.conversation import Conversation
+from app.replicas import replicas
+from app.utils.conditional import touch_history
+from app.utils.profiles import users_for
+from app.utils.validation import validate_message_content
+from app.websocket.backpressure import outbound
+from app.websocket.broadcast import INCLUDE_USERS_ROOM, EncodedPayload, emit_encoded
+from app.websocket.catch_up import build_catch_up, recent_events
+from app.websocket.compact import COMPACT_ROOM, negotiate
+from app.websocket.rate_limit import SocketRateLimiter, batch_cost
+from app.websocket.registry import ConnectionRegistry
+from app.websocket.pipeline import pipeline
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Store active connections: {user_id: socket_id}
-# Note: For production with multiple server instances, use Redis or similar
-active_connections = {}
+# Active sockets indexed by socket id and by user id; presence is shared
+# with other server processes through the message bus
+connections = ConnectionRegistry(presence=bus)
+
+# Writes made by socket events keep their user on the primary database
+replicas.socket_user_loader(connections.user_id_for)
+
+# Per-user token buckets for message events
+socket_limiter = SocketRateLimiter(key_func=lambda: connections.user_id_for(request.sid))
 
 
 def authenticate_socket(token):
@@ -53,6 +72,83 @@ def authenticate_socket(token):
         return None
 
 
+def socket_wants_users(auth):
+    """Whether the connect auth payload asked for include: 'users' (unknown expansions are ignored)"""
+    include = auth.get('include') if isinstance(auth, dict) else None
+    if isinstance(include, list):
+        include = ','.join(name for name in include if isinstance(name, str))
+    if not isinstance(include, str):
+        return False
+    return 'users' in {name.strip() for name in include.split(',')}
+
+
+def message_targets(message_dict):
+    """Return the Socket.IO rooms that should see a message and its changes"""
+    if message_dict['roomId']:
+        return [f"room_{message_dict['roomId']}", f"user_{message_dict['senderId']}"]
+    return [f"user_{message_dict['receiverId']}", f"user_{message_dict['senderId']}"]
+
+
+def deliver_direct_message(sid, message_dict):
+    """Acknowledge a stored direct message and deliver it to both users' devices"""
+    payload = EncodedPayload({
+        'success': True,
+        'message': message_dict
+    })
+    emit_encoded('message_sent', payload, to=sid)
+    broadcast_direct_message(sid, message_dict, payload)
+
+
+def broadcast_direct_message(sid, message_dict, payload=None):
+    """Deliver a stored direct message to everyone but the sending socket"""
+    payload = payload or EncodedPayload({
+        'success': True,
+        'message': message_dict
+    })
+    recent_events.record('created', message_dict)
+    # Deliver to every device of the receiver and to the sender's other devices
+    emit_encoded('receive_message', payload, to=message_targets(message_dict), skip_sid=sid)
+
+
+def deliver_room_message(sid, message_dict):
+    """Acknowledge a stored room message and broadcast it to the room"""
+    payload = EncodedPayload({
+        'success': True,
+        'message': message_dict
+    })
+    emit_encoded('message_sent', payload, to=sid)
+    broadcast_room_message(sid, message_dict, payload)
+
+
+def broadcast_room_message(sid, message_dict, payload=None):
+    """Deliver a stored room message to everyone but the sending socket"""
+    payload = payload or EncodedPayload({
+        'success': True,
+        'message': message_dict
+    })
+    recent_events.record('created', message_dict)
+    # Broadcast to all room members
+    emit_encoded('receive_room_message', payload, to=f"room_{message_dict['roomId']}", skip_sid=sid)
+
+
+def notify_message_change(event, message_dict):
+    """Send an edit or delete notification to the room, or every device of both participants"""
+    recent_events.record('deleted' if event == 'message_deleted' else 'edited', message_dict)
+    payload = EncodedPayload({
+        'success': True,
+        'message': message_dict
+    })
+    emit_encoded(event, payload, to=message_targets(message_dict))
+
+
+def report_error(sid, message):
+    """Send an error event to a single socket"""
+    socketio.emit('error', {
+        'success': False,
+        'message': message
+    }, to=sid)
+
+
 @socketio.on('connect')
 def handle_connect(auth):
     """Handle WebSocket connection"""
@@ -79,7 +175,21 @@ def handle_connect(auth):
             return False
         
         # Store connection
-        active_connections[user_id] = request.sid
+        session = connections.add(request.sid, user_id)
+        user_id = session.user_id
+        
+        # Join the per-user room shared by all of the user's devices
+        join_room(f"user_{user_id}")
+        
+        # Message events are sent in the wire protocol the client asked for
+        protocol = negotiate(auth)
+        if protocol == 'compact':
+            join_room(COMPACT_ROOM)
+        
+        # Message events and catch-up carry a users table if the client asked for it
+        include_users = socket_wants_users(auth)
+        if include_users:
+            join_room(INCLUDE_USERS_ROOM)
         
         # Join user to their rooms
         memberships = RoomMember.query.filter_by(user_id=user_id).all()
@@ -91,9 +201,24 @@ def handle_connect(auth):
         emit('connected', {
             'success': True,
             'message': 'Connected to chat server',
-            'userId': user_id
+            'userId': user_id,
+            'lastMessageId': recent_events.high_water,
+            'protocol': protocol,
+            'include': ['users'] if include_users else []
         })
         
+        # Push everything missed since the client's last seen message
+        catch_up = build_catch_up(
+            user_id,
+            [membership.room_id for membership in memberships],
+            auth,
+            limit=current_app.config['CATCH_UP_MAX_MESSAGES']
+        )
+        if catch_up is not None:
+            if include_users:
+                catch_up['users'] = users_for(catch_up['messages'] + catch_up['edited'])
+            emit('catch_up', catch_up)
+        
         return True
         
     except Exception as e:
@@ -110,21 +235,18 @@ def handle_disconnect():
     """Handle WebSocket disconnection"""
     try:
         # Remove connection
-        user_id = None
-        for uid, sid in list(active_connections.items()):
-            if sid == request.sid:
-                user_id = uid
-                del active_connections[uid]
-                break
+        session = connections.remove(request.sid)
+        outbound.clear(socketio.server.manager.eio_sid_from_sid(request.sid, '/'))
         
-        if user_id:
-            logger.info(f"User {user_id} disconnected")
+        if session:
+            logger.info(f"User {session.user_id} disconnected")
         
     except Exception as e:
         logger.error(f"Disconnection error: {type(e).__name__}")
 
 
 @socketio.on('send_message')
+@socket_limiter.limit('send_message')
 def handle_send_message(data):
     """
     Handle incoming message from client
@@ -136,11 +258,7 @@ def handle_send_message(data):
     """
     try:
         # Find sender from active connections
-        sender_id = None
-        for uid, sid in active_connections.items():
-            if sid == request.sid:
-                sender_id = uid
-                break
+        sender_id = connections.user_id_for(request.sid)
         
         if not sender_id:
             emit('error', {
@@ -160,17 +278,11 @@ def handle_send_message(data):
             })
             return
         
-        if not isinstance(content, str) or len(content.strip()) == 0:
+        content_errors = validate_message_content(content)
+        if content_errors:
             emit('error', {
                 'success': False,
-                'message': 'Message content cannot be empty'
-            })
-            return
-        
-        if len(content) > 5000:
-            emit('error', {
-                'success': False,
-                'message': 'Message content too long (max 5000 characters)'
+                'message': content_errors[0]
             })
             return
         
@@ -190,27 +302,26 @@ def handle_send_message(data):
             content=content.strip()
         )
         
+        if pipeline.enabled:
+            # Acknowledge and deliver once the batch holding the message commits
+            pipeline.submit(
+                message,
+                on_commit=partial(deliver_direct_message, request.sid),
+                on_error=partial(report_error, request.sid, 'Failed to send message')
+            )
+            return
+        
         db.session.add(message)
+        Conversation.record_messages([message])
+        touch_history([message])
         db.session.commit()
         
-        message_dict = message.to_dict()
+        deliver_direct_message(request.sid, message.to_dict())
         
-        # Send acknowledgment to sender
-        emit('message_sent', {
-            'success': True,
-            'message': message_dict
-        })
-        
-        # Send message to receiver if online
-        if receiver_id in active_connections:
-            receiver_sid = active_connections[receiver_id]
-            emit('receive_message', {
-                'success': True,
-                'message': message_dict
-            }, room=receiver_sid)
-            logger.info(f"Message delivered from user {sender_id} to user {receiver_id}")
+        if connections.is_online(receiver.id):
+            logger.info(f"Message delivered from user {sender_id} to user {receiver.id}")
         else:
-            logger.info(f"User {receiver_id} is offline, message saved")
+            logger.info(f"User {receiver.id} is offline, message saved")
         
     except Exception as e:
         logger.error(f"Error handling message: {type(e).__name__}")
@@ -222,6 +333,7 @@ def handle_send_message(data):
 
 
 @socketio.on('send_room_message')
+@socket_limiter.limit('send_room_message')
 def handle_send_room_message(data):
     """
     Handle incoming room message from client
@@ -233,11 +345,7 @@ def handle_send_room_message(data):
     """
     try:
         # Find sender from active connections
-        sender_id = None
-        for uid, sid in active_connections.items():
-            if sid == request.sid:
-                sender_id = uid
-                break
+        sender_id = connections.user_id_for(request.sid)
         
         if not sender_id:
             emit('error', {
@@ -257,17 +365,11 @@ def handle_send_room_message(data):
             })
             return
         
-        if not isinstance(content, str) or len(content.strip()) == 0:
-            emit('error', {
-                'success': False,
-                'message': 'Message content cannot be empty'
-            })
-            return
-        
-        if len(content) > 5000:
+        content_errors = validate_message_content(content)
+        if content_errors:
             emit('error', {
                 'success': False,
-                'message': 'Message content too long (max 5000 characters)'
+                'message': content_errors[0]
             })
             return
         
@@ -300,35 +402,172 @@ def handle_send_room_message(data):
             content=content.strip()
         )
         
+        if pipeline.enabled:
+            # Acknowledge and broadcast once the batch holding the message commits
+            pipeline.submit(
+                message,
+                on_commit=partial(deliver_room_message, request.sid),
+                on_error=partial(report_error, request.sid, 'Failed to send room message')
+            )
+            return
+        
         db.session.add(message)
+        touch_history([message])
         db.session.commit()
         
-        message_dict = message.to_dict()
+        deliver_room_message(request.sid, message.to_dict())
         
-        # Send acknowledgment to sender
-        emit('message_sent', {
-            'success': True,
-            'message': message_dict
+        logger.info(f"Room message from user {sender_id} to room {room_id}")
+        
+    except Exception as e:
+        logger.error(f"Error handling room message: {type(e).__name__}")
+        db.session.rollback()
+        emit('error', {
+            'success': False,
+            'message': 'Failed to send room message'
         })
+
+
+@socketio.on('send_messages_batch')
+@socket_limiter.limit('send_messages_batch', cost=batch_cost)
+def handle_send_messages_batch(data):
+    """
+    Handle a batch of direct and room messages from one client
+    Expected data:
+    {
+        "messages": [
+            {"receiverId": int, "content": str},
+            {"roomId": int, "content": str}
+        ]
+    }
+    Receivers and room memberships are checked with one query each, every
+    valid item is stored in a single transaction, and the sender gets one
+    messages_batch_sent ack with a result per item (in request order).
+    """
+    try:
+        # Find sender from active connections
+        sender_id = connections.user_id_for(request.sid)
         
-        # Broadcast to all room members
-        emit('receive_room_message', {
+        if not sender_id:
+            emit('error', {
+                'success': False,
+                'message': 'Unauthorized'
+            })
+            return
+        
+        items = data.get('messages') if isinstance(data, dict) else None
+        max_items = current_app.config['MESSAGE_BATCH_MAX_SIZE']
+        
+        if not isinstance(items, list) or not items:
+            emit('error', {
+                'success': False,
+                'message': 'A non-empty list of messages is required'
+            })
+            return
+        
+        if len(items) > max_items:
+            emit('error', {
+                'success': False,
+                'message': f'Too many messages in batch (max {max_items})'
+            })
+            return
+        
+        # Validate every item before touching the database
+        results = [None] * len(items)
+        parsed = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {'success': False, 'message': 'Invalid message'}
+                continue
+            
+            receiver_id = item.get('receiverId')
+            room_id = item.get('roomId')
+            if bool(receiver_id) == bool(room_id):
+                results[index] = {'success': False, 'message': 'Exactly one of receiver ID or room ID is required'}
+                continue
+            
+            content_errors = validate_message_content(item.get('content'))
+            if content_errors:
+                results[index] = {'success': False, 'message': content_errors[0]}
+                continue
+            
+            try:
+                target_id = int(receiver_id or room_id)
+            except (TypeError, ValueError):
+                results[index] = {'success': False, 'message': 'Invalid receiver or room ID'}
+                continue
+            
+            parsed.append((index, bool(receiver_id), target_id, item['content'].strip()))
+        
+        # Set-based existence and membership checks
+        receiver_ids = {target_id for _, is_direct, target_id, _ in parsed if is_direct}
+        room_ids = {target_id for _, is_direct, target_id, _ in parsed if not is_direct}
+        
+        existing_receivers = set()
+        if receiver_ids:
+            existing_receivers = {
+                row.id for row in db.session.query(User.id).filter(User.id.in_(receiver_ids))
+            }
+        
+        member_rooms = set()
+        if room_ids:
+            member_rooms = {
+                row.room_id for row in db.session.query(RoomMember.room_id).filter(
+                    RoomMember.user_id == sender_id,
+                    RoomMember.room_id.in_(room_ids)
+                )
+            }
+        
+        messages = []
+        for index, is_direct, target_id, content in parsed:
+            if is_direct and target_id not in existing_receivers:
+                results[index] = {'success': False, 'message': 'Receiver not found'}
+            elif not is_direct and target_id not in member_rooms:
+                results[index] = {'success': False, 'message': 'Not authorized to send messages to this room'}
+            elif is_direct:
+                messages.append((index, Message(sender_id=sender_id, receiver_id=target_id, content=content)))
+            else:
+                messages.append((index, Message(sender_id=sender_id, room_id=target_id, content=content)))
+        
+        # Store all valid messages in one transaction
+        stored = []
+        if messages:
+            db.session.add_all([message for _, message in messages])
+            db.session.flush()
+            Conversation.record_messages([message for _, message in messages])
+            touch_history([message for _, message in messages])
+            stored = [(index, message.to_dict()) for index, message in messages]
+            db.session.commit()
+        
+        for index, message_dict in stored:
+            results[index] = {'success': True, 'message': message_dict}
+        
+        emit('messages_batch_sent', {
             'success': True,
-            'message': message_dict
-        }, room=f"room_{room_id}", skip_sid=request.sid)
+            'sent': len(stored),
+            'failed': len(items) - len(stored),
+            'results': results
+        })
         
-        logger.info(f"Room message from user {sender_id} to room {room_id}")
+        for _, message_dict in stored:
+            if message_dict['roomId']:
+                broadcast_room_message(request.sid, message_dict)
+            else:
+                broadcast_direct_message(request.sid, message_dict)
+        
+        logger.info(f"Batch of {len(stored)}/{len(items)} messages from user {sender_id}")
         
     except Exception as e:
-        logger.error(f"Error handling room message: {type(e).__name__}")
+        logger.error(f"Error handling message batch: {type(e).__name__}")
         db.session.rollback()
         emit('error', {
             'success': False,
-            'message': 'Failed to send room message'
+            'message': 'Failed to send message batch'
         })
 
 
 @socketio.on('edit_message')
+@socket_limiter.limit('edit_message')
 def handle_edit_message(data):
     """
     Handle message edit request
@@ -340,11 +579,7 @@ def handle_edit_message(data):
     """
     try:
         # Find sender from active connections
-        sender_id = None
-        for uid, sid in active_connections.items():
-            if sid == request.sid:
-                sender_id = uid
-                break
+        sender_id = connections.user_id_for(request.sid)
         
         if not sender_id:
             emit('error', {
@@ -389,28 +624,10 @@ def handle_edit_message(data):
         # Update message
         message.content = content.strip()
         message.edited_at = datetime.utcnow()
+        touch_history([message])
         db.session.commit()
         
-        message_dict = message.to_dict()
-        
-        # Notify sender
-        emit('message_edited', {
-            'success': True,
-            'message': message_dict
-        })
-        
-        # Notify receiver or room
-        if message.room_id:
-            emit('message_edited', {
-                'success': True,
-                'message': message_dict
-            }, room=f"room_{message.room_id}", skip_sid=request.sid)
-        elif message.receiver_id and message.receiver_id in active_connections:
-            receiver_sid = active_connections[message.receiver_id]
-            emit('message_edited', {
-                'success': True,
-                'message': message_dict
-            }, room=receiver_sid)
+        notify_message_change('message_edited', message.to_dict())
         
     except Exception as e:
         logger.error(f"Error editing message: {type(e).__name__}")
@@ -422,6 +639,7 @@ def handle_edit_message(data):
 
 
 @socketio.on('delete_message')
+@socket_limiter.limit('delete_message')
 def handle_delete_message(data):
     """
     Handle message delete request
@@ -432,11 +650,7 @@ def handle_delete_message(data):
     """
     try:
         # Find sender from active connections
-        sender_id = None
-        for uid, sid in active_connections.items():
-            if sid == request.sid:
-                sender_id = uid
-                break
+        sender_id = connections.user_id_for(request.sid)
         
         if not sender_id:
             emit('error', {
@@ -472,28 +686,11 @@ def handle_delete_message(data):
         
         # Soft delete
         message.deleted_at = datetime.utcnow()
+        Conversation.record_delete(message)
+        touch_history([message])
         db.session.commit()
         
-        message_dict = message.to_dict()
-        
-        # Notify sender
-        emit('message_deleted', {
-            'success': True,
-            'message': message_dict
-        })
-        
-        # Notify receiver or room
-        if message.room_id:
-            emit('message_deleted', {
-                'success': True,
-                'message': message_dict
-            }, room=f"room_{message.room_id}", skip_sid=request.sid)
-        elif message.receiver_id and message.receiver_id in active_connections:
-            receiver_sid = active_connections[message.receiver_id]
-            emit('message_deleted', {
-                'success': True,
-                'message': message_dict
-            }, room=receiver_sid)
+        notify_message_change('message_deleted', message.to_dict())
         
     except Exception as e:
         logger.error(f"Error deleting message: {type(e).__name__}")
@@ -504,6 +701,49 @@ def handle_delete_message(data):
         })
 
 
+@socketio.on('resync')
+def handle_resync(data):
+    """Resume delivery to a socket that fell behind and send what it missed"""
+    try:
+        session = connections.get(request.sid)
+        
+        if not session:
+            emit('error', {
+                'success': False,
+                'message': 'Not authenticated'
+            })
+            return
+        
+        # Clear the flag first so nothing committed from here on is dropped
+        outbound.clear(socketio.server.manager.eio_sid_from_sid(request.sid, '/'))
+        
+        room_ids = [membership.room_id for membership in
+                    RoomMember.query.filter_by(user_id=session.user_id).all()]
+        catch_up = build_catch_up(
+            session.user_id,
+            room_ids,
+            data,
+            limit=current_app.config['CATCH_UP_MAX_MESSAGES']
+        )
+        if catch_up is None:
+            emit('error', {
+                'success': False,
+                'message': 'lastSeenId or cursors required to resync'
+            })
+            return
+        
+        if INCLUDE_USERS_ROOM in rooms():
+            catch_up['users'] = users_for(catch_up['messages'] + catch_up['edited'])
+        emit('catch_up', catch_up)
+        
+    except Exception as e:
+        logger.error(f"Error resyncing socket: {type(e).__name__}")
+        emit('error', {
+            'success': False,
+            'message': 'Failed to resync'
+        })
+
+
 @socketio.on_error_default
 def default_error_handler(e):
     """Handle WebSocket errors"""
@@ -0,0 +1,141 @@
+"""
+Group-commit write-behind pipeline for new chat messages
+
+Socket handlers queue new Message rows instead of committing each one. A
+background task flushes the queue in a single transaction once it holds
+MESSAGE_PIPELINE_MAX_BATCH rows or the oldest row has waited
+MESSAGE_PIPELINE_MAX_DELAY_MS, and only then runs each row's on_commit
+callback, so acknowledgements are sent once the batch is durable.
+"""
+import atexit
+import logging
+import threading
+import time
+from app import db, socketio
+from app.models.conversation import Conversation
+from app.replicas import replicas
+from app.utils.conditional import touch_history
+
+logger = logging.getLogger(__name__)
+
+
+class MessagePipeline:
+    """Queue of pending messages flushed in batched transactions"""
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.max_batch = 500
+        self.max_delay = 0.02
+        self._pending = []
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._worker = None
+        self._closed = False
+        self.batches = 0
+        self.flushed = 0
+
+    def init_app(self, app):
+        """Read pipeline settings from the application config"""
+        self.app = app
+        self.enabled = app.config.get('MESSAGE_PIPELINE_ENABLED', False)
+        self.max_batch = max(1, app.config.get('MESSAGE_PIPELINE_MAX_BATCH', 500))
+        self.max_delay = max(0, app.config.get('MESSAGE_PIPELINE_MAX_DELAY_MS', 20)) / 1000.0
+        if self.enabled:
+            atexit.register(self.close)
+
+    def submit(self, message, on_commit, on_error=None):
+        """
+        Queue a new Message for the next batch
+        on_commit(message_dict) runs after the batch commits; on_error() runs
+        if the message could not be stored.
+        """
+        with self._condition:
+            if self._worker is None:
+                self._worker = socketio.start_background_task(self._run)
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending.append((message, on_commit, on_error))
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._condition.notify()
+
+    def _take_batch(self):
+        """Wait until a batch is due and remove it from the queue"""
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            while self._pending and len(self._pending) < self.max_batch:
+                remaining = self._oldest + self.max_delay - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            self._oldest = time.monotonic() if self._pending else None
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self.flush(batch)
+            elif self._closed:
+                return
+
+    def flush(self, batch):
+        """Store a batch in one transaction and run its callbacks"""
+        with self.app.app_context():
+            try:
+                db.session.add_all([message for message, _, _ in batch])
+                db.session.flush()
+                Conversation.record_messages([message for message, _, _ in batch])
+                touch_history([message for message, _, _ in batch])
+                # Serialize before commit so expired rows are not reloaded one by one
+                stored = [(message.to_dict(), on_commit) for message, on_commit, _ in batch]
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Batch of {len(batch)} messages failed: {type(e).__name__}, retrying individually")
+                stored = self._flush_individually(batch)
+            finally:
+                db.session.remove()
+        self.batches += 1
+        self.flushed += len(stored)
+        # Batches commit outside any request, so their senders are named here
+        replicas.record_write({message_dict['senderId'] for message_dict, _ in stored})
+        for message_dict, on_commit in stored:
+            try:
+                on_commit(message_dict)
+            except Exception as e:
+                logger.error(f"Message commit callback failed: {type(e).__name__}")
+
+    def _flush_individually(self, batch):
+        stored = []
+        for message, on_commit, on_error in batch:
+            try:
+                db.session.add(message)
+                db.session.flush()
+                Conversation.record_messages([message])
+                touch_history([message])
+                message_dict = message.to_dict()
+                db.session.commit()
+                stored.append((message_dict, on_commit))
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error storing message: {type(e).__name__}")
+                if on_error is not None:
+                    on_error()
+        return stored
+
+    def close(self):
+        """Flush everything still queued and stop the background task"""
+        with self._condition:
+            self._closed = True
+            batch, self._pending = self._pending, []
+            self._condition.notify_all()
+        while batch:
+            self.flush(batch[:self.max_batch])
+            batch = batch[self.max_batch:]
+
+
+pipeline = MessagePipeline()
@@ -0,0 +1,112 @@
+"""
+Token-bucket rate limiting for WebSocket events
+
+Flask-Limiter only sees HTTP requests, so socket events are limited here with
+one in-memory token bucket per user and event. Limits use the same notation as
+Flask-Limiter ("20 per 10 seconds"): the amount is the bucket size (burst) and
+the bucket refills at amount / period tokens per second.
+"""
+import logging
+import threading
+import time
+from functools import wraps
+from flask import request
+from flask_socketio import emit
+from limits import parse
+
+logger = logging.getLogger(__name__)
+
+
+class SocketRateLimiter:
+    """Per-key, per-event token buckets checked by a handler decorator"""
+
+    # Sweep buckets that have refilled completely after this many checks
+    SWEEP_INTERVAL = 4096
+
+    def __init__(self, key_func):
+        self.key_func = key_func
+        self.enabled = True
+        self._rates = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._checks = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        """Read per-event limits from SOCKET_RATE_LIMITS"""
+        self.enabled = app.config.get('SOCKET_RATE_LIMIT_ENABLED', True)
+        self._rates = {}
+        for event, limit in app.config.get('SOCKET_RATE_LIMITS', {}).items():
+            item = parse(limit)
+            # (capacity, tokens per second)
+            self._rates[event] = (float(item.amount), item.amount / item.get_expiry())
+        with self._lock:
+            self._buckets.clear()
+
+    def consume(self, key, event, cost=1):
+        """
+        Take `cost` tokens from the bucket for (key, event)
+        Returns 0 when allowed, otherwise the seconds until enough tokens refill.
+        """
+        rate = self._rates.get(event)
+        if rate is None or not self.enabled:
+            return 0
+        capacity, refill = rate
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((key, event))
+            if bucket is None:
+                tokens = capacity
+                bucket = self._buckets[(key, event)] = [capacity, now]
+            else:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+            bucket[1] = now
+            self._checks += 1
+            if self._checks >= self.SWEEP_INTERVAL:
+                self._sweep(now)
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                return 0
+            bucket[0] = tokens
+            self.rejected += 1
+        return (cost - tokens) / refill if cost <= capacity else None
+
+    def _sweep(self, now):
+        # Buckets that are full again carry no state; drop them to bound memory
+        self._checks = 0
+        for bucket_key, (tokens, stamp) in list(self._buckets.items()):
+            capacity, refill = self._rates[bucket_key[1]]
+            if tokens + (now - stamp) * refill >= capacity:
+                del self._buckets[bucket_key]
+
+    def limit(self, event, cost=None):
+        """
+        Decorate a Socket.IO handler so it is rate limited per key
+        `cost` optionally maps the event payload to a number of tokens.
+        """
+        def decorator(handler):
+            @wraps(handler)
+            def wrapper(data=None, *args, **kwargs):
+                key = self.key_func()
+                if key is None:
+                    key = request.sid
+                retry_after = self.consume(key, event, cost(data) if cost else 1)
+                if retry_after != 0:
+                    logger.warning(f"Rate limit exceeded for {event} by {key}")
+                    response = {
+                        'success': False,
+                        'message': f'Rate limit exceeded for {event}'
+                    }
+                    if retry_after is not None:
+                        response['retryAfter'] = round(retry_after, 3)
+                    emit('error', response)
+                    return
+                return handler(data, *args, **kwargs)
+            return wrapper
+        return decorator
+
+
+def batch_cost(data):
+    """One token per message in a send_messages_batch payload"""
+    messages = data.get('messages') if isinstance(data, dict) else None
+    return max(1, len(messages)) if isinstance(messages, list) else 1
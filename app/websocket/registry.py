@@ -0,0 +1,109 @@
+"""
+Connection registry for active WebSocket sessions
+"""
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class SocketSession:
+    """State kept for a single authenticated socket"""
+
+    __slots__ = ('sid', 'user_id', 'connected_at')
+
+    def __init__(self, sid, user_id, connected_at=None):
+        self.sid = sid
+        self.user_id = user_id
+        self.connected_at = connected_at or datetime.utcnow()
+
+    def __repr__(self):
+        return f'<SocketSession {self.sid} user={self.user_id}>'
+
+
+class ConnectionRegistry:
+    """
+    Index of active sockets by socket id and by user id
+    All lookups are O(1); mutations are guarded by a lock so connect and
+    disconnect events running on different threads cannot corrupt the indexes.
+    The indexes are local to this process; when a presence store (the message
+    bus) is given, per-user socket counts are also mirrored there so
+    is_online() answers for every server process.
+    """
+
+    def __init__(self, presence=None):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._user_sessions = {}
+        self._presence = presence
+
+    def add(self, sid, user_id):
+        """Register a socket for a user and return its session"""
+        session = SocketSession(sid, int(user_id))
+        with self._lock:
+            previous = self._sessions.get(sid)
+            if previous is not None:
+                self._discard(previous)
+            self._sessions[sid] = session
+            self._user_sessions.setdefault(session.user_id, set()).add(sid)
+        if previous is None:
+            self._update_presence(session.user_id, 1)
+        return session
+
+    def remove(self, sid):
+        """Unregister a socket and return its session, or None if unknown"""
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+            if session is not None:
+                self._discard(session)
+        if session is not None:
+            self._update_presence(session.user_id, -1)
+        return session
+
+    def _update_presence(self, user_id, delta):
+        if self._presence is None or self._presence.backend is None:
+            return
+        try:
+            if delta > 0:
+                self._presence.presence_incr(user_id)
+            else:
+                self._presence.presence_decr(user_id)
+        except Exception as e:
+            logger.error(f"Presence update failed for user {user_id}: {type(e).__name__}")
+
+    def _discard(self, session):
+        sids = self._user_sessions.get(session.user_id)
+        if sids is not None:
+            sids.discard(session.sid)
+            if not sids:
+                del self._user_sessions[session.user_id]
+
+    def get(self, sid):
+        """Return the session for a socket id, or None"""
+        return self._sessions.get(sid)
+
+    def user_id_for(self, sid):
+        """Return the authenticated user id for a socket id, or None"""
+        session = self._sessions.get(sid)
+        return session.user_id if session is not None else None
+
+    def sids_for(self, user_id):
+        """Return a snapshot of the socket ids a user has open"""
+        with self._lock:
+            return tuple(self._user_sessions.get(user_id, ()))
+
+    def is_online(self, user_id):
+        """Check whether a user has at least one open socket on any server"""
+        if user_id in self._user_sessions:
+            return True
+        if self._presence is None or self._presence.backend is None:
+            return False
+        try:
+            return self._presence.presence_count(user_id) > 0
+        except Exception as e:
+            logger.error(f"Presence lookup failed for user {user_id}: {type(e).__name__}")
+            return False
+
+    def __len__(self):
+        return len(self._sessions)
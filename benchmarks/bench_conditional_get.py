@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark: polling unchanged history and room endpoints, full response vs 304
+
+Fills one direct conversation and one room and times each polled endpoint
+through the Flask test client, once as a plain GET and once revalidated
+with the ETag of the previous response (If-None-Match), which answers
+304 Not Modified. Also reports the response body size. History is read
+from the database for page mode and from the history cache for the newest
+cursor page. Rate limiting is disabled.
+
+Usage:
+    python benchmarks/bench_conditional_get.py [--messages 100000] [--members 50] [--rounds 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_history_pagination import build_app, fill  # noqa: E402
+
+PER_PAGE = 50
+
+
+def fill_room(app, owner_id, members, messages):
+    """Create a room with members and messages; returns its id"""
+    from datetime import datetime, timedelta
+    from app import db
+    from app.models.user import User
+    from app.models.room import Room, RoomMember
+    from app.models.message import Message
+
+    with app.app_context():
+        users = [User(username=f'member{i}', email=f'member{i}@example.com', password_hash='x')
+                 for i in range(members)]
+        room = Room(name='bench', creator_id=owner_id)
+        db.session.add_all(users + [room])
+        db.session.flush()
+        db.session.add_all([RoomMember(room_id=room.id, user_id=user_id)
+                            for user_id in [owner_id] + [user.id for user in users]])
+        base = datetime(2024, 1, 1)
+        db.session.execute(Message.__table__.insert(), [{
+            'sender_id': owner_id,
+            'room_id': room.id,
+            'content': f'room message {i}',
+            'timestamp': base + timedelta(seconds=i)
+        } for i in range(messages)])
+        db.session.commit()
+        return room.id
+
+
+def timed(client, url, headers, rounds, expected):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        response = client.get(url, headers=headers)
+    assert response.status_code == expected, (url, response.status_code)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--members', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, sender_id, receiver_id, token = build_app(os.path.join(tmp, 'bench.db'))
+        fill(app, sender_id, receiver_id, 0, args.messages)
+        room_id = fill_room(app, sender_id, args.members, args.messages)
+
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        last_page = (args.messages + PER_PAGE - 1) // PER_PAGE
+        endpoints = [
+            ('chat history, last page', f'/api/messages/history/{receiver_id}?per_page={PER_PAGE}&page={last_page}'),
+            ('chat history, newest cursor page', f'/api/messages/history/{receiver_id}?per_page={PER_PAGE}&before_id=0'),
+            ('room messages, last page', f'/api/rooms/{room_id}/messages?per_page={PER_PAGE}&page={last_page}'),
+            ('room details', f'/api/rooms/{room_id}'),
+            ('user rooms', '/api/rooms'),
+        ]
+
+        print(f'{args.messages:,} messages per conversation and room, {args.members} room members')
+        print(f"{'endpoint':<34} {'200 ms':>8} {'304 ms':>8} {'body bytes':>11}")
+        for name, url in endpoints:
+            # The second request sees the cached form of cursor pages
+            client.get(url, headers=headers)
+            response = client.get(url, headers=headers)
+            full_ms = timed(client, url, headers, args.rounds, 200)
+            revalidate = dict(headers, **{'If-None-Match': response.headers['ETag']})
+            not_modified_ms = timed(client, url, revalidate, args.rounds, 304)
+            print(f'{name:<34} {full_ms:8.2f} {not_modified_ms:8.2f} {len(response.data):>11,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full conversation export, NDJSON stream vs walking history pages
+
+Fills one direct conversation with a growing number of messages and reads
+all of it through the Flask test client, once as a streamed NDJSON export
+(GET /api/messages/export/:userId, plain and gzip) and once the old way,
+100 messages per page with ?page=N. Reports time, bytes and the peak
+Python memory allocated while reading (tracemalloc, measured in a second
+pass so tracing does not slow the timed one). Rate limiting is disabled.
+
+Usage:
+    python benchmarks/bench_export.py [--sizes 10000 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_history_pagination import build_app, fill  # noqa: E402
+
+PAGE_SIZE = 100
+# The page walk is quadratic; stop measuring it above this size
+MAX_PAGE_WALK = 100000
+
+
+def export(client, url, headers):
+    response = client.get(url, headers=headers, buffered=False)
+    assert response.status_code == 200
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    return size
+
+
+def walk_pages(client, url, headers):
+    size, page = 0, 1
+    while True:
+        response = client.get(f'{url}?per_page={PAGE_SIZE}&page={page}', headers=headers)
+        size += len(response.data)
+        if not response.json['data']['pagination']['hasNext']:
+            return size
+        page += 1
+
+
+def measured(function, *args):
+    start = time.perf_counter()
+    size = function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, sender_id, receiver_id, token = build_app(os.path.join(tmp, 'bench.db'))
+        from app.utils.history_cache import history_cache
+        history_cache.enabled = False
+
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+
+        print(f"{'messages':>9}  {'method':<12}  {'time':>8}  {'bytes':>12}  {'peak memory':>11}")
+        filled = 0
+        for size in sorted(args.sizes):
+            fill(app, sender_id, receiver_id, filled, size)
+            filled = size
+            methods = [('ndjson', export, f'/api/messages/export/{receiver_id}'),
+                       ('ndjson gzip', export, f'/api/messages/export/{receiver_id}?gzip=true')]
+            if size <= MAX_PAGE_WALK:
+                methods.append(('page walk', walk_pages, f'/api/messages/history/{receiver_id}'))
+            for name, function, url in methods:
+                elapsed, total, peak = measured(function, client, url, headers)
+                print(f'{size:>9}  {name:<12}  {elapsed:>6.2f} s  {total:>12,}  {peak / 1024 / 1024:>7.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
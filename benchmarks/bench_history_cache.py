@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark: newest chat history page with and without the history cache
+
+Fills a number of direct conversations and times
+GET /api/messages/history/:userId?before_id=0 through the Flask test client,
+once reading from the database on every request and once served from the
+per-conversation history cache (after one warming request per conversation).
+Rate limiting is disabled.
+
+Usage:
+    python benchmarks/bench_history_cache.py [--conversations 100] [--messages 1000] [--rounds 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PER_PAGE = 50
+
+
+def build_app(db_path, conversations, messages):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db, limiter
+    from app.models.user import User
+    from app.models.message import Message
+    from flask_jwt_extended import create_access_token
+
+    app = create_app('development')
+    limiter.enabled = False
+    with app.app_context():
+        users = [User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash='x')
+                 for i in range(conversations + 1)]
+        db.session.add_all(users)
+        db.session.commit()
+        owner = users[0]
+        base = datetime(2024, 1, 1)
+        for peer in users[1:]:
+            key = Message.conversation_key_for(owner.id, peer.id)
+            db.session.execute(Message.__table__.insert(), [{
+                'sender_id': owner.id if i % 2 else peer.id,
+                'receiver_id': peer.id if i % 2 else owner.id,
+                'conversation_key': key,
+                'content': f'message {i}',
+                'timestamp': base + timedelta(seconds=i)
+            } for i in range(messages)])
+        db.session.commit()
+        token = create_access_token(identity=str(owner.id))
+        return app, [peer.id for peer in users[1:]], token
+
+
+def timed(client, urls, headers, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for url in urls:
+            response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.json
+    return (time.perf_counter() - start) / (rounds * len(urls)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, peer_ids, token = build_app(os.path.join(tmp, 'bench.db'), args.conversations, args.messages)
+        from app.utils.history_cache import history_cache
+
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        urls = [f'/api/messages/history/{peer_id}?per_page={PER_PAGE}&before_id=0' for peer_id in peer_ids]
+
+        history_cache.enabled = False
+        uncached_ms = timed(client, urls, headers, args.rounds)
+
+        history_cache.enabled = True
+        history_cache.clear()
+        timed(client, urls, headers, 1)
+        cached_ms = timed(client, urls, headers, args.rounds)
+
+        stats = history_cache.stats()
+        print(f'{args.conversations} conversations x {args.messages} messages, {PER_PAGE} per page')
+        print(f'database: {uncached_ms:7.2f} ms per request')
+        print(f'cache:    {cached_ms:7.2f} ms per request  '
+              f'(hit rate {stats["hitRate"]}, {stats["estimatedBytes"] / 1024:.0f} KiB cached)')
+
+
+if __name__ == '__main__':
+    main()
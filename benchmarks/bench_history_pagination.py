@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chat history page latency, page (OFFSET + COUNT) vs cursor mode
+
+Fills one direct conversation with a growing number of messages and times
+GET /api/messages/history/:userId through the Flask test client for the
+first, middle and last page in page mode (?page=N) and for the equivalent
+positions in cursor mode (?before_id=...). Rate limiting is disabled.
+
+Usage:
+    python benchmarks/bench_history_pagination.py [--sizes 10000 100000 1000000] [--rounds 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PER_PAGE = 50
+INSERT_CHUNK = 20000
+
+
+def build_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db, limiter
+    from app.models.user import User
+    from flask_jwt_extended import create_access_token
+
+    app = create_app('development')
+    limiter.enabled = False
+    with app.app_context():
+        users = [User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash='x') for i in range(2)]
+        db.session.add_all(users)
+        db.session.commit()
+        token = create_access_token(identity=str(users[0].id))
+        return app, users[0].id, users[1].id, token
+
+
+def fill(app, sender_id, receiver_id, start, stop):
+    """Insert messages start..stop-1, alternating direction, one second apart"""
+    from app import db
+    from app.models.message import Message
+
+    key = Message.conversation_key_for(sender_id, receiver_id)
+    base = datetime(2024, 1, 1)
+    with app.app_context():
+        for chunk in range(start, stop, INSERT_CHUNK):
+            rows = [{
+                'sender_id': sender_id if i % 2 else receiver_id,
+                'receiver_id': receiver_id if i % 2 else sender_id,
+                'conversation_key': key,
+                'content': f'message {i}',
+                'timestamp': base + timedelta(seconds=i)
+            } for i in range(chunk, min(chunk + INSERT_CHUNK, stop))]
+            db.session.execute(Message.__table__.insert(), rows)
+            db.session.commit()
+
+
+def timed(client, url, headers, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.json
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, sender_id, receiver_id, token = build_app(os.path.join(tmp, 'bench.db'))
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        url = f'/api/messages/history/{receiver_id}?per_page={PER_PAGE}'
+
+        print(f"{'messages':>9}  {'position':<7}  {'page mode':>10}  {'cursor mode':>11}")
+        filled = 0
+        for size in sorted(args.sizes):
+            fill(app, sender_id, receiver_id, filled, size)
+            filled = size
+            pages = (size + PER_PAGE - 1) // PER_PAGE
+            # Message ids follow insertion order, so a page and a cursor line up
+            positions = [('first', 1, 'after_id=0'),
+                         ('middle', pages // 2, f'before_id={(pages // 2 - 1) * PER_PAGE + 1}'),
+                         ('last', pages, 'before_id=0')]
+            for name, page, cursor in positions:
+                page_ms = timed(client, f'{url}&page={page}', headers, args.rounds)
+                cursor_ms = timed(client, f'{url}&{cursor}', headers, args.rounds)
+                print(f'{size:>9}  {name:<7}  {page_ms:>7.2f} ms  {cursor_ms:>8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
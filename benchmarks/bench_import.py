@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bulk history import into SQLite
+
+Generates an NDJSON history of direct and room messages between existing
+users and imports it with app.importer.HistoryImporter, reporting messages
+per second with the indexes rebuilt at the end (default), then for a
+smaller import into the now large database with the indexes maintained
+during the load (--keep-indexes), next to committing one ORM Message per
+row like the socket handlers do (on a small sample). Everything runs
+against one database, since the app reads DATABASE_URL once per process.
+
+Usage:
+    python benchmarks/bench_import.py [--messages 1000000] [--users 1000] [--batch-size 50000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROOMS = 20
+
+# Each user writes to this many other users
+CONTACTS = 20
+PER_ROW_SAMPLE = 2000
+
+
+def build_app(db_path, users):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['USERNAME_INDEX_ENABLED'] = 'false'
+    from app import create_app, db
+    from app.models.user import User
+
+    app = create_app('development')
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'} for i in range(users)
+        ])
+        db.session.commit()
+    return app
+
+
+def write_history(path, messages, users):
+    rng = random.Random(1)
+    with open(path, 'w') as output:
+        for i in range(messages):
+            sender = rng.randrange(users)
+            record = {
+                'sender': f'user{sender}',
+                'content': f'imported message {i} ' + 'lorem ipsum ' * rng.randint(0, 5),
+                'timestamp': f'2020-01-01T00:00:00.{i % 1000000:06d}'
+            }
+            if i % 10 == 0:
+                record['room'] = f'room{rng.randrange(ROOMS)}'
+            else:
+                record['receiver'] = f'user{(sender + rng.randint(1, CONTACTS)) % users}'
+            output.write(json.dumps(record) + '\n')
+
+
+def run_import(app, path, batch_size, keep_indexes):
+    from app import db
+    from app.importer import HistoryImporter, read_records
+
+    with app.app_context(), open(path) as stream, db.engine.connect() as connection:
+        importer = HistoryImporter(connection, batch_size=batch_size, keep_indexes=keep_indexes)
+        return importer.run(read_records(stream, 'ndjson'))
+
+
+def per_row(app, path):
+    """Commit one ORM Message per line, like replaying send_message events"""
+    from app import db
+    from app.models.message import Message
+    from app.models.user import User
+
+    with app.app_context(), open(path) as stream:
+        start = time.perf_counter()
+        for count, line in enumerate(stream):
+            if count == PER_ROW_SAMPLE:
+                break
+            record = json.loads(line)
+            if 'receiver' not in record:
+                continue
+            sender = User.query.filter_by(username=record['sender']).first()
+            receiver = User.query.filter_by(username=record['receiver']).first()
+            db.session.add(Message(sender_id=sender.id, receiver_id=receiver.id, content=record['content']))
+            db.session.commit()
+        return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'history.ndjson')
+        write_history(path, args.messages, args.users)
+        print(f'{args.messages:,} messages, {args.users:,} users, {os.path.getsize(path) / 1e6:.0f} MB of NDJSON')
+
+        app = build_app(os.path.join(tmp, 'bench.db'), args.users)
+        stats = run_import(app, path, args.batch_size, False)
+        print(f"{'rebuild indexes':<16}  {stats.messages:>10,} messages in {stats.elapsed:6.1f} s  "
+              f'{stats.rate:>10,.0f} messages/s')
+
+        small = os.path.join(tmp, 'small.ndjson')
+        write_history(small, max(1, args.messages // 10), args.users)
+        stats = run_import(app, small, args.batch_size, True)
+        print(f"{'keep indexes':<16}  {stats.messages:>10,} messages in {stats.elapsed:6.1f} s  "
+              f'{stats.rate:>10,.0f} messages/s (into the imported database)')
+
+        print(f"{'per-row commits':<16}  {per_row(app, path):>39,.0f} messages/s (first {PER_ROW_SAMPLE:,} lines)")
+
+
+if __name__ == '__main__':
+    main()
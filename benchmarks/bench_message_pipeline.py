@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-message commit vs group-commit pipeline for message inserts
+
+Usage:
+    python benchmarks/bench_message_pipeline.py [--messages 5000] [--batch 500] [--delay-ms 20]
+
+Runs against a throwaway SQLite file so fsync cost is included.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db
+    from app.models.user import User
+
+    app = create_app('development')
+    with app.app_context():
+        users = [User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash='x') for i in range(2)]
+        db.session.add_all(users)
+        db.session.commit()
+        return app, users[0].id, users[1].id
+
+
+def bench_per_message_commit(app, sender_id, receiver_id, count):
+    from app import db
+    from app.models.message import Message
+
+    with app.app_context():
+        start = time.perf_counter()
+        for i in range(count):
+            message = Message(sender_id=sender_id, receiver_id=receiver_id, content=f'message {i}')
+            db.session.add(message)
+            db.session.commit()
+            message.to_dict()
+        return time.perf_counter() - start
+
+
+def bench_pipeline(app, sender_id, receiver_id, count, max_batch, max_delay_ms):
+    from app.models.message import Message
+    from app.websocket.pipeline import MessagePipeline
+
+    app.config['MESSAGE_PIPELINE_ENABLED'] = True
+    app.config['MESSAGE_PIPELINE_MAX_BATCH'] = max_batch
+    app.config['MESSAGE_PIPELINE_MAX_DELAY_MS'] = max_delay_ms
+    pipeline = MessagePipeline()
+    pipeline.init_app(app)
+
+    done = threading.Event()
+    acked = []
+
+    def on_commit(message_dict):
+        acked.append(message_dict['id'])
+        if len(acked) == count:
+            done.set()
+
+    start = time.perf_counter()
+    for i in range(count):
+        pipeline.submit(Message(sender_id=sender_id, receiver_id=receiver_id, content=f'message {i}'), on_commit)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    pipeline.close()
+    return elapsed, pipeline.batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--delay-ms', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, sender_id, receiver_id = build_app(os.path.join(tmp, 'bench.db'))
+
+        elapsed = bench_per_message_commit(app, sender_id, receiver_id, args.messages)
+        print(f'per-message commit : {args.messages} messages in {elapsed:.3f}s '
+              f'({args.messages / elapsed:,.0f} msg/s)')
+
+        elapsed, batches = bench_pipeline(app, sender_id, receiver_id, args.messages, args.batch, args.delay_ms)
+        print(f'group-commit       : {args.messages} messages in {elapsed:.3f}s '
+              f'({args.messages / elapsed:,.0f} msg/s, {batches} batches, '
+              f'max batch {args.batch}, max delay {args.delay_ms}ms)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark: message search, FTS5 index vs substring scan
+
+Fills one direct conversation with a growing number of messages built from
+a fixed vocabulary and times the first page of search_messages() for a
+rare and a common word, once through the SQLite FTS5 index and once with
+the LIKE fallback used on engines without a full-text index.
+
+Usage:
+    python benchmarks/bench_message_search.py [--sizes 10000 100000 1000000] [--rounds 10]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PER_PAGE = 20
+INSERT_CHUNK = 20000
+VOCABULARY = [f'word{i}' for i in range(5000)]
+
+
+def build_app(db_path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from app import create_app, db
+    from app.models.user import User
+
+    app = create_app('development')
+    with app.app_context():
+        users = [User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash='x') for i in range(2)]
+        db.session.add_all(users)
+        db.session.commit()
+        return app, users[0].id, users[1].id
+
+
+def fill(app, sender_id, receiver_id, start, stop):
+    """Insert messages start..stop-1 of eight words each"""
+    from app import db
+    from app.models.message import Message
+
+    key = Message.conversation_key_for(sender_id, receiver_id)
+    rng = random.Random(start)
+    with app.app_context():
+        for chunk in range(start, stop, INSERT_CHUNK):
+            rows = [{
+                'sender_id': sender_id,
+                'receiver_id': receiver_id,
+                'conversation_key': key,
+                # Skewed towards low word numbers: word0 is in about a third of the messages
+                'content': ' '.join(VOCABULARY[int(len(VOCABULARY) * rng.random() ** 3)] for _ in range(8))
+            } for _ in range(chunk, min(chunk + INSERT_CHUNK, stop))]
+            db.session.execute(Message.__table__.insert(), rows)
+            db.session.commit()
+
+
+def timed(app, text, user_id, dialect, rounds):
+    from app.utils.search import search_messages, visible_to
+
+    with app.app_context():
+        start = time.perf_counter()
+        for _ in range(rounds):
+            messages, _ = search_messages(text, visible_to(user_id), None, PER_PAGE, dialect=dialect)
+        return (time.perf_counter() - start) / rounds * 1000, len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, sender_id, receiver_id = build_app(os.path.join(tmp, 'bench.db'))
+
+        print(f"{'messages':>9}  {'query':<10}  {'FTS5':>10}  {'LIKE scan':>10}")
+        filled = 0
+        for size in sorted(args.sizes):
+            fill(app, sender_id, receiver_id, filled, size)
+            filled = size
+            for text in ('word0', 'word4321'):
+                fts_ms, _ = timed(app, text, sender_id, 'sqlite', args.rounds)
+                like_ms, _ = timed(app, text, sender_id, 'default', args.rounds)
+                print(f'{size:>9}  {text:<10}  {fts_ms:>7.2f} ms  {like_ms:>7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark: removing expired history, retention batches vs one DELETE
+
+Fills one direct conversation with expired messages and removes them once
+with the retention job at several batch sizes and once with a single
+DELETE statement. Reports the removal rate and the longest write
+transaction, which is how long other writers may have to wait on the
+database lock (SQLite) or on the deleted rows. The pause between batches
+is disabled so only the work itself is timed.
+
+Usage:
+    python benchmarks/bench_retention.py [--messages 200000] [--batch-sizes 100 500 5000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_history_pagination import build_app, fill  # noqa: E402
+
+
+class TransactionTimer:
+    """Longest time between BEGIN and COMMIT on the engine"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.longest = 0
+        self._started = None
+        event.listen(engine, 'begin', self._begin)
+        event.listen(engine, 'commit', self._commit)
+
+    def _begin(self, connection):
+        self._started = time.perf_counter()
+
+    def _commit(self, connection):
+        if self._started is not None:
+            self.longest = max(self.longest, time.perf_counter() - self._started)
+            self._started = None
+
+
+def delete_at_once(app, sender_id, receiver_id, cutoff):
+    from app import db
+    from app.models.message import Message
+
+    with app.app_context():
+        db.session.execute(Message.__table__.delete().where(
+            Message.conversation_key == Message.conversation_key_for(sender_id, receiver_id),
+            Message.timestamp < cutoff
+        ))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 500, 5000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, sender_id, receiver_id, _ = build_app(os.path.join(tmp, 'bench.db'))
+        from app import db
+        from app.models.conversation import Conversation
+        from app.models.message import Message
+        from app.retention import retention
+
+        retention.direct_days = 1
+        retention.pause = 0
+        # fill() dates messages from 2024-01-01; a newer one is always kept
+        now = datetime(2030, 1, 1)
+        with app.app_context():
+            timer = TransactionTimer(db.engine)
+
+        print(f'{args.messages:,} expired messages')
+        print(f"{'method':<20}  {'time':>8}  {'messages/s':>11}  {'longest transaction':>19}")
+        methods = [(f'retention, batch {size}', size) for size in args.batch_sizes] + [('single DELETE', None)]
+        for name, batch_size in methods:
+            fill(app, sender_id, receiver_id, 0, args.messages)
+            with app.app_context():
+                # The retention job walks conversations, so the summary must exist
+                newest = Message(sender_id=sender_id, receiver_id=receiver_id, content='newest',
+                                 conversation_key=Message.conversation_key_for(sender_id, receiver_id),
+                                 timestamp=now)
+                db.session.add(newest)
+                Conversation.record_messages([newest])
+                db.session.commit()
+
+            timer.longest = 0
+            start = time.perf_counter()
+            if batch_size is None:
+                delete_at_once(app, sender_id, receiver_id, now - timedelta(days=1))
+            else:
+                retention.batch_size = batch_size
+                with app.app_context():
+                    report = retention.run_once(now=now)
+                assert report['removedDirect'] == args.messages, report
+            elapsed = time.perf_counter() - start
+            print(f'{name:<20}  {elapsed:>6.2f} s  {args.messages / elapsed:>11,.0f}  {timer.longest * 1000:>16.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
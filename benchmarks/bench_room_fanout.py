@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark: room fan-out cost against member count
+
+Compares emitting the sender ack and the room broadcast through
+socketio.emit (one JSON encoding per call) with EncodedPayload/emit_encoded
+(one encoding shared by every frame). Sockets are registered directly with
+the Socket.IO manager and outgoing frames are discarded, so the numbers
+cover encoding and dispatch only, not network I/O.
+
+Usage:
+    python benchmarks/bench_room_fanout.py [--members 10 100 1000 5000] [--rounds 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def sample_message(content_size=200):
+    now = datetime.utcnow().isoformat()
+    return {
+        'id': 123456,
+        'senderId': 1,
+        'receiverId': None,
+        'roomId': 1,
+        'content': 'x' * content_size,
+        'timestamp': now,
+        'editedAt': None,
+        'deletedAt': None,
+        'isDeleted': False,
+        'isEdited': False
+    }
+
+
+def populate_room(socketio, members):
+    manager = socketio.server.manager
+    manager.rooms.clear()
+    sids = []
+    for i in range(members):
+        sid = manager.connect(f'eio-{i}', '/')
+        manager.enter_room(sid, '/', 'room_1')
+        sids.append(sid)
+    return sids
+
+
+def bench_emit_per_call(socketio, sender_sid, message_dict, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        socketio.emit('message_sent', {'success': True, 'message': message_dict}, to=sender_sid)
+        socketio.emit('receive_room_message', {'success': True, 'message': message_dict},
+                      to='room_1', skip_sid=sender_sid)
+    return (time.perf_counter() - start) / rounds
+
+
+def bench_encode_once(sender_sid, message_dict, rounds):
+    from app.websocket.broadcast import EncodedPayload, emit_encoded
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        payload = EncodedPayload({'success': True, 'message': message_dict})
+        emit_encoded('message_sent', payload, to=sender_sid)
+        emit_encoded('receive_room_message', payload, to='room_1', skip_sid=sender_sid)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--members', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--content-size', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import create_app, socketio
+
+        create_app('development')
+        socketio.server._send_eio_packet = lambda eio_sid, pkt: None
+        socketio.server._send_packet = lambda eio_sid, pkt: pkt.encode()
+        message_dict = sample_message(args.content_size)
+
+        print(f"{'members':>8}  {'emit per call':>14}  {'encode once':>12}  {'speedup':>8}")
+        for members in args.members:
+            sids = populate_room(socketio, members)
+            per_call = bench_emit_per_call(socketio, sids[0], message_dict, args.rounds)
+            once = bench_encode_once(sids[0], message_dict, args.rounds)
+            print(f'{members:>8}  {per_call * 1e6:>11.1f} us  {once * 1e6:>9.1f} us  {per_call / once:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: serializing history pages, ORM objects vs column rows
+
+Fills one direct conversation and serializes pages of it the way the
+history endpoints used to, loading Message objects and calling to_dict()
+before encoding with Flask's default JSON provider, and the way they do
+now, selecting only the serialized columns as rows, converting them with
+message_row_to_dict() and encoding with the app's JSON provider. Reports
+messages serialized per second for the load and convert step, the JSON
+step and both together.
+
+Usage:
+    python benchmarks/bench_serialization.py [--messages 100000] [--page-sizes 50 100 1000] [--rounds 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_history_pagination import build_app, fill  # noqa: E402
+
+
+def orm_dicts(query, per_page):
+    return [message.to_dict() for message in query.limit(per_page).all()]
+
+
+def row_dicts(query, per_page):
+    from app.models.message import MESSAGE_COLUMNS, message_row_to_dict
+
+    return [message_row_to_dict(row) for row in query.with_entities(*MESSAGE_COLUMNS).limit(per_page).all()]
+
+
+def rate(function, rounds, per_page):
+    """Messages per second of function() over rounds calls, and its last result"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = function()
+    return rounds * per_page / (time.perf_counter() - start), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[50, 100, 1000])
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, sender_id, receiver_id, _ = build_app(os.path.join(tmp, 'bench.db'))
+        fill(app, sender_id, receiver_id, 0, args.messages)
+        from flask.json.provider import DefaultJSONProvider
+        from app import db
+        from app.models.message import Message
+        from app.utils import json_provider
+
+        # Compact output as in production; debug mode indents responses
+        app.debug = False
+        default_json = DefaultJSONProvider(app)
+        encoder = 'orjson' if json_provider.orjson is not None else 'json'
+        print(f'{args.messages:,} messages, app JSON provider uses {encoder}; messages/s:')
+        print(f"{'page':>5}  {'method':<8}  {'load + dicts':>12}  {'JSON':>12}  {'total':>12}")
+        for per_page in args.page_sizes:
+            with app.app_context():
+                query = Message.query.filter_by(
+                    conversation_key=Message.conversation_key_for(sender_id, receiver_id)
+                ).order_by(Message.timestamp.desc(), Message.id.desc())
+                methods = [('ORM', orm_dicts, default_json), ('rows', row_dicts, app.json)]
+                for name, load, provider in methods:
+                    def load_page():
+                        page = load(query, per_page)
+                        # Requests end their session; identity map and all
+                        db.session.remove()
+                        return page
+
+                    load_rate, page = rate(load_page, args.rounds, per_page)
+                    json_rate, _ = rate(lambda: provider.response({'messages': page}), args.rounds, per_page)
+                    total = 1 / (1 / load_rate + 1 / json_rate)
+                    print(f'{per_page:>5}  {name:<8}  {load_rate:>12,.0f}  {json_rate:>12,.0f}  {total:>12,.0f}')
+
+
+if __name__ == '__main__':
+    main()
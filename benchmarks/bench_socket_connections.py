@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark: concurrent WebSocket connections per server mode
+
+Starts start_server.py in each requested SOCKETIO_ASYNC_MODE against a
+throwaway SQLite database, opens N authenticated websocket connections for
+one user (every connection joins that user's room), then sends one direct
+message to the user and times its delivery to all N sockets. Reports
+connect throughput, server memory per socket and fan-out latency.
+
+The client side needs gevent (one greenlet per connection) and the server
+modes need their own package (gevent or eventlet). Raise the open file limit
+(ulimit -n) above the connection count on both sides.
+
+Usage:
+    python benchmarks/bench_socket_connections.py [--connections 1000 5000] [--modes threading gevent]
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+import urllib.request  # noqa: E402
+
+import gevent  # noqa: E402
+from gevent.event import Event  # noqa: E402
+from gevent.pool import Pool  # noqa: E402
+import simple_websocket  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def request_json(url, payload=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    data = json.dumps(payload).encode() if payload is not None else None
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers)) as response:
+        return json.loads(response.read())
+
+
+def register(base_url, name):
+    data = request_json(f'{base_url}/api/auth/register', {
+        'username': name, 'email': f'{name}@example.com', 'password': 'Bench1234'
+    })['data']
+    return data['token'], data['user']['id']
+
+
+def rss_kb(pid):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+class BenchSocket:
+    """Minimal Socket.IO client speaking Engine.IO v4 over a websocket"""
+
+    def __init__(self, ws_url, token, on_event=None):
+        self.ws = simple_websocket.Client.connect(ws_url)
+        # Send the Socket.IO connect right away; the Engine.IO open packet is
+        # read (and ignored) by the reader
+        self.ws.send('40' + json.dumps({'token': token}))
+        self.connected = Event()
+        self.on_event = on_event
+        self.reader = gevent.spawn(self._read)
+
+    def _read(self):
+        try:
+            while True:
+                frame = self.ws.receive()
+                if frame == '2':
+                    self.ws.send('3')
+                elif frame.startswith('42'):
+                    event, payload = json.loads(frame[2:])
+                    if event == 'connected':
+                        self.connected.set()
+                    elif self.on_event:
+                        self.on_event(event, payload)
+        except (simple_websocket.ConnectionClosed, OSError):
+            pass
+
+    def emit(self, event, payload):
+        self.ws.send('42' + json.dumps([event, payload]))
+
+    def close(self):
+        self.reader.kill()
+        try:
+            self.ws.close()
+        except simple_websocket.ConnectionClosed:
+            pass
+
+
+def run_mode(mode, counts, port):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   SOCKETIO_ASYNC_MODE=mode,
+                   PORT=str(port),
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                   SOCKET_RATE_LIMIT_ENABLED='false')
+        server = subprocess.Popen([sys.executable, 'start_server.py'], cwd=ROOT, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f'http://127.0.0.1:{port}'
+        ws_url = f'ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket'
+        try:
+            for _ in range(100):
+                try:
+                    request_json(f'{base_url}/api')
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            receiver_token, receiver_id = register(base_url, f'recv{port}')
+            sender_token, _ = register(base_url, f'send{port}')
+            sender = BenchSocket(ws_url, sender_token)
+            sender.connected.wait(10)
+
+            sockets = []
+            for count in counts:
+                idle_kb = rss_kb(server.pid)
+                delivered = []
+                all_delivered = Event()
+
+                def on_event(event, payload):
+                    if event == 'receive_message':
+                        delivered.append(time.perf_counter())
+                        if len(delivered) == count:
+                            all_delivered.set()
+
+                def open_socket(_):
+                    sock = BenchSocket(ws_url, receiver_token, on_event)
+                    if sock.connected.wait(60):
+                        return sock
+                    sock.close()
+                    return None
+
+                start = time.perf_counter()
+                opened = [sock for sock in Pool(200).imap_unordered(open_socket, range(count)) if sock]
+                connect_time = time.perf_counter() - start
+                sockets.extend(opened)
+                gevent.sleep(1)
+                per_socket_kb = (rss_kb(server.pid) - idle_kb) / max(1, len(opened))
+
+                sent_at = time.perf_counter()
+                sender.emit('send_message', {'receiverId': receiver_id, 'content': 'fan-out probe'})
+                all_delivered.wait(60)
+                fanout = (delivered[-1] - sent_at) * 1000 if delivered else float('nan')
+
+                print(f'{mode:>9}  {len(opened):>7}/{count:<7}  {len(opened) / connect_time:>9,.0f}/s  '
+                      f'{per_socket_kb:>8.1f} KB  {len(delivered):>9}  {fanout:>9.1f} ms')
+
+                for sock in sockets:
+                    sock.close()
+                sockets = []
+                gevent.sleep(1)
+            sender.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, nargs='+', default=[1000])
+    parser.add_argument('--modes', nargs='+', default=['threading', 'gevent'])
+    parser.add_argument('--port', type=int, default=3900)
+    args = parser.parse_args()
+
+    print(f"{'mode':>9}  {'sockets':>15}  {'connect':>11}  {'memory/sock':>11}  {'delivered':>9}  {'fan-out':>12}")
+    for offset, mode in enumerate(args.modes):
+        run_mode(mode, args.connections, args.port + offset)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: catching up after going offline, delta sync vs re-downloading history
+
+Fills a number of direct conversations of the benchmark user, then changes
+a few messages (half edits of random old messages, half new messages) and
+times how a returning client learns about them: one GET /api/sync from the
+change sequence number it last saw, or the only way without a change feed,
+re-downloading every conversation (GET /api/messages/export/:userId).
+Existing messages are numbered by id, as the startup migration does for
+older databases. Rate limiting and the history cache are disabled.
+
+Usage:
+    python benchmarks/bench_sync.py [--conversations 20] [--messages 10000] [--changes 10 100 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_history_pagination import build_app, fill  # noqa: E402
+
+
+def add_peers(app, user_id, conversations, messages):
+    """Create peers with a filled conversation each; returns their ids"""
+    from app import db
+    from app.models.user import User
+
+    with app.app_context():
+        peers = [User(username=f'peer{i}', email=f'peer{i}@example.com', password_hash='x')
+                 for i in range(conversations)]
+        db.session.add_all(peers)
+        db.session.commit()
+        peer_ids = [peer.id for peer in peers]
+    for peer_id in peer_ids:
+        fill(app, user_id, peer_id, 0, messages)
+    return peer_ids
+
+
+def number_existing(app):
+    """Give filled messages change sequence numbers; returns the head"""
+    from app import db
+    from app.models.change import ChangeSequence
+    from app.models.message import Message
+
+    with app.app_context():
+        messages = Message.__table__
+        db.session.execute(messages.update().values(change_seq=messages.c.id))
+        head = db.session.execute(db.select(db.func.max(messages.c.id))).scalar()
+        db.session.execute(ChangeSequence.__table__.update().values(value=head))
+        db.session.commit()
+        return head
+
+
+def change(app, user_id, peer_ids, count):
+    """Edit count / 2 random messages and send the rest, one transaction each"""
+    from app import db
+    from app.models.conversation import Conversation
+    from app.models.message import Message
+    from app.utils.conditional import touch_history
+
+    with app.app_context():
+        max_id = db.session.execute(db.select(db.func.max(Message.id))).scalar()
+        for i in range(count):
+            if i % 2:
+                message = db.session.get(Message, random.randint(1, max_id))
+                message.content = f'edited {i}'
+                message.edited_at = datetime.utcnow()
+            else:
+                message = Message(sender_id=random.choice(peer_ids), receiver_id=user_id, content=f'new {i}')
+                message.conversation_key = Message.conversation_key_for(message.sender_id, user_id)
+                db.session.add(message)
+                db.session.flush()
+                Conversation.record_messages([message])
+            touch_history([message])
+            db.session.commit()
+
+
+def head(app):
+    from app.utils import changes
+
+    with app.app_context():
+        return changes.head()
+
+
+def sync(client, headers, since):
+    size = 0
+    while True:
+        response = client.get(f'/api/sync?since={since}&limit=500', headers=headers)
+        assert response.status_code == 200, response.json
+        size += len(response.data)
+        since = response.json['data']['sync']['nextSince']
+        if not response.json['data']['sync']['hasMore']:
+            return size
+
+
+def redownload(client, headers, peer_ids):
+    size = 0
+    for peer_id in peer_ids:
+        response = client.get(f'/api/messages/export/{peer_id}', headers=headers)
+        assert response.status_code == 200
+        size += len(response.data)
+    return size
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    size = function(*args)
+    return (time.perf_counter() - start) * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--changes', type=int, nargs='+', default=[10, 100, 1000])
+    args = parser.parse_args()
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, user_id, _, token = build_app(os.path.join(tmp, 'bench.db'))
+        from app.utils.history_cache import history_cache
+        history_cache.enabled = False
+
+        peer_ids = add_peers(app, user_id, args.conversations, args.messages)
+        since = number_existing(app)
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+
+        print(f'{args.conversations} conversations of {args.messages:,} messages')
+        print(f"{'changes':>8}  {'method':<11}  {'time':>11}  {'bytes':>12}")
+        for count in args.changes:
+            change(app, user_id, peer_ids, count)
+            for name, function, function_args in [('delta sync', sync, (client, headers, since)),
+                                                  ('re-download', redownload, (client, headers, peer_ids))]:
+                elapsed, size = timed(function, *function_args)
+                print(f'{count:>8}  {name:<11}  {elapsed:>8.1f} ms  {size:>12,}')
+            since = head(app)
+
+
+if __name__ == '__main__':
+    main()
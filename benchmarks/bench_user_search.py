@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: user search, in-memory username index vs ILIKE '%q%'
+
+Fills the users table with generated usernames, builds the username index
+and times UsernameIndex.search() against the previous
+User.username.ilike('%q%') query for prefix, substring, two-character and
+no-match queries. Also reports index build time and memory growth.
+
+Usage:
+    python benchmarks/bench_user_search.py [--users 1000000] [--rounds 200]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+INSERT_CHUNK = 50000
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'to', 'ne', 'su', 'vi', 'de', 'po', 'ja', 'ri', 'an', 'el', 'or', 'us']
+QUERIES = [('prefix', 'kalo'), ('substring', 'ravi'), ('two chars', 'xq'), ('no match', 'zzzz')]
+
+
+def rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_app(db_path, count):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['USERNAME_INDEX_ENABLED'] = 'false'
+    from app import create_app, db
+    from app.models.user import User
+
+    app = create_app('development')
+    rng = random.Random(1)
+    with app.app_context():
+        for chunk in range(0, count, INSERT_CHUNK):
+            db.session.execute(User.__table__.insert(), [{
+                'username': ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))) + f'_{i}',
+                'email': f'user{i}@example.com',
+                'password_hash': 'x'
+            } for i in range(chunk, min(chunk + INSERT_CHUNK, count))])
+            db.session.commit()
+    return app
+
+
+def timed(function, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = function()
+    return (time.perf_counter() - start) / rounds * 1000, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = build_app(os.path.join(tmp, 'bench.db'), args.users)
+        from app.models.user import User
+        from app.utils.username_index import username_index
+
+        with app.app_context():
+            app.config['USERNAME_INDEX_ENABLED'] = True
+            before = rss_mib()
+            start = time.perf_counter()
+            username_index.init_app(app)
+            build_s = time.perf_counter() - start
+            print(f'{len(username_index)} users: index built in {build_s:.1f} s, '
+                  f'peak RSS grew {rss_mib() - before:.0f} MiB')
+
+            print(f"{'query':<20}  {'index':>12}  {'ILIKE scan':>12}")
+            for name, query in QUERIES:
+                index_ms, found = timed(lambda: username_index.search(query, limit=10), args.rounds)
+                scan_ms, _ = timed(lambda: User.query.filter(User.username.ilike(f'%{query}%')).limit(10).all(),
+                                   max(1, args.rounds // 20))
+                print(f'{name + " " + repr(query):<20}  {index_ms:>9.3f} ms  {scan_ms:>9.2f} ms  ({found} found)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bytes on the wire and encode cost of the JSON and compact protocols
+
+Builds Message.to_dict() payloads for a new direct message, a new room
+message, an edit and a delete, and encodes each one as the Engine.IO frames a
+JSON socket and a compact-protocol socket receive. Sizes are the encoded
+frame payloads (text as UTF-8 plus the MessagePack attachment), excluding
+WebSocket framing. Encode time covers one fresh EncodedPayload per event.
+
+Usage:
+    python benchmarks/bench_wire_protocol.py [--rounds 20000] [--content-size 80]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def frame_bytes(frames):
+    return sum(len(frame.data.encode('utf-8') if isinstance(frame.data, str) else frame.data)
+               for frame in frames)
+
+
+def sample_events(content_size):
+    from app.models.message import Message
+
+    sent = datetime.utcnow()
+    direct = Message(id=123456, sender_id=17, receiver_id=42, content='x' * content_size, timestamp=sent)
+    room = Message(id=123457, sender_id=17, room_id=9, content='x' * content_size, timestamp=sent)
+    edited = Message(id=123456, sender_id=17, receiver_id=42, content='y' * content_size, timestamp=sent,
+                     edited_at=sent + timedelta(seconds=30))
+    deleted = Message(id=123457, sender_id=17, room_id=9, content='x' * content_size, timestamp=sent,
+                      deleted_at=sent + timedelta(seconds=60))
+    return [
+        ('receive_message', direct.to_dict()),
+        ('receive_room_message', room.to_dict()),
+        ('message_edited', edited.to_dict()),
+        ('message_deleted', deleted.to_dict())
+    ]
+
+
+def bench_encode(event, data, rounds, compact):
+    from app.websocket.broadcast import EncodedPayload
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        payload = EncodedPayload({'success': True, 'message': data})
+        if compact:
+            payload.compact_frames(event)
+        else:
+            payload.frame(event)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20000)
+    parser.add_argument('--content-size', type=int, default=80)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import create_app
+        from app.websocket.broadcast import EncodedPayload
+
+        app = create_app('development')
+        with app.app_context():
+            events = sample_events(args.content_size)
+
+        print(f"{'event':<22}{'json':>8}{'compact':>9}{'saved':>7}  {'json enc':>9}  {'compact enc':>11}")
+        for event, data in events:
+            payload = EncodedPayload({'success': True, 'message': data})
+            json_size = frame_bytes([payload.frame(event)])
+            compact_size = frame_bytes(payload.compact_frames(event))
+            json_time = bench_encode(event, data, args.rounds, compact=False)
+            compact_time = bench_encode(event, data, args.rounds, compact=True)
+            print(f'{event:<22}{json_size:>6} B{compact_size:>7} B{1 - compact_size / json_size:>6.0%}'
+                  f'  {json_time * 1e6:>6.2f} us  {compact_time * 1e6:>8.2f} us')
+
+
+if __name__ == '__main__':
+    main()
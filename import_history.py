@@ -0,0 +1,70 @@
+"""
+Bulk chat history importer
+
+Reads NDJSON or CSV history records (see app/importer.py for the record
+format) and stores them in large batched transactions. Stop the chat
+servers first, or restart them afterwards: their history caches and
+catch-up buffers do not see imported messages.
+
+Usage:
+    python import_history.py history.ndjson
+    python import_history.py history.csv.gz --batch-size 100000
+    cat history.ndjson | python import_history.py - --format ndjson
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import create_app, db  # noqa: E402
+from app.importer import FORMATS, DEFAULT_BATCH_SIZE, HistoryImporter, read_records  # noqa: E402
+
+
+def open_input(path):
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def guess_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+def report(stats):
+    print(f"{stats.records:>12,} records  {stats.messages:>12,} messages  "
+          f"{stats.rate:>10,.0f} messages/s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help="input file (.ndjson, .jsonl, .csv, optionally .gz) or - for stdin")
+    parser.add_argument('--format', choices=FORMATS, help='input format (default: from the file extension)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'records per transaction (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help='maintain message indexes during the load instead of rebuilding them at the end '
+                             '(faster for small imports into a large database)')
+    args = parser.parse_args()
+
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+    with app.app_context(), open_input(args.path) as stream, db.engine.connect() as connection:
+        importer = HistoryImporter(connection, batch_size=args.batch_size,
+                                   keep_indexes=args.keep_indexes, progress=report)
+        stats = importer.run(read_records(stream, args.format or guess_format(args.path)))
+
+    print(json.dumps(stats.to_dict(), indent=2))
+    for example in stats.examples:
+        print(f'skipped {example}', file=sys.stderr)
+    return 0 if stats.messages or not stats.records else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,30 @@
-from app import create_app, socketio
+"""
+Standalone server entry point
+
+Runs the Socket.IO server in the mode selected by SOCKETIO_ASYNC_MODE:
+'gevent' or 'eventlet' serve every socket from a cooperative event loop
+(install the package first), 'threading' uses the Werkzeug development
+server with one OS thread per socket. The standard library is monkey-patched
+before the application is imported so database, bus and background tasks
+all run on the event loop.
+"""
 import os
+from dotenv import load_dotenv
+
+load_dotenv()
+ASYNC_MODE = os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'threading')
+
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+from app import create_app, socketio  # noqa: E402
 
-app = create_app('development')
+app = create_app(os.getenv('FLASK_ENV', 'development'))
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=3000, debug=False, allow_unsafe_werkzeug=True)
+    port = int(os.getenv('PORT', 3000))
+    socketio.run(app, host='0.0.0.0', port=port, debug=False,
+                 allow_unsafe_werkzeug=ASYNC_MODE == 'threading')
@@ -208,6 +208,321 @@ test_get_room_messages() {
   fi
 }
 
+test_set_room_retention() {
+  print_test "Set Room Retention"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X PUT '$BASE_URL/api/rooms/$ROOM_ID/retention' \
+     -H \"$(auth_header "$TOKEN")\" \
+     -H 'Content-Type: application/json' \
+     -d '{\"retentionDays\":30}'")
+
+  if echo "$RESPONSE" | jq -e '.success == true and .data.retentionDays == 30' >/dev/null; then
+    print_pass "Room retention set"
+  else
+    print_fail "Set room retention failed: $RESPONSE"
+  fi
+}
+
+test_retention_stats() {
+  print_test "Get Retention Stats"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/stats/retention' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and (.stats.policies | has("directDays"))' >/dev/null; then
+    print_pass "Get retention stats successful"
+  else
+    print_fail "Get retention stats failed: $RESPONSE"
+  fi
+}
+
+test_socket_stats() {
+  print_test "Get Socket Stats"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/stats/sockets' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and (.stats.limits | has("maxMessages"))' >/dev/null; then
+    print_pass "Get socket stats successful"
+  else
+    print_fail "Get socket stats failed: $RESPONSE"
+  fi
+}
+
+test_register_peer() {
+  print_test "Register Second User"
+
+  PEER_USERNAME=$(random_string)
+  RESPONSE=$(curl -s -X POST "$BASE_URL/api/auth/register" \
+    -H "Content-Type: application/json" \
+    -d "{\"username\":\"$PEER_USERNAME\",\"email\":\"$PEER_USERNAME@test.com\",\"password\":\"$PASSWORD\"}")
+
+  PEER_TOKEN=$(safe_jq "$RESPONSE" '.data.token')
+  PEER_ID=$(safe_jq "$RESPONSE" '.data.user.id')
+
+  if [ -n "$PEER_TOKEN" ]; then
+    sleep 0.3
+    print_pass "Second user registered (ID: $PEER_ID)"
+  else
+    print_fail "Second user registration failed: $RESPONSE"
+  fi
+}
+
+test_history_cursor() {
+  print_test "Get Chat History - Cursor Pagination"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/messages/history/$PEER_ID?before_id=0&per_page=20' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and .data.pagination.direction == "before" and (.data.pagination | has("nextCursor"))' >/dev/null; then
+    print_pass "Cursor history page returned"
+  else
+    print_fail "Cursor history failed: $RESPONSE"
+  fi
+}
+
+test_history_invalid_cursor() {
+  print_test "Get Chat History - Invalid Cursor"
+
+  RESPONSE=$(curl -s -X GET "$BASE_URL/api/messages/history/$PEER_ID?before_id=1&after_id=1" \
+    -H "$(auth_header "$TOKEN")")
+
+  if echo "$RESPONSE" | jq -e '.success == false' >/dev/null; then
+    print_pass "Conflicting cursors correctly rejected"
+  else
+    print_fail "Conflicting cursors should be rejected: $RESPONSE"
+  fi
+}
+
+test_room_messages_cursor() {
+  print_test "Get Room Messages - Cursor Pagination"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/rooms/$ROOM_ID/messages?after_id=0' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and .data.pagination.direction == "after"' >/dev/null; then
+    print_pass "Cursor room messages page returned"
+  else
+    print_fail "Cursor room messages failed: $RESPONSE"
+  fi
+}
+
+test_get_conversations() {
+  print_test "Get Conversations"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/conversations' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and (.data.conversations | type == "array")' >/dev/null; then
+    print_pass "Get conversations successful"
+  else
+    print_fail "Get conversations failed: $RESPONSE"
+  fi
+}
+
+test_mark_read_without_messages() {
+  print_test "Mark Conversation Read - No Messages Yet"
+
+  RESPONSE=$(curl -s -X POST "$BASE_URL/api/conversations/$PEER_ID/read" \
+    -H "$(auth_header "$TOKEN")")
+
+  if echo "$RESPONSE" | jq -e '.success == false' >/dev/null; then
+    print_pass "Unknown conversation correctly rejected"
+  else
+    print_fail "Unknown conversation should be rejected: $RESPONSE"
+  fi
+}
+
+test_history_cache_stats() {
+  print_test "Get History Cache Stats"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/stats/history-cache' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and (.stats | has("hitRate"))' >/dev/null; then
+    print_pass "Get history cache stats successful"
+  else
+    print_fail "Get history cache stats failed: $RESPONSE"
+  fi
+}
+
+test_search_messages() {
+  print_test "Search Messages"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/messages/search?q=hello' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and (.data.messages | type == "array")' >/dev/null; then
+    print_pass "Message search successful"
+  else
+    print_fail "Message search failed: $RESPONSE"
+  fi
+}
+
+test_search_messages_missing_query() {
+  print_test "Search Messages - Missing Query"
+
+  RESPONSE=$(curl -s -X GET "$BASE_URL/api/messages/search" \
+    -H "$(auth_header "$TOKEN")")
+
+  if echo "$RESPONSE" | jq -e '.success == false' >/dev/null; then
+    print_pass "Missing search query correctly rejected"
+  else
+    print_fail "Missing search query should be rejected: $RESPONSE"
+  fi
+}
+
+test_search_room_messages() {
+  print_test "Search Room Messages"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/rooms/$ROOM_ID/messages/search?q=hello' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and (.data.messages | type == "array")' >/dev/null; then
+    print_pass "Room message search successful"
+  else
+    print_fail "Room message search failed: $RESPONSE"
+  fi
+}
+
+test_export_room() {
+  print_test "Export Room Messages"
+
+  HEADERS=$(curl -s -o /dev/null -D - "$BASE_URL/api/rooms/$ROOM_ID/export" \
+    -H "$(auth_header "$TOKEN")")
+
+  if echo "$HEADERS" | grep -qi '^content-type: application/x-ndjson'; then
+    print_pass "Room export streamed as NDJSON"
+  else
+    print_fail "Room export failed: $HEADERS"
+  fi
+}
+
+test_export_conversation_gzip() {
+  print_test "Export Conversation - Gzip"
+
+  HEADERS=$(curl -s -o /dev/null -D - "$BASE_URL/api/messages/export/$PEER_ID?gzip=true" \
+    -H "$(auth_header "$TOKEN")")
+
+  if echo "$HEADERS" | grep -qi '^content-type: application/gzip'; then
+    print_pass "Conversation export streamed gzipped"
+  else
+    print_fail "Conversation export failed: $HEADERS"
+  fi
+}
+
+test_room_messages_not_modified() {
+  print_test "Get Room Messages - Conditional GET"
+
+  ETAG=$(curl -s -o /dev/null -D - "$BASE_URL/api/rooms/$ROOM_ID/messages" \
+    -H "$(auth_header "$TOKEN")" | grep -i '^etag:' | cut -d' ' -f2- | tr -d '\r')
+  STATUS=$(curl -s -o /dev/null -w '%{http_code}' "$BASE_URL/api/rooms/$ROOM_ID/messages" \
+    -H "$(auth_header "$TOKEN")" -H "If-None-Match: $ETAG")
+
+  if [ -n "$ETAG" ] && [ "$STATUS" = "304" ]; then
+    print_pass "Unchanged room messages answered with 304 Not Modified"
+  else
+    print_fail "Conditional GET failed (ETag: '$ETAG', status: $STATUS)"
+  fi
+}
+
+test_rooms_etag_changes() {
+  print_test "Get Rooms - ETag Changes With Membership"
+
+  ETAG=$(curl -s -o /dev/null -D - "$BASE_URL/api/rooms" \
+    -H "$(auth_header "$TOKEN")" | grep -i '^etag:' | cut -d' ' -f2- | tr -d '\r')
+  curl -s -X POST "$BASE_URL/api/rooms" \
+    -H "$(auth_header "$TOKEN")" \
+    -H 'Content-Type: application/json' \
+    -d '{"name":"ETag Room"}' >/dev/null
+  STATUS=$(curl -s -o /dev/null -w '%{http_code}' "$BASE_URL/api/rooms" \
+    -H "$(auth_header "$TOKEN")" -H "If-None-Match: $ETAG")
+
+  if [ -n "$ETAG" ] && [ "$STATUS" = "200" ]; then
+    print_pass "Room list sent again after joining a room"
+  else
+    print_fail "Room list ETag did not change (ETag: '$ETAG', status: $STATUS)"
+  fi
+}
+
+test_sync() {
+  print_test "Delta Sync"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/sync?since=0' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  NEXT_SINCE=$(safe_jq "$RESPONSE" '.data.sync.nextSince')
+  if echo "$RESPONSE" | jq -e '.success == true and (.data.memberships | length) > 0' >/dev/null; then
+    print_pass "Delta sync returned the room joins (next since: $NEXT_SINCE)"
+  else
+    print_fail "Delta sync failed: $RESPONSE"
+  fi
+}
+
+test_sync_up_to_date() {
+  print_test "Delta Sync - Up To Date"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/sync?since=$NEXT_SINCE' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and (.data.messages | length) == 0 and (.data.memberships | length) == 0 and .data.sync.hasMore == false' >/dev/null; then
+    print_pass "Nothing new after the last sync"
+  else
+    print_fail "Sync after the last change should be empty: $RESPONSE"
+  fi
+}
+
+test_sync_invalid_since() {
+  print_test "Delta Sync - Invalid Position"
+
+  RESPONSE=$(curl -s -X GET "$BASE_URL/api/sync?since=-1" \
+    -H "$(auth_header "$TOKEN")")
+
+  if echo "$RESPONSE" | jq -e '.success == false' >/dev/null; then
+    print_pass "Negative sync position correctly rejected"
+  else
+    print_fail "Negative sync position should be rejected: $RESPONSE"
+  fi
+}
+
+test_history_include_users() {
+  print_test "Get Chat History - Include Users"
+
+  RESPONSE=$(retry_request \
+    "curl -s -X GET '$BASE_URL/api/messages/history/$PEER_ID?include=users' \
+     -H \"$(auth_header "$TOKEN")\"")
+
+  if echo "$RESPONSE" | jq -e '.success == true and (.data.users | type == "array")' >/dev/null; then
+    print_pass "History returned with the users table"
+  else
+    print_fail "History with include=users failed: $RESPONSE"
+  fi
+}
+
+test_history_unknown_include() {
+  print_test "Get Chat History - Unknown Include"
+
+  RESPONSE=$(curl -s -X GET "$BASE_URL/api/messages/history/$PEER_ID?include=rooms" \
+    -H "$(auth_header "$TOKEN")")
+
+  if echo "$RESPONSE" | jq -e '.success == false' >/dev/null; then
+    print_pass "Unknown include correctly rejected"
+  else
+    print_fail "Unknown include should be rejected: $RESPONSE"
+  fi
+}
+
 # ---------- summary ----------
 
 print_summary() {
@@ -251,6 +566,28 @@ main() {
   test_update_profile
   test_create_room
   test_get_room_messages
+  test_socket_stats
+  test_register_peer
+  test_history_cursor
+  test_history_invalid_cursor
+  test_room_messages_cursor
+  test_get_conversations
+  test_mark_read_without_messages
+  test_history_cache_stats
+  test_search_messages
+  test_search_messages_missing_query
+  test_search_room_messages
+  test_export_room
+  test_export_conversation_gzip
+  test_room_messages_not_modified
+  test_rooms_etag_changes
+  test_sync
+  test_sync_up_to_date
+  test_sync_invalid_since
+  test_history_include_users
+  test_history_unknown_include
+  test_set_room_retention
+  test_retention_stats
   print_summary
 }
 
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Test script for the Redis-protocol message bus
+
+Runs in-process against a small RESP stand-in server started on a free local
+port (no Redis needed). Checks publish/subscribe and presence across two
+RespBackend instances, then serves the app with MESSAGE_BUS_URL pointing at
+the stand-in and checks that room messages reach JSON, compact and
+include=users sockets through the bus, including emits published by another
+process.
+"""
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+
+def encode_reply(value):
+    """Encode a reply in RESP2"""
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, list):
+        return b'*%d\r\n' % len(value) + b''.join(encode_reply(item) for item in value)
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    """One client connection to the stand-in server"""
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.channels = set()
+
+    def write(self, data):
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        server = self.server
+        try:
+            while True:
+                args = self.read_command()
+                if args is None:
+                    return
+                command = args[0].decode('utf-8').upper()
+                if command in ('AUTH', 'SELECT', 'PING'):
+                    self.write(b'+OK\r\n')
+                elif command == 'SUBSCRIBE':
+                    for channel in args[1:]:
+                        with server.lock:
+                            server.subscribers.setdefault(channel, set()).add(self)
+                        self.channels.add(channel)
+                        self.write(encode_reply([b'subscribe', channel, len(self.channels)]))
+                elif command == 'PUBLISH':
+                    channel, data = args[1], args[2]
+                    with server.lock:
+                        receivers = list(server.subscribers.get(channel, ()))
+                        server.published[channel] = server.published.get(channel, 0) + 1
+                    for receiver in receivers:
+                        receiver.write(encode_reply([b'message', channel, data]))
+                    self.write(encode_reply(len(receivers)))
+                elif command == 'HINCRBY':
+                    with server.lock:
+                        fields = server.hashes.setdefault(args[1], {})
+                        fields[args[2]] = fields.get(args[2], 0) + int(args[3])
+                        self.write(encode_reply(fields[args[2]]))
+                elif command == 'HGET':
+                    with server.lock:
+                        value = server.hashes.get(args[1], {}).get(args[2])
+                    self.write(encode_reply(None if value is None else str(value)))
+                elif command == 'HDEL':
+                    with server.lock:
+                        removed = server.hashes.get(args[1], {}).pop(args[2], None)
+                    self.write(encode_reply(0 if removed is None else 1))
+                else:
+                    self.write(b'-ERR unknown command\r\n')
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with server.lock:
+                for channel in self.channels:
+                    server.subscribers[channel].discard(self)
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """Redis stand-in implementing the commands RespBackend uses"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RespHandler)
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.published = {}
+        self.hashes = {}
+
+    def subscriber_count(self, channel):
+        with self.lock:
+            return len(self.subscribers.get(channel.encode('utf-8'), ()))
+
+    def publish_count(self, channel):
+        with self.lock:
+            return self.published.get(channel.encode('utf-8'), 0)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout=5):
+    """Poll until condition() is true; return whether it became true"""
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+STAND_IN = RespStandIn()
+threading.Thread(target=STAND_IN.serve_forever, daemon=True).start()
+BUS_URL = f'redis://127.0.0.1:{STAND_IN.server_address[1]}/0'
+APP_PORT = free_port()
+APP_URL = f'http://127.0.0.1:{APP_PORT}'
+
+DB_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DB_DIR, 'bus.db')
+os.environ['MESSAGE_BUS_URL'] = BUS_URL
+os.environ['SOCKETIO_ASYNC_MODE'] = 'threading'
+os.environ['SOCKET_RATE_LIMIT_ENABLED'] = 'false'
+
+import msgpack  # noqa: E402
+import socketio as socketio_client  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+from app import create_app, db, limiter, socketio  # noqa: E402
+from app.bus import BusClientManager, RespBackend  # noqa: E402
+from app.models.user import User  # noqa: E402
+
+app = create_app('development')
+limiter.enabled = False
+client = app.test_client()
+
+
+def check(ok, description):
+    """Print the outcome of one check and return it"""
+    print(f"   {'✓' if ok else '✗'} {description}")
+    return ok
+
+
+def test_pubsub():
+    """Messages published by one backend reach a subscriber on another"""
+    print("\n✅ Test 1: Publish/subscribe across backends\n")
+    publisher, subscriber = RespBackend(BUS_URL), RespBackend(BUS_URL)
+    received = []
+
+    def listen():
+        for data in subscriber.subscribe('test:pubsub'):
+            received.append(data)
+
+    threading.Thread(target=listen, daemon=True).start()
+    ok = check(wait_for(lambda: STAND_IN.subscriber_count('test:pubsub') == 1), "second backend subscribed")
+    payload = b'\x00binary\r\npayload\xff'
+    receivers = publisher.publish('test:pubsub', payload)
+    publisher.publish('test:pubsub', 'text')
+    ok &= check(receivers == 1, f"publish reports 1 receiver (got {receivers})")
+    ok &= check(wait_for(lambda: len(received) == 2) and received == [payload, b'text'],
+                "subscriber got both messages intact and in order")
+    ok &= check(publisher.publish('test:nobody', 'lost') == 0, "publish on a channel nobody follows reports 0")
+    publisher.close()
+    return ok
+
+
+def test_presence():
+    """Socket counts are shared between backends"""
+    print("\n✅ Test 2: Shared presence counts\n")
+    first, second = RespBackend(BUS_URL), RespBackend(BUS_URL)
+    first.presence_incr(42)
+    second.presence_incr(42)
+    ok = check(first.presence_count(42) == 2, "both backends see 2 sockets")
+    first.presence_decr(42)
+    ok &= check(second.presence_count(42) == 1, "one socket left after a disconnect")
+    ok &= check(second.presence_decr(42) == 0 and first.presence_count(42) == 0,
+                "count is gone after the last disconnect")
+    first.close()
+    second.close()
+    return ok
+
+
+def start_server():
+    """Serve the app on APP_PORT in a background thread"""
+    threading.Thread(target=socketio.run, args=(app,), daemon=True,
+                     kwargs={'host': '127.0.0.1', 'port': APP_PORT, 'debug': False,
+                             'use_reloader': False, 'allow_unsafe_werkzeug': True}).start()
+    return wait_for(lambda: socket.socket().connect_ex(('127.0.0.1', APP_PORT)) == 0)
+
+
+def create_users():
+    """Create alice and bob; return {name: (user id, auth headers, token)}"""
+    users = {}
+    with app.app_context():
+        for name in ('alice', 'bob'):
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_password('Password123')
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id))
+            users[name] = (user.id, {'Authorization': f'Bearer {token}'}, token)
+    return users
+
+
+def connect(token, **auth):
+    """Connect a socket; return it with the receive_room_message payloads it gets"""
+    received = []
+    sio = socketio_client.Client(reconnection=False)
+    sio.on('receive_room_message', lambda data: received.append(data))
+    sio.connect(APP_URL, auth=dict(auth, token=token))
+    return sio, received
+
+
+def test_room_emit(users):
+    """Room messages reach every kind of socket through the bus"""
+    print("\n✅ Test 3: Room emits through the bus\n")
+    socketio_channel = f"{app.config['MESSAGE_BUS_CHANNEL']}:socketio"
+    alice_id, alice_headers, alice_token = users['alice']
+    bob_id, _, bob_token = users['bob']
+    room_id = client.post('/api/rooms', json={'name': 'Bus Room'},
+                          headers=alice_headers).json['data']['room']['id']
+    client.post(f'/api/rooms/{room_id}/members', json={'userId': bob_id}, headers=alice_headers)
+
+    alice, _ = connect(alice_token)
+    bob_json, json_received = connect(bob_token)
+    bob_compact, compact_received = connect(bob_token, protocol='compact')
+    bob_users, users_received = connect(bob_token, include='users')
+    sockets = (alice, bob_json, bob_compact, bob_users)
+
+    try:
+        published = STAND_IN.publish_count(socketio_channel)
+        alice.emit('send_room_message', {'roomId': room_id, 'content': 'over the bus'})
+        ok = check(wait_for(lambda: json_received and compact_received and users_received),
+                   "all three of bob's sockets got the room message")
+        ok &= check(STAND_IN.publish_count(socketio_channel) > published,
+                    "the room emit went through the stand-in server")
+        if not ok:
+            return False
+        ok &= check(json_received[0]['message']['content'] == 'over the bus' and 'users' not in json_received[0],
+                    "JSON socket got the plain payload")
+        compact = msgpack.unpackb(compact_received[0]) if isinstance(compact_received[0], bytes) else None
+        ok &= check(compact is not None and compact.get('c') == 'over the bus',
+                    "compact socket got the MessagePack form")
+        usernames = sorted(profile['username'] for profile in users_received[0].get('users', []))
+        ok &= check(usernames == ['alice'], f"include=users socket got the users table (got {usernames})")
+
+        # Another server process emitting to the room, with its own connection to the bus
+        other_process = BusClientManager(RespBackend(BUS_URL), channel=socketio_channel, write_only=True)
+        message = dict(json_received[0]['message'], id=json_received[0]['message']['id'] + 1,
+                       content='from another process')
+        other_process.emit('receive_room_message', {'success': True, 'message': message},
+                           namespace='/', room=f'room_{room_id}')
+        ok &= check(wait_for(lambda: len(json_received) == 2 and len(users_received) == 2),
+                    "emit published by another process reached the room")
+        ok &= check(json_received[-1]['message']['content'] == 'from another process',
+                    "relayed payload arrived intact")
+        return ok
+    finally:
+        for sio in sockets:
+            sio.disconnect()
+
+
+def main():
+    """Main test runner"""
+    print("=" * 60)
+    print("  YChat20 - Message Bus Test Suite")
+    print("=" * 60)
+
+    results = [test_pubsub(), test_presence()]
+    if not start_server():
+        print("\n❌ Could not start the app server.")
+        sys.exit(1)
+    results.append(test_room_emit(create_users()))
+
+    if not all(results):
+        print("\n❌ Message bus tests failed.")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("  ✅ All message bus tests passed!")
+    print("=" * 60 + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -220,6 +220,159 @@ def test_authorization(token1, token2, user1_id, user2_id):
         return False
 
 
+def test_multi_device_delivery(token1, user1_id, token2, user2_id):
+    """Test delivery to every socket a user has open"""
+    print("\n✅ Test 5: Multi-Device Delivery\n")
+    
+    received = {'bob_phone': [], 'bob_laptop': [], 'alice_laptop': []}
+    clients = {
+        'alice_phone': socketio.Client(reconnection=False),
+        'alice_laptop': socketio.Client(reconnection=False),
+        'bob_phone': socketio.Client(reconnection=False),
+        'bob_laptop': socketio.Client(reconnection=False)
+    }
+    
+    for name in received:
+        clients[name].on('receive_message', lambda data, name=name: received[name].append(data))
+    
+    try:
+        for name, sio in clients.items():
+            sio.connect(BASE_URL, auth={'token': token1 if name.startswith('alice') else token2})
+        
+        time.sleep(1)  # Wait for connections
+        
+        clients['alice_phone'].emit('send_message', {
+            'receiverId': user2_id,
+            'content': 'Sent from my phone'
+        })
+        
+        time.sleep(1)  # Wait for message delivery
+        
+        for sio in clients.values():
+            sio.disconnect()
+        
+        for name, messages in received.items():
+            if [m['message']['content'] for m in messages] != ['Sent from my phone']:
+                print(f"   ✗ {name} did not receive the message exactly once: {messages}")
+                return False
+            print(f"   ✓ {name} received the message")
+        
+        return True
+        
+    except Exception as e:
+        print(f"   ✗ Multi-device test failed: {e}")
+        return False
+
+
+def test_batch_send(token1, user1_id, token2, user2_id):
+    """Test sending several messages in one send_messages_batch event"""
+    print("\n✅ Test 6: Batched Send\n")
+    
+    acks = []
+    received = []
+    sio1 = socketio.Client(reconnection=False)
+    sio2 = socketio.Client(reconnection=False)
+    sio1.on('messages_batch_sent', lambda data: acks.append(data))
+    sio2.on('receive_message', lambda data: received.append(data))
+    
+    try:
+        sio1.connect(BASE_URL, auth={'token': token1})
+        sio2.connect(BASE_URL, auth={'token': token2})
+        
+        time.sleep(1)  # Wait for connections
+        
+        sio1.emit('send_messages_batch', {
+            'messages': [
+                {'receiverId': user2_id, 'content': 'Batch message 1'},
+                {'receiverId': user2_id, 'content': 'Batch message 2'},
+                {'receiverId': user2_id, 'content': ''}
+            ]
+        })
+        
+        time.sleep(1)  # Wait for message delivery
+        
+        sio1.disconnect()
+        sio2.disconnect()
+        
+        if len(acks) != 1:
+            print(f"   ✗ Expected one messages_batch_sent ack, got {len(acks)}")
+            return False
+        ack = acks[0]
+        if (ack['sent'], ack['failed']) != (2, 1) or ack['results'][2]['success']:
+            print(f"   ✗ Unexpected batch result: {ack}")
+            return False
+        print("   ✓ One ack: 2 messages stored, the empty one rejected")
+        
+        contents = [m['message']['content'] for m in received]
+        if contents != ['Batch message 1', 'Batch message 2']:
+            print(f"   ✗ Receiver got {contents}")
+            return False
+        print("   ✓ Receiver got both messages in order")
+        
+        return True
+        
+    except Exception as e:
+        print(f"   ✗ Batched send test failed: {e}")
+        return False
+
+
+def test_reconnect_catch_up(token1, user1_id, token2, user2_id):
+    """Test that a reconnecting client gets the messages it missed"""
+    print("\n✅ Test 7: Reconnect Catch-Up\n")
+    
+    connected = []
+    catch_ups = []
+    sent = []
+    sio1 = socketio.Client(reconnection=False)
+    sio1.on('message_sent', lambda data: sent.append(data['message']))
+    sio2 = socketio.Client(reconnection=False)
+    sio2.on('connected', lambda data: connected.append(data))
+    sio2.on('catch_up', lambda data: catch_ups.append(data))
+    
+    try:
+        # Bob remembers the newest message id, then goes offline
+        sio2.connect(BASE_URL, auth={'token': token2})
+        time.sleep(1)
+        last_seen_id = connected[-1]['lastMessageId']
+        sio2.disconnect()
+        
+        sio1.connect(BASE_URL, auth={'token': token1})
+        time.sleep(1)
+        for count, content in enumerate(('Missed message 1', 'Missed message 2'), start=1):
+            sio1.emit('send_message', {'receiverId': user2_id, 'content': content})
+            # Wait for the confirmation so the messages are stored in order
+            deadline = time.time() + 5
+            while len(sent) < count and time.time() < deadline:
+                time.sleep(0.1)
+        sio1.disconnect()
+        if len(sent) != 2:
+            print(f"   ✗ Expected 2 send confirmations, got {len(sent)}")
+            return False
+        
+        # Bob reconnects with the id he had seen
+        sio2 = socketio.Client(reconnection=False)
+        sio2.on('catch_up', lambda data: catch_ups.append(data))
+        sio2.connect(BASE_URL, auth={'token': token2, 'lastSeenId': last_seen_id})
+        time.sleep(1)
+        sio2.disconnect()
+        
+        if len(catch_ups) != 1:
+            print(f"   ✗ Expected one catch_up event on reconnect, got {len(catch_ups)}")
+            return False
+        missed = [(m['id'], m['content']) for m in catch_ups[0]['messages']]
+        expected = [(m['id'], m['content']) for m in sent]
+        if missed != expected:
+            print(f"   ✗ catch_up held {missed}, expected {expected}")
+            return False
+        print(f"   ✓ catch_up pushed the {len(missed)} missed messages after message {last_seen_id}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"   ✗ Catch-up test failed: {e}")
+        return False
+
+
 def main():
     """Main test runner"""
     print("=" * 60)
@@ -265,6 +418,27 @@ def main():
         print("\n❌ Authorization tests failed.")
         sys.exit(1)
     
+    # Test multi-device delivery
+    multi_device_success = test_multi_device_delivery(token1, user1_id, token2, user2_id)
+    
+    if not multi_device_success:
+        print("\n❌ Multi-device tests failed.")
+        sys.exit(1)
+    
+    # Test batched send
+    batch_success = test_batch_send(token1, user1_id, token2, user2_id)
+    
+    if not batch_success:
+        print("\n❌ Batched send tests failed.")
+        sys.exit(1)
+    
+    # Test reconnect catch-up
+    catch_up_success = test_reconnect_catch_up(token1, user1_id, token2, user2_id)
+    
+    if not catch_up_success:
+        print("\n❌ Catch-up tests failed.")
+        sys.exit(1)
+    
     print("\n" + "=" * 60)
     print("  ✅ All tests passed successfully!")
     print("=" * 60)
@@ -275,6 +449,9 @@ def main():
     print("   ✓ Message persistence works")
     print("   ✓ Chat history retrieval works")
     print("   ✓ Authorization checks work")
+    print("   ✓ Delivery to every device of a user works")
+    print("   ✓ Batched sends work")
+    print("   ✓ Missed messages are pushed on reconnect")
     print("\n✅ Real-time messaging implementation is complete!\n")
 
 
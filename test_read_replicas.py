@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test script for read replica routing
+
+Runs in-process with two SQLite files (no server needed): the primary, and a
+replica that is a copy of the primary taken before the latest writes, like a
+replica lagging behind. Checks that read-only endpoints read from the
+replica, that writes go to the primary, and that a user who just wrote reads
+from the primary until REPLICA_STICKY_SECONDS have passed.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+STICKY_SECONDS = 1
+DB_DIR = tempfile.mkdtemp()
+PRIMARY = os.path.join(DB_DIR, 'primary.db')
+REPLICA = os.path.join(DB_DIR, 'replica.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + PRIMARY
+os.environ['DATABASE_READ_URLS'] = 'sqlite:///' + REPLICA
+os.environ['REPLICA_STICKY_SECONDS'] = str(STICKY_SECONDS)
+# Served from the primary by design; turned off so history reads hit a database
+os.environ['HISTORY_CACHE_ENABLED'] = 'false'
+os.environ['SOCKET_RATE_LIMIT_ENABLED'] = 'false'
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from app import create_app, db, limiter, socketio  # noqa: E402
+from app.models.user import User  # noqa: E402
+
+app = create_app('development')
+limiter.enabled = False
+client = app.test_client()
+
+
+def check(ok, description):
+    """Print the outcome of one check and return it"""
+    print(f"   {'✓' if ok else '✗'} {description}")
+    return ok
+
+
+def message_count(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def create_users():
+    """Create alice, bob and carol; return {name: (user id, auth headers, token)}"""
+    users = {}
+    with app.app_context():
+        for name in ('alice', 'bob', 'carol'):
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_password('Password123')
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id))
+            users[name] = (user.id, {'Authorization': f'Bearer {token}'}, token)
+    return users
+
+
+def history(users, reader, peer):
+    """Contents of the reader's chat history with peer"""
+    response = client.get(f'/api/messages/history/{users[peer][0]}', headers=users[reader][1])
+    return [message['content'] for message in response.json['data']['messages']]
+
+
+def room_members(users, reader, room_id):
+    """Usernames of a room's members, as the reader sees them"""
+    response = client.get(f'/api/rooms/{room_id}', headers=users[reader][1])
+    return sorted(member['username'] for member in response.json['data']['members'])
+
+
+def setup_replica(users):
+    """Write some history, copy the primary to the replica, then write more to the primary"""
+    alice_socket = socketio.test_client(app, auth={'token': users['alice'][2]})
+    alice_socket.emit('send_message', {'receiverId': users['bob'][0], 'content': 'replicated'})
+    room_id = client.post('/api/rooms', json={'name': 'Replicated Room'},
+                          headers=users['alice'][1]).json['data']['room']['id']
+    client.post(f'/api/rooms/{room_id}/members', json={'userId': users['carol'][0]}, headers=users['alice'][1])
+    # Let alice's writes stop counting before the snapshot
+    time.sleep(STICKY_SECONDS + 0.2)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    shutil.copy(PRIMARY, REPLICA)
+
+    # Not replicated yet: bob writes over his socket, alice over REST
+    bob_socket = socketio.test_client(app, auth={'token': users['bob'][2]})
+    bob_socket.emit('send_message', {'receiverId': users['alice'][0], 'content': 'primary only'})
+    client.post(f'/api/rooms/{room_id}/members', json={'userId': users['bob'][0]}, headers=users['alice'][1])
+    return room_id
+
+
+def test_routing(users, room_id):
+    """Read-only endpoints read the replica, except for users who just wrote"""
+    print("\n✅ Test 1: Replica and primary reads\n")
+    ok = check(room_members(users, 'carol', room_id) == ['alice', 'carol'],
+               "carol's room details come from the replica, without the newer member")
+    rooms = client.get('/api/rooms', headers=users['carol'][1]).json['data']['rooms']
+    ok &= check([room['id'] for room in rooms] == [room_id], "carol's room list comes from the replica")
+
+    ok &= check(history(users, 'bob', 'alice') == ['replicated', 'primary only'],
+                "bob wrote over his socket, so his history comes from the primary")
+    ok &= check(room_members(users, 'alice', room_id) == ['alice', 'bob', 'carol'],
+                "alice wrote over REST, so her room details come from the primary")
+    return ok
+
+
+def test_stickiness(users, room_id):
+    """Writers go back to the replica once the sticky window has passed"""
+    print("\n✅ Test 2: Read-your-writes stickiness\n")
+    time.sleep(STICKY_SECONDS + 0.2)
+    ok = check(history(users, 'bob', 'alice') == ['replicated'],
+               "after the sticky window bob reads the lagging replica")
+    ok &= check(room_members(users, 'alice', room_id) == ['alice', 'carol'],
+                "after the sticky window alice reads the lagging replica")
+    conversations = client.get('/api/conversations', headers=users['alice'][1]).json['data']['conversations']
+    ok &= check(conversations[0]['lastMessage']['content'] == 'primary only',
+                "endpoints not marked read-only still read the primary")
+
+    alice_headers = users['alice'][1]
+    response = client.post('/api/rooms', json={'name': 'Fresh Room'}, headers=alice_headers)
+    ok &= check(response.status_code == 201, "alice creates a room")
+    names = [room['name'] for room in client.get('/api/rooms', headers=alice_headers).json['data']['rooms']]
+    ok &= check('Fresh Room' in names, "alice sees her new room right away")
+    ok &= check(history(users, 'alice', 'bob') == ['replicated', 'primary only'],
+                "her other reads come from the primary too while she is sticky")
+
+    time.sleep(STICKY_SECONDS + 0.2)
+    names = [room['name'] for room in client.get('/api/rooms', headers=alice_headers).json['data']['rooms']]
+    ok &= check('Fresh Room' not in names, "once the window has passed again she reads the replica")
+    return ok
+
+
+def test_replica_untouched():
+    """Nothing is ever written to the replica"""
+    print("\n✅ Test 3: Writes stay on the primary\n")
+    primary, replica = message_count(PRIMARY), message_count(REPLICA)
+    return check((primary, replica) == (2, 1), f"primary holds 2 messages, the replica still 1 (got {primary}, "
+                                               f"{replica})")
+
+
+def main():
+    """Main test runner"""
+    print("=" * 60)
+    print("  YChat20 - Read Replica Routing Test Suite")
+    print("=" * 60)
+
+    users = create_users()
+    room_id = setup_replica(users)
+    results = [test_routing(users, room_id), test_stickiness(users, room_id), test_replica_untouched()]
+
+    if not all(results):
+        print("\n❌ Read replica tests failed.")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("  ✅ All read replica tests passed!")
+    print("=" * 60 + "\n")
+
+
+if __name__ == '__main__':
+    main()
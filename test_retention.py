@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Test script for the retention job
+
+Runs in-process against a temporary SQLite database (no server needed):
+sends messages through the socket handlers, then runs the retention job as
+if time had passed and checks what it scrubbed and removed, the inbox
+summaries, unread counts, the change feed and the retention stats.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+DB_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DB_DIR, 'retention.db')
+os.environ['RETENTION_ENABLED'] = 'false'
+os.environ['SOCKET_RATE_LIMIT_ENABLED'] = 'false'
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from app import create_app, db, limiter, socketio  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.retention import retention  # noqa: E402
+
+app = create_app('development')
+limiter.enabled = False
+client = app.test_client()
+
+
+def check(ok, description):
+    """Print the outcome of one check and return it"""
+    print(f"   {'✓' if ok else '✗'} {description}")
+    return ok
+
+
+def create_users():
+    """Create alice, bob and carol; return {name: (user id, auth headers, socket client)}"""
+    users = {}
+    with app.app_context():
+        for name in ('alice', 'bob', 'carol'):
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_password('Password123')
+            db.session.add(user)
+            db.session.commit()
+            token = create_access_token(identity=str(user.id))
+            users[name] = (user.id, {'Authorization': f'Bearer {token}'},
+                           socketio.test_client(app, auth={'token': token}))
+    return users
+
+
+def fill_history(users):
+    """
+    Direct and room messages, with the newest message of all sent last
+    Returns the room id and {content: message id}.
+    """
+    alice_id, alice_headers, alice_socket = users['alice']
+    bob_id, _, bob_socket = users['bob']
+    carol_id = users['carol'][0]
+
+    room_id = client.post('/api/rooms', json={'name': 'Retention Room'},
+                          headers=alice_headers).json['data']['room']['id']
+    client.post(f'/api/rooms/{room_id}/members', json={'userId': carol_id}, headers=alice_headers)
+
+    for content in ('to carol 1', 'to carol 2'):
+        alice_socket.emit('send_message', {'receiverId': carol_id, 'content': content})
+    for content in ('room 1', 'room 2'):
+        alice_socket.emit('send_room_message', {'roomId': room_id, 'content': content})
+    for content in ('to bob 1', 'to bob 2', 'to bob 3'):
+        alice_socket.emit('send_message', {'receiverId': bob_id, 'content': content})
+    bob_socket.emit('send_message', {'receiverId': alice_id, 'content': 'newest'})
+    with app.app_context():
+        ids = {message.content: message.id for message in Message.query.all()}
+    client.delete(f"/api/messages/{ids['to bob 1']}", headers=alice_headers)
+    return room_id, ids
+
+
+def inbox(headers):
+    """{peer username: conversation} of a user's inbox"""
+    conversations = client.get('/api/conversations', headers=headers).json['data']['conversations']
+    return {conversation['peer']['username']: conversation for conversation in conversations}
+
+
+def test_scrub(users, ids):
+    """Deleted messages are blanked once, and later runs resume after them"""
+    print("\n✅ Test 1: Scrub deleted messages\n")
+    alice_headers = users['alice'][1]
+    retention.direct_days = 0
+    retention.room_days = 0
+    retention.scrub_after = timedelta(hours=1)
+    retention.pause = 0
+    later = datetime.utcnow() + timedelta(hours=2)
+
+    with app.app_context():
+        first = retention.run_once(now=later)
+        scrubbed_through = retention._scrubbed_through
+        blanked = db.session.get(Message, ids['to bob 1']).content == ''
+    ok = check(first['scrubbed'] == 1, f"first run scrubbed 1 message (got {first['scrubbed']})")
+    ok &= check(blanked, "content of the deleted message is blank")
+
+    client.delete(f"/api/messages/{ids['to carol 1']}", headers=alice_headers)
+    with app.app_context():
+        second = retention.run_once(now=later)
+        resumed = retention._scrubbed_through > scrubbed_through
+        third = retention.run_once(now=later)
+    ok &= check(second['scrubbed'] == 1, f"second run scrubbed only the new deletion (got {second['scrubbed']})")
+    ok &= check(resumed, "scrub position advanced past the new deletion")
+    ok &= check(third['scrubbed'] == 0, f"third run had nothing left to scrub (got {third['scrubbed']})")
+
+    history = client.get(f"/api/messages/history/{users['bob'][0]}", headers=alice_headers).json['data']['messages']
+    ok &= check(len(history) == 4 and history[0]['isDeleted'], "history still lists the deleted message as deleted")
+    return ok
+
+
+def test_purge(users, room_id, ids):
+    """Expired direct and room messages are removed; the newest message is kept"""
+    print("\n✅ Test 2: Remove expired messages\n")
+    alice_id, alice_headers, _ = users['alice']
+    bob_id, bob_headers, _ = users['bob']
+    carol_headers = users['carol'][1]
+    newest_id = ids['newest']
+
+    response = client.put(f'/api/rooms/{room_id}/retention', json={'retentionDays': 1}, headers=alice_headers)
+    ok = check(response.status_code == 200, "room retention set to 1 day")
+    before = inbox(bob_headers)['alice']['unreadCount']
+    ok &= check(before == 2, f"bob has 2 unread messages from alice before the run (got {before})")
+
+    retention.direct_days = 1
+    with app.app_context():
+        report = retention.run_once(now=datetime.utcnow() + timedelta(days=30))
+        remaining = [message.id for message in Message.query.all()]
+    ok &= check(report['removedDirect'] == 5 and report['conversations'] == 2,
+                f"removed 5 direct messages from 2 conversations (got {report['removedDirect']} "
+                f"from {report['conversations']})")
+    ok &= check(report['removedRoom'] == 2 and report['rooms'] == 1,
+                f"removed 2 room messages from 1 room (got {report['removedRoom']} from {report['rooms']})")
+    ok &= check(remaining == [newest_id], "only the newest message is left")
+
+    bob_inbox = inbox(bob_headers)['alice']
+    alice_inbox = inbox(alice_headers)
+    carol_inbox = inbox(carol_headers)['alice']
+    ok &= check(bob_inbox['lastMessage']['id'] == newest_id, "bob's inbox still shows the newest message")
+    ok &= check(bob_inbox['unreadCount'] == 0, f"bob's removed unread messages are uncounted "
+                                               f"(got {bob_inbox['unreadCount']})")
+    ok &= check(alice_inbox['bob']['unreadCount'] == 1, "alice still has the kept message unread")
+    ok &= check(alice_inbox['carol']['lastMessage'] is None and carol_inbox['lastMessage'] is None,
+                "the emptied conversation has no last message")
+    ok &= check(carol_inbox['unreadCount'] == 0, "carol's removed unread messages are uncounted")
+
+    history = client.get(f'/api/messages/history/{alice_id}', headers=bob_headers).json['data']['messages']
+    ok &= check([message['id'] for message in history] == [newest_id], "bob's history holds only the newest message")
+
+    bob_sync = client.get('/api/sync?since=0', headers=bob_headers).json['data']
+    carol_sync = client.get('/api/sync?since=0', headers=carol_headers).json['data']
+    ok &= check([message['id'] for message in bob_sync['messages']] == [newest_id],
+                "bob's delta sync returns no removed message")
+    ok &= check([purge['userIds'] for purge in bob_sync['purges']] == [sorted([alice_id, bob_id])],
+                "bob's delta sync reports the purge of his conversation with alice")
+    ok &= check({purge['roomId'] for purge in carol_sync['purges']} == {None, room_id},
+                "carol's delta sync reports the conversation and room purges")
+
+    with app.app_context():
+        again = retention.run_once(now=datetime.utcnow() + timedelta(days=60))
+        kept = db.session.get(Message, newest_id) is not None
+    ok &= check(again['removedDirect'] == 0 and kept, "a later run never removes the newest message")
+    return ok
+
+
+def test_stats(users):
+    """GET /api/stats/retention reports the runs above"""
+    print("\n✅ Test 3: Retention stats\n")
+    response = client.get('/api/stats/retention', headers=users['alice'][1])
+    if not check(response.status_code == 200, "stats endpoint answers"):
+        return False
+    totals = response.json['stats']['totals']
+    return check(totals == {'runs': 5, 'scrubbed': 2, 'removed': 7}, f"totals match the runs (got {totals})")
+
+
+def main():
+    """Main test runner"""
+    print("=" * 60)
+    print("  YChat20 - Retention Job Test Suite")
+    print("=" * 60)
+
+    users = create_users()
+    room_id, ids = fill_history(users)
+    results = [test_scrub(users, ids), test_purge(users, room_id, ids), test_stats(users)]
+
+    if not all(results):
+        print("\n❌ Retention tests failed.")
+        sys.exit(1)
+    print("\n" + "=" * 60)
+    print("  ✅ All retention tests passed!")
+    print("=" * 60 + "\n")
+
+
+if __name__ == '__main__':
+    main()